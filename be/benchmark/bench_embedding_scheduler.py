@@ -0,0 +1,58 @@
+"""
+Mô phỏng thời gian embed một PDF lớn: gọi tuần tự từng lô (như embed_documents
+một lần) so với EmbeddingScheduler chạy song song. Độ trễ API được giả lập bằng sleep.
+
+Chạy từ thư mục be/:
+    python -m benchmark.bench_embedding_scheduler --chunks 900 --latency 0.3
+"""
+import argparse
+import time
+
+from src.rag.embedding_scheduler import EmbeddingScheduler, TokenBucket
+
+
+class SimulatedProvider:
+    """Nhà cung cấp giả lập: mỗi request mất `latency` giây, tối đa `max_batch` văn bản."""
+
+    def __init__(self, latency: float, max_batch: int, dim: int = 768):
+        self.latency = latency
+        self.max_batch = max_batch
+        self.dim = dim
+
+    def embed_documents(self, texts):
+        # Client thật chia nhỏ tuần tự khi vượt giới hạn mỗi request
+        for _ in range(0, len(texts), self.max_batch):
+            time.sleep(self.latency)
+        return [[0.0] * self.dim for _ in texts]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=900, help="~3 chunk mỗi trang với PDF 300 trang")
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    provider = SimulatedProvider(args.latency, args.batch_size)
+    texts = [f"chunk {i}" for i in range(args.chunks)]
+
+    start = time.perf_counter()
+    provider.embed_documents(texts)
+    baseline = time.perf_counter() - start
+    print(f"{'mode':>16} {'wall (s)':>9} {'speedup':>8}")
+    print(f"{'single call':>16} {baseline:>9.2f} {1.0:>8.2f}")
+
+    for concurrency in args.concurrency:
+        scheduler = EmbeddingScheduler(
+            provider, batch_size=args.batch_size, max_concurrency=concurrency,
+            limiter=TokenBucket(rate=1e6, capacity=1000),
+        )
+        start = time.perf_counter()
+        scheduler.embed_array(texts)
+        elapsed = time.perf_counter() - start
+        print(f"{'concurrency=' + str(concurrency):>16} {elapsed:>9.2f} {baseline / elapsed:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
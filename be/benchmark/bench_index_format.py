@@ -0,0 +1,82 @@
+"""
+So sánh kích thước payload và thời gian serialize/deserialize giữa
+pickle(InMemoryVectorStore) hiện tại và định dạng nhị phân mới.
+
+Chạy từ thư mục be/:
+    python -m benchmark.bench_index_format --chunks 1000 5000 --dim 768
+"""
+import argparse
+import pickle
+import random
+import string
+import time
+
+import numpy as np
+from langchain_core.embeddings import FakeEmbeddings
+from langchain_core.vectorstores import InMemoryVectorStore
+
+from src.rag.index_format import index_from_vectorstore, load_index, serialize_index
+
+
+def build_vectorstore(n_chunks: int, dim: int, chunk_chars: int = 1000) -> InMemoryVectorStore:
+    rng = np.random.default_rng(0)
+    words = ["".join(random.choices(string.ascii_lowercase, k=6)) for _ in range(2000)]
+    store = InMemoryVectorStore(embedding=FakeEmbeddings(size=dim))
+    for i in range(n_chunks):
+        text = " ".join(random.choices(words, k=chunk_chars // 7))[:chunk_chars]
+        store.store[str(i)] = {
+            "id": str(i),
+            # Giống embedding thật trả về từ API: list các float Python
+            "vector": rng.standard_normal(dim).tolist(),
+            "text": text,
+            "metadata": {},
+        }
+    return store
+
+
+def timeit(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, nargs="+", default=[100, 1000, 5000])
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--codecs", nargs="+", default=["none", "zstd"])
+    args = parser.parse_args()
+
+    print(f"{'chunks':>7} {'format':>12} {'size (KB)':>11} {'dump (ms)':>10} {'load (ms)':>10}")
+    for n in args.chunks:
+        store = build_vectorstore(n, args.dim)
+        pickled = pickle.dumps(store)
+        rows = [(
+            "pickle",
+            len(pickled),
+            timeit(lambda: pickle.dumps(store), args.repeat),
+            timeit(lambda: pickle.loads(pickled), args.repeat),
+        )]
+        index = index_from_vectorstore(store)
+        for codec in args.codecs:
+            try:
+                payload = serialize_index(index, codec=codec)
+            except ValueError as e:
+                print(f"{n:>7} {codec:>12} bỏ qua: {e}")
+                continue
+            rows.append((
+                f"binary/{codec}",
+                len(payload),
+                timeit(lambda: serialize_index(index, codec=codec), args.repeat),
+                timeit(lambda: load_index(payload), args.repeat),
+            ))
+        for name, size, dump_s, load_s in rows:
+            print(f"{n:>7} {name:>12} {size / 1024:>11.1f} {dump_s * 1000:>10.2f} {load_s * 1000:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
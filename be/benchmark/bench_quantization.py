@@ -0,0 +1,54 @@
+"""
+So sánh dung lượng (ma trận trong bộ nhớ và payload Redis), recall@k và độ trễ truy vấn
+của embedding float32 với float16 / int8, trên embedding tổng hợp - không cần gọi API.
+
+Chạy từ thư mục be/:
+    python -m benchmark.bench_quantization --chunks 20000 --dim 768 --k 4
+"""
+import argparse
+import time
+
+from benchmark.bench_ann import synthetic_embeddings
+from src.rag.index_format import VectorIndex, deserialize_index, serialize_index
+from src.rag.quantize import quantize_index
+from src.rag.search import VectorSearchEngine
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--topics", type=int, default=200)
+    parser.add_argument("--noise", type=float, default=3.0, help="độ phân tán quanh chủ đề")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=4)
+    args = parser.parse_args()
+
+    matrix = synthetic_embeddings(args.chunks + args.queries, args.dim, args.topics, args.noise)
+    matrix, queries = matrix[:args.chunks], matrix[args.chunks:]
+    texts = [""] * args.chunks
+
+    baseline = VectorSearchEngine(VectorIndex(matrix, texts), ann_min_chunks=args.chunks + 1)
+    truth = [{i for i, _ in baseline.search_by_vector(q, k=args.k)} for q in queries]
+
+    variants = [("float32", "none"), ("float16", "float16"), ("int8", "int8")]
+    print(f"{'storage':>8} {'matrix (MB)':>12} {'payload (MB)':>13} {'ratio':>6} "
+          f"{'recall@' + str(args.k):>10} {'latency (ms)':>13}")
+    full_payload = None
+    for name, method in variants:
+        index = quantize_index(VectorIndex(matrix.copy(), texts), method)
+        payload = serialize_index(index, codec="none")
+        full_payload = full_payload or len(payload)
+        engine = VectorSearchEngine(deserialize_index(payload), ann_min_chunks=args.chunks + 1)
+
+        hits = 0
+        start = time.perf_counter()
+        for q, expected in zip(queries, truth):
+            hits += len(expected & {i for i, _ in engine.search_by_vector(q, k=args.k)})
+        latency = (time.perf_counter() - start) / len(queries) * 1000
+        print(f"{name:>8} {engine.scorer.nbytes() / 2**20:>12.2f} {len(payload) / 2**20:>13.2f} "
+              f"{full_payload / len(payload):>6.2f} {hits / (len(queries) * args.k):>10.3f} {latency:>13.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""
+Bộ micro-benchmark offline cho các đường xử lý chính của tải lên và truy xuất.
+
+Không cần mạng hay Redis thật: PDF được sinh bằng fpdf, embedding là DeterministicFakeEmbedding
+(không sleep, xác định), LLM là mô hình giả lập của preprocess (USE_MOCK_LLM) và Redis là fakeredis.
+Đo các bước: PDFLoader, SplittingDocuments, StoringDocuments, dựng chỉ mục (ANN + BM25),
+serialize, ghi/đọc Redis, deserialize, tìm kiếm và trả lời (tìm kiếm + LLM giả lập).
+
+Kết quả được lưu thành JSON (baseline) để so sánh giữa các commit.
+
+Chạy từ thư mục be/:
+    python -m benchmark.bench_suite --pages 1 10 100 1000 --output benchmark/baselines/main.json
+    python -m benchmark.bench_suite --pages 1 10 100 --compare benchmark/baselines/main.json
+"""
+import os
+
+# Phải đặt trước khi import src.rag.preprocess (không khởi tạo client Gemini)
+os.environ.setdefault("USE_MOCK_EMBEDDINGS", "1")
+os.environ.setdefault("USE_MOCK_LLM", "1")
+
+import argparse
+import asyncio
+import json
+import logging
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+import fakeredis
+import numpy as np
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from benchmark.documents import make_pdf
+from src.rag.collection import append_document
+from src.rag.index_format import load_index, serialize_index
+from src.rag.lexical import build_lexical_index
+from src.rag.preprocess import GenerateAnswer, PDFLoader, SplittingDocuments, StoringDocuments
+from src.rag.search import VectorSearchEngine, normalize_rows
+
+STAGES = (
+    "pdf_load", "split", "store", "index_build", "serialize",
+    "redis_write", "redis_read", "deserialize", "search", "answer",
+)
+
+
+def measure(fn, repeat: int):
+    """Chạy `fn` `repeat` lần, trả về (thống kê thời gian, kết quả của lần cuối)."""
+    times, result = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return {"best_s": min(times), "median_s": statistics.median(times), "runs": len(times)}, result
+
+
+def run_case(n_pages: int, dim: int, repeat: int, queries: int) -> dict:
+    content, words = make_pdf(n_pages)
+    embedder = DeterministicFakeEmbedding(size=dim)
+    redis_client = fakeredis.FakeRedis()
+    # PDF lớn chậm hơn nhiều lần: giảm số lần lặp để cả bộ chạy trong thời gian hợp lý
+    repeat = max(1, repeat if n_pages < 500 else repeat // 2)
+    results = {}
+
+    results["pdf_load"], docs = measure(lambda: PDFLoader(content), repeat)
+    results["split"], splits = measure(lambda: SplittingDocuments(docs), repeat)
+    results["store"], index = measure(lambda: StoringDocuments(splits, embedder=embedder, pages=docs), repeat)
+
+    def build():
+        built = StoringDocuments(splits, embedder=embedder, pages=docs)
+        built.embeddings = normalize_rows(built.embeddings)
+        built = append_document(None, built)
+        build_lexical_index(built)
+        return built
+
+    results["index_build"], index = measure(build, 1)
+    results["serialize"], payload = measure(lambda: serialize_index(index), repeat)
+    results["redis_write"], _ = measure(lambda: redis_client.set("user:bench:vectorstore", payload), repeat)
+    results["redis_read"], fetched = measure(lambda: redis_client.get("user:bench:vectorstore"), repeat)
+    results["deserialize"], engine = measure(lambda: VectorSearchEngine(load_index(fetched)[0]), repeat)
+
+    rng = random.Random(1)
+    questions = [" ".join(rng.choices(words, k=6)) for _ in range(queries)]
+    vectors = [embedder.embed_query(q) for q in questions]
+
+    def search_all():
+        return [engine.similarity_search(q, v, "dense", k=4) for q, v in zip(questions, vectors)]
+
+    stats, hits = measure(search_all, repeat)
+    results["search"] = {key: value / queries if key != "runs" else value for key, value in stats.items()}
+
+    async def answer_all():
+        for q, found in zip(questions, hits):
+            await GenerateAnswer(q, [doc for doc, _ in found])
+
+    stats, _ = measure(lambda: asyncio.run(answer_all()), repeat)
+    results["answer"] = {key: value / queries if key != "runs" else value for key, value in stats.items()}
+
+    return {
+        "pages": n_pages,
+        "chunks": len(index),
+        "pdf_bytes": len(content),
+        "payload_bytes": len(payload),
+        "stages": results,
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> list:
+    """In tỉ lệ thời gian (hiện tại / baseline) theo từng bước; trả về các bước chậm hơn `threshold` lần."""
+    regressions = []
+    base_cases = {case["pages"]: case for case in baseline["cases"]}
+    print(f"\nSo với baseline {baseline['meta']['commit']} ({baseline['meta']['created_at']}):")
+    print(f"{'pages':>6} {'stage':>12} {'baseline (ms)':>14} {'now (ms)':>10} {'ratio':>7}")
+    for case in current["cases"]:
+        base = base_cases.get(case["pages"])
+        if base is None:
+            continue
+        for stage, stats in case["stages"].items():
+            old = base["stages"].get(stage)
+            if not old or old["best_s"] <= 0:
+                continue
+            ratio = stats["best_s"] / old["best_s"]
+            flag = " <-- chậm hơn" if ratio > threshold else ""
+            print(f"{case['pages']:>6} {stage:>12} {old['best_s'] * 1e3:>14.3f} {stats['best_s'] * 1e3:>10.3f} {ratio:>7.2f}{flag}")
+            if ratio > threshold:
+                regressions.append((case["pages"], stage, ratio))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, nargs="+", default=[1, 10, 100, 1000])
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--output", help="Ghi kết quả JSON vào file này (vd. benchmark/baselines/<commit>.json)")
+    parser.add_argument("--compare", help="File JSON baseline để so sánh")
+    parser.add_argument("--threshold", type=float, default=1.25, help="Tỉ lệ chậm hơn baseline bị coi là hồi quy")
+    args = parser.parse_args()
+
+    # Tắt log của pipeline để đầu ra chỉ còn kết quả đo
+    logging.disable(logging.WARNING)
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "args": vars(args),
+        },
+        "cases": [],
+    }
+    print(f"{'pages':>6} {'chunks':>7} " + " ".join(f"{stage:>11}" for stage in STAGES) + "   (best, ms)")
+    for n_pages in args.pages:
+        case = run_case(n_pages, args.dim, args.repeat, args.queries)
+        report["cases"].append(case)
+        print(
+            f"{n_pages:>6} {case['chunks']:>7} "
+            + " ".join(f"{case['stages'][stage]['best_s'] * 1e3:>11.3f}" for stage in STAGES)
+        )
+
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nĐã lưu kết quả vào {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(report, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
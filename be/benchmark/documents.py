@@ -0,0 +1,24 @@
+"""Sinh PDF văn bản ngẫu nhiên nhưng xác định (theo seed) cho benchmark và kiểm thử tải."""
+import random
+from typing import List, Tuple
+
+from fpdf import FPDF
+
+
+def make_vocabulary(seed: int = 0, size: int = 3000) -> List[str]:
+    rng = random.Random(seed)
+    return ["".join(rng.choices("abcdefghijklmnopqrstuvwxyz", k=rng.randint(3, 9))) for _ in range(size)]
+
+
+def make_pdf(n_pages: int, chars_per_page: int = 1800, seed: int = 0) -> Tuple[bytes, List[str]]:
+    """PDF `n_pages` trang văn bản ASCII ngẫu nhiên (xác định theo `seed`), kèm bộ từ vựng đã dùng."""
+    rng = random.Random(seed)
+    words = make_vocabulary(seed)
+    pdf = FPDF('P', 'mm', 'A4')
+    pdf.set_auto_page_break(False)
+    pdf.set_font('Arial', '', 8)
+    for i in range(n_pages):
+        pdf.add_page()
+        text = f"Page {i}. " + " ".join(rng.choices(words, k=chars_per_page // 6))
+        pdf.multi_cell(0, 3.5, text[:chars_per_page])
+    return pdf.output(dest='S').encode('latin-1'), words
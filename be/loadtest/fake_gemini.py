@@ -0,0 +1,201 @@
+"""
+Máy chủ giả lập tương thích Gemini API (embedding + chat) để kiểm thử tải không tốn quota.
+
+Hỗ trợ các endpoint mà google-genai (và do đó langchain-google-genai) gọi:
+- POST /v1beta/models/{model}:batchEmbedContents  (và :embedContent)
+- POST /v1beta/models/{model}:generateContent
+- POST /v1beta/models/{model}:streamGenerateContent?alt=sse
+
+Embedding là vector feature-hashing của các từ (xác định, câu hỏi gần tài liệu có điểm cao),
+câu trả lời được sinh từ câu hỏi. Độ trễ, tỉ lệ lỗi 500 và 429 (RESOURCE_EXHAUSTED) cấu hình được,
+kèm giới hạn số request mỗi phút giống quota thật.
+
+Chạy từ thư mục be/:
+    python -m loadtest.fake_gemini --port 8090 --embed-latency 0.15 --chat-latency 0.8 --rate-429 0.02
+rồi chạy API/worker với GEMINI_BASE_URL=http://localhost:8090 GOOGLE_API_KEY=fake.
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import threading
+import time
+import zlib
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional
+
+import numpy as np
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+_WORD = re.compile(r"\w+")
+
+
+@dataclass
+class FakeGeminiConfig:
+    dim: int = 768
+    # Độ trễ cơ bản (giây) của một request và phần tăng thêm theo số văn bản / số token trả lời
+    embed_latency: float = 0.15
+    embed_latency_per_item: float = 0.002
+    chat_latency: float = 0.8
+    chat_latency_per_token: float = 0.01
+    # Độ lệch chuẩn tương đối của độ trễ (phân phối log-normal)
+    jitter: float = 0.3
+    error_rate: float = 0.0
+    rate_429: float = 0.0
+    # Giới hạn request mỗi phút cho mỗi loại (0 = không giới hạn), vượt quá trả về 429
+    rpm_limit: int = 0
+    answer_tokens: int = 60
+    seed: Optional[int] = None
+
+
+class _MinuteWindow:
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._lock = threading.Lock()
+        self._window = 0
+        self._count = 0
+
+    def allow(self) -> bool:
+        if self.limit <= 0:
+            return True
+        window = int(time.time() // 60)
+        with self._lock:
+            if window != self._window:
+                self._window, self._count = window, 0
+            self._count += 1
+            return self._count <= self.limit
+
+
+def hash_embedding(text: str, dim: int) -> List[float]:
+    """Vector feature-hashing (đã chuẩn hóa) của các từ trong `text`."""
+    vector = np.zeros(dim, dtype=np.float32)
+    for word in _WORD.findall(text.lower()):
+        h = zlib.crc32(word.encode("utf-8"))
+        vector[h % dim] += 1.0 if (h >> 31) & 1 else -1.0
+    norm = np.linalg.norm(vector)
+    if norm > 0:
+        vector /= norm
+    return vector.tolist()
+
+
+def _error(status: int, code: str, message: str) -> JSONResponse:
+    return JSONResponse(status_code=status, content={"error": {"code": status, "message": message, "status": code}})
+
+
+def _text_of(content: Dict) -> str:
+    return " ".join(part.get("text", "") for part in (content or {}).get("parts", []))
+
+
+def create_app(config: FakeGeminiConfig) -> FastAPI:
+    app = FastAPI(title="fake-gemini")
+    rng = random.Random(config.seed)
+    windows = {"embed": _MinuteWindow(config.rpm_limit), "chat": _MinuteWindow(config.rpm_limit)}
+    stats = {"embed_requests": 0, "embedded_texts": 0, "chat_requests": 0, "errors_500": 0, "errors_429": 0}
+
+    async def delay(base: float, extra: float) -> None:
+        mean = base + extra
+        if mean <= 0:
+            return
+        await asyncio.sleep(mean * rng.lognormvariate(0, config.jitter) if config.jitter > 0 else mean)
+
+    def inject(kind: str) -> Optional[JSONResponse]:
+        if not windows[kind].allow() or rng.random() < config.rate_429:
+            stats["errors_429"] += 1
+            return _error(429, "RESOURCE_EXHAUSTED", "Resource has been exhausted (e.g. check quota).")
+        if rng.random() < config.error_rate:
+            stats["errors_500"] += 1
+            return _error(500, "INTERNAL", "An internal error has occurred.")
+        return None
+
+    def answer_text(prompt: str) -> List[str]:
+        # Câu trả lời giả lập: nhắc lại vài từ của câu hỏi (phần cuối prompt), đủ `answer_tokens` từ
+        words = _WORD.findall(prompt)[-12:] or ["tài", "liệu"]
+        return [words[i % len(words)] for i in range(config.answer_tokens)]
+
+    def candidate(text: str, finish: Optional[str] = "STOP") -> Dict:
+        body = {"content": {"parts": [{"text": text}], "role": "model"}, "index": 0}
+        if finish:
+            body["finishReason"] = finish
+        return body
+
+    @app.post("/{version}/models/{target}")
+    async def models(version: str, target: str, request: Request):
+        model, _, action = target.partition(":")
+        body = await request.json()
+
+        if action in ("batchEmbedContents", "embedContent"):
+            requests = body.get("requests") or [body]
+            stats["embed_requests"] += 1
+            stats["embedded_texts"] += len(requests)
+            await delay(config.embed_latency, config.embed_latency_per_item * len(requests))
+            error = inject("embed")
+            if error is not None:
+                return error
+            embeddings = [{"values": hash_embedding(_text_of(r.get("content")), config.dim)} for r in requests]
+            if action == "embedContent":
+                return {"embedding": embeddings[0]}
+            return {"embeddings": embeddings}
+
+        if action in ("generateContent", "streamGenerateContent"):
+            stats["chat_requests"] += 1
+            prompt = " ".join(_text_of(c) for c in body.get("contents", []))
+            tokens = answer_text(prompt)
+            usage = {"promptTokenCount": len(_WORD.findall(prompt)), "candidatesTokenCount": len(tokens)}
+            usage["totalTokenCount"] = usage["promptTokenCount"] + usage["candidatesTokenCount"]
+            if action == "generateContent":
+                await delay(config.chat_latency, config.chat_latency_per_token * len(tokens))
+                error = inject("chat")
+                if error is not None:
+                    return error
+                return {"candidates": [candidate(" ".join(tokens))], "usageMetadata": usage, "modelVersion": model}
+
+            # Streaming: độ trễ tới token đầu tiên rồi từng đoạn vài từ
+            await delay(config.chat_latency, 0)
+            error = inject("chat")
+            if error is not None:
+                return error
+
+            async def events():
+                step = 5
+                for start in range(0, len(tokens), step):
+                    await delay(0, config.chat_latency_per_token * step)
+                    last = start + step >= len(tokens)
+                    chunk = {
+                        "candidates": [candidate(" ".join(tokens[start:start + step]) + " ", "STOP" if last else None)],
+                        "modelVersion": model,
+                    }
+                    if last:
+                        chunk["usageMetadata"] = usage
+                    yield f"data: {json.dumps(chunk)}\r\n\r\n"
+
+            return StreamingResponse(events(), media_type="text/event-stream")
+
+        return _error(404, "NOT_FOUND", f"Unsupported method {action!r}")
+
+    @app.get("/stats")
+    async def get_stats():
+        return {"config": asdict(config), **stats}
+
+    return app
+
+
+def main():
+    import uvicorn
+
+    defaults = FakeGeminiConfig()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8090)
+    for field, value in asdict(defaults).items():
+        flag = "--" + field.replace("_", "-")
+        kind = type(value) if value is not None else int
+        parser.add_argument(flag, type=kind, default=value)
+    args = vars(parser.parse_args())
+    host, port = args.pop("host"), args.pop("port")
+    uvicorn.run(create_app(FakeGeminiConfig(**args)), host=host, port=port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
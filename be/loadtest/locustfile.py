@@ -0,0 +1,248 @@
+"""
+Kiểm thử tải đầu-cuối cho pipeline RAG thật (tải lên -> worker -> truy xuất -> LLM).
+
+Mỗi người dùng ảo là một phiên: tải lên một PDF (số trang lấy theo phân phối của profile),
+chờ tới khi xử lý xong (đo "upload_to_ready"), hỏi các đợt câu hỏi liên tiếp ("answer",
+"stream_first_token", "stream_answer"), và có thể tải lại / thêm tài liệu giữa phiên.
+Các câu trả lời 429 của rate-limit được tôn trọng (chờ theo Retry-After) và đếm riêng.
+Khi kết thúc, p50/p95/p99 và thông lượng của từng luồng được in ra và ghi thành JSON.
+
+Chuẩn bị (từ thư mục be/), dùng Gemini giả lập thay cho API thật:
+    python -m loadtest.fake_gemini --port 8090 --rate-429 0.02 --error-rate 0.005
+    GEMINI_BASE_URL=http://localhost:8090 GOOGLE_API_KEY=fake fastapi run src/main.py
+    GEMINI_BASE_URL=http://localhost:8090 GOOGLE_API_KEY=fake celery -A src.celery_worker:celery_app worker
+Chạy:
+    LOADTEST_PROFILE=mixed locust -f loadtest/locustfile.py --headless -u 50 -r 5 --run-time 5m --host http://localhost:8000
+
+Biến môi trường: LOADTEST_PROFILE (steady | bursty | reupload | mixed), LOADTEST_REPORT (đường dẫn JSON),
+LOADTEST_PDF_VARIANTS (số PDF khác nhau cho mỗi kích thước), LOADTEST_READY_TIMEOUT (giây).
+"""
+import os
+import random
+import sys
+import time
+import uuid
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+from locust import HttpUser, between, events, task
+
+# locust chỉ thêm thư mục của locustfile vào sys.path; cần thư mục be/ để import benchmark và loadtest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmark.documents import make_pdf
+from loadtest.report import LatencyRecorder, render_table, write_report
+
+LOADTEST_PROFILE = os.environ.get("LOADTEST_PROFILE", "mixed")
+LOADTEST_REPORT = os.environ.get("LOADTEST_REPORT", f"loadtest/reports/{datetime.now():%Y%m%d-%H%M%S}.json")
+LOADTEST_PDF_VARIANTS = int(os.environ.get("LOADTEST_PDF_VARIANTS", 4))
+LOADTEST_READY_TIMEOUT = float(os.environ.get("LOADTEST_READY_TIMEOUT", 600))
+LOADTEST_POLL_INTERVAL = float(os.environ.get("LOADTEST_POLL_INTERVAL", 0.5))
+
+
+@dataclass
+class WorkloadProfile:
+    # Số trang -> trọng số (phân phối kích thước tài liệu)
+    doc_pages: Dict[int, float] = field(default_factory=lambda: {2: 0.4, 10: 0.35, 50: 0.2, 200: 0.05})
+    bursts: Tuple[int, int] = (1, 3)
+    questions_per_burst: Tuple[int, int] = (1, 4)
+    # Thời gian nghỉ (giây) giữa hai đợt câu hỏi
+    think_time: Tuple[float, float] = (2.0, 10.0)
+    # Xác suất tải lại (thay thế) hoặc thêm tài liệu sau mỗi đợt câu hỏi
+    reupload_probability: float = 0.1
+    append_probability: float = 0.05
+    # Tỉ lệ câu hỏi dùng /api/v1/retrieve/stream
+    stream_fraction: float = 0.3
+
+
+PROFILES = {
+    "steady": WorkloadProfile(bursts=(3, 6), questions_per_burst=(1, 1), reupload_probability=0.0, append_probability=0.0),
+    "bursty": WorkloadProfile(bursts=(1, 2), questions_per_burst=(5, 10), think_time=(0.5, 2.0)),
+    "reupload": WorkloadProfile(
+        doc_pages={2: 0.3, 10: 0.4, 50: 0.3}, bursts=(1, 2), reupload_probability=0.5, append_probability=0.2
+    ),
+    "mixed": WorkloadProfile(),
+}
+
+profile = PROFILES[LOADTEST_PROFILE]
+recorder = LatencyRecorder()
+
+# PDF được sinh sẵn một lần cho mỗi (số trang, biến thể): sinh trong lúc chạy sẽ chiếm CPU của locust
+_documents: Dict[Tuple[int, int], Tuple[bytes, List[str]]] = {}
+
+
+def get_document(pages: int, variant: int) -> Tuple[bytes, List[str]]:
+    key = (pages, variant)
+    if key not in _documents:
+        _documents[key] = make_pdf(pages, seed=pages * 1000 + variant)
+    return _documents[key]
+
+
+@events.test_start.add_listener
+def on_test_start(environment, **kwargs):
+    for pages in profile.doc_pages:
+        for variant in range(LOADTEST_PDF_VARIANTS):
+            get_document(pages, variant)
+    recorder.start()
+
+
+@events.test_stop.add_listener
+def on_test_stop(environment, **kwargs):
+    recorder.stop()
+    report = write_report(recorder, LOADTEST_REPORT, meta={
+        "profile": LOADTEST_PROFILE,
+        "workload": asdict(profile),
+        "host": environment.host,
+        "users": environment.runner.user_count if environment.runner else None,
+    })
+    print(f"\nProfile {LOADTEST_PROFILE}, {report['meta']['duration_s']:.0f}s:")
+    print(render_table(report["flows"]))
+    print(f"Đã lưu báo cáo vào {LOADTEST_REPORT}")
+
+
+def _fire(environment, name: str, seconds: float, exception=None):
+    # Gửi kèm vào thống kê của locust (bảng và biểu đồ trên web UI)
+    environment.events.request.fire(
+        request_type="FLOW", name=name, response_time=seconds * 1000, response_length=0,
+        exception=exception, context={},
+    )
+
+
+class RagUser(HttpUser):
+    wait_time = between(0.5, 2.0)
+
+    def on_start(self):
+        self.uid = uuid.uuid4().hex
+        self.words: List[str] = []
+
+    def _retry_after(self, response) -> float:
+        try:
+            return float(response.headers.get("Retry-After", 1))
+        except ValueError:
+            return 1.0
+
+    def upload(self, append: bool = False) -> bool:
+        pages = random.choices(list(profile.doc_pages), weights=list(profile.doc_pages.values()))[0]
+        content, words = get_document(pages, random.randrange(LOADTEST_PDF_VARIANTS))
+        flow = "append_to_ready" if append else "upload_to_ready"
+        started = time.monotonic()
+        while True:
+            with self.client.post(
+                "/api/v1/document",
+                files={"file": (f"doc-{pages}p.pdf", content, "application/pdf")},
+                data={"uid": self.uid, "append": str(append).lower()},
+                name="/api/v1/document",
+                catch_response=True,
+            ) as response:
+                if response.status_code == 429:
+                    response.success()
+                    recorder.rate_limited(flow)
+                    time.sleep(self._retry_after(response))
+                    continue
+                body = response.json() if response.status_code == 200 else {}
+                if body.get("status") != 202:
+                    response.failure(f"Upload failed: {response.status_code} {response.text[:200]}")
+                    recorder.error(flow)
+                    return False
+                task_id = body["task_id"]
+                break
+
+        # Chờ worker xử lý xong
+        while time.monotonic() - started < LOADTEST_READY_TIMEOUT:
+            time.sleep(LOADTEST_POLL_INTERVAL)
+            response = self.client.get(f"/api/v1/task_status?task_id={task_id}", name="/api/v1/task_status")
+            if response.status_code != 200:
+                continue
+            status = response.json()
+            if status.get("status") != "Completed":
+                continue
+            result = status.get("result")
+            elapsed = time.monotonic() - started
+            if isinstance(result, dict) and result.get("status") == "success":
+                recorder.record(flow, elapsed)
+                _fire(self.environment, flow, elapsed)
+                self.words = words if not append else self.words + words
+                return True
+            recorder.error(flow)
+            _fire(self.environment, flow, elapsed, exception=RuntimeError(f"Processing failed: {result}"))
+            return False
+        recorder.error(flow)
+        _fire(self.environment, flow, LOADTEST_READY_TIMEOUT, exception=TimeoutError("Document not ready in time"))
+        return False
+
+    def question(self) -> str:
+        return " ".join(random.choices(self.words, k=random.randint(3, 8)))
+
+    def ask(self) -> None:
+        query = self.question()
+        stream = random.random() < profile.stream_fraction
+        for _ in range(10):
+            if stream:
+                limited = self.ask_stream(query)
+            else:
+                limited = self.ask_once(query)
+            if limited is None:
+                return
+            time.sleep(limited)
+
+    def ask_once(self, query: str):
+        """Trả về số giây cần chờ nếu bị rate-limit, ngược lại None."""
+        started = time.monotonic()
+        with self.client.post(
+            "/api/v1/retrieve", data={"query_text": query, "uid": self.uid}, name="/api/v1/retrieve", catch_response=True
+        ) as response:
+            if response.status_code == 429:
+                response.success()
+                recorder.rate_limited("answer")
+                return self._retry_after(response)
+            if response.status_code != 200 or "message" not in response.json():
+                response.failure(f"Retrieve failed: {response.status_code} {response.text[:200]}")
+                recorder.error("answer")
+                return None
+            recorder.record("answer", time.monotonic() - started)
+        return None
+
+    def ask_stream(self, query: str):
+        started = time.monotonic()
+        first_token = None
+        with self.client.post(
+            "/api/v1/retrieve/stream", data={"query_text": query, "uid": self.uid}, name="/api/v1/retrieve/stream",
+            stream=True, catch_response=True,
+        ) as response:
+            if response.status_code == 429:
+                response.success()
+                recorder.rate_limited("stream_answer")
+                return self._retry_after(response)
+            if response.status_code != 200:
+                response.failure(f"Stream failed: {response.status_code}")
+                recorder.error("stream_answer")
+                return None
+            failed = False
+            for line in response.iter_lines(decode_unicode=True):
+                if line.startswith("event: token") and first_token is None:
+                    first_token = time.monotonic() - started
+                elif line.startswith("event: error"):
+                    failed = True
+            if failed:
+                response.failure("Stream returned an error event")
+                recorder.error("stream_answer")
+                return None
+        if first_token is not None:
+            recorder.record("stream_first_token", first_token)
+        recorder.record("stream_answer", time.monotonic() - started)
+        return None
+
+    @task
+    def session(self):
+        if not self.words and not self.upload():
+            return
+        for _ in range(random.randint(*profile.bursts)):
+            for _ in range(random.randint(*profile.questions_per_burst)):
+                self.ask()
+            time.sleep(random.uniform(*profile.think_time))
+            roll = random.random()
+            if roll < profile.reupload_probability:
+                self.upload()
+            elif roll < profile.reupload_probability + profile.append_probability:
+                self.upload(append=True)
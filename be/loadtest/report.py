@@ -0,0 +1,98 @@
+"""
+Thu thập độ trễ của các luồng nghiệp vụ trong kiểm thử tải và tổng hợp p50/p95/p99, thông lượng.
+
+Không phụ thuộc locust, nên có thể dùng lại hoặc kiểm thử riêng.
+"""
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+class LatencyRecorder:
+    """Lưu các mẫu (giây) theo tên luồng, cùng số lỗi và số lần bị giới hạn (429)."""
+
+    def __init__(self, clock=time.monotonic):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._samples: Dict[str, List[float]] = {}
+        self._errors: Dict[str, int] = {}
+        self._limited: Dict[str, int] = {}
+        self.started_at: Optional[float] = None
+        self.stopped_at: Optional[float] = None
+
+    def start(self) -> None:
+        self.started_at = self._clock()
+        self.stopped_at = None
+
+    def stop(self) -> None:
+        self.stopped_at = self._clock()
+
+    def record(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self._samples.setdefault(name, []).append(seconds)
+
+    def error(self, name: str) -> None:
+        with self._lock:
+            self._errors[name] = self._errors.get(name, 0) + 1
+
+    def rate_limited(self, name: str) -> None:
+        with self._lock:
+            self._limited[name] = self._limited.get(name, 0) + 1
+
+    @property
+    def duration(self) -> float:
+        if self.started_at is None:
+            return 0.0
+        end = self.stopped_at if self.stopped_at is not None else self._clock()
+        return max(end - self.started_at, 1e-9)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            names = sorted(set(self._samples) | set(self._errors) | set(self._limited))
+            samples = {name: np.asarray(self._samples.get(name, []), dtype=np.float64) for name in names}
+            errors, limited = dict(self._errors), dict(self._limited)
+        duration = self.duration
+        report = {}
+        for name in names:
+            values = samples[name]
+            entry = {
+                "count": int(len(values)),
+                "errors": errors.get(name, 0),
+                "rate_limited": limited.get(name, 0),
+                "throughput_per_s": len(values) / duration if duration else 0.0,
+            }
+            if len(values):
+                p50, p95, p99 = np.percentile(values, [50, 95, 99])
+                entry.update(
+                    mean_s=float(values.mean()), p50_s=float(p50), p95_s=float(p95), p99_s=float(p99),
+                    max_s=float(values.max()),
+                )
+            report[name] = entry
+        return report
+
+
+def render_table(summary: Dict[str, Dict[str, float]]) -> str:
+    header = f"{'flow':>24} {'count':>7} {'errors':>7} {'429':>6} {'p50 (s)':>9} {'p95 (s)':>9} {'p99 (s)':>9} {'max (s)':>9} {'per s':>8}"
+    lines = [header]
+    for name, entry in summary.items():
+        if "p50_s" in entry:
+            timings = " ".join(f"{entry[key]:>9.3f}" for key in ("p50_s", "p95_s", "p99_s", "max_s"))
+        else:
+            timings = " ".join(f"{'-':>9}" for _ in range(4))
+        lines.append(
+            f"{name:>24} {entry['count']:>7} {entry['errors']:>7} {entry['rate_limited']:>6} {timings} "
+            f"{entry['throughput_per_s']:>8.2f}"
+        )
+    return "\n".join(lines)
+
+
+def write_report(recorder: LatencyRecorder, path: str, meta: Optional[Dict] = None) -> Dict:
+    report = {"meta": {**(meta or {}), "duration_s": recorder.duration}, "flows": recorder.summary()}
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+    return report
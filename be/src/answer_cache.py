@@ -0,0 +1,182 @@
+"""
+Cache câu trả lời theo ngữ nghĩa (semantic cache) cho từng người dùng.
+
+Mỗi uid giữ một danh sách (embedding câu hỏi đã chuẩn hóa, câu trả lời) gắn với
+generation của tài liệu. Câu hỏi mới có độ tương đồng cosine với một câu hỏi đã
+trả lời >= `threshold` sẽ nhận lại câu trả lời cũ, bỏ qua bước truy xuất và gọi LLM.
+Khi người dùng tải tài liệu mới (generation thay đổi), toàn bộ entry của uid bị loại.
+"""
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+ANSWER_CACHE_ENABLED = os.environ.get("ANSWER_CACHE_ENABLED", "True").lower() in ("true", "1", "t")
+# Ngưỡng cosine để coi hai câu hỏi là một.
+ANSWER_CACHE_THRESHOLD = float(os.environ.get("ANSWER_CACHE_THRESHOLD", 0.95))
+# Số câu trả lời tối đa giữ cho mỗi người dùng và số người dùng tối đa (LRU).
+ANSWER_CACHE_MAX_ENTRIES_PER_USER = int(os.environ.get("ANSWER_CACHE_MAX_ENTRIES_PER_USER", 256))
+ANSWER_CACHE_MAX_USERS = int(os.environ.get("ANSWER_CACHE_MAX_USERS", 10000))
+
+
+class _UserAnswers:
+    __slots__ = ("generation", "vectors", "questions", "answers", "scopes")
+
+    def __init__(self, generation: Optional[str]):
+        self.generation = generation
+        self.vectors: Optional[np.ndarray] = None
+        self.questions: List[str] = []
+        self.answers: List[Any] = []
+        # Phạm vi truy xuất của câu trả lời (vd. các doc_id được lọc), None = toàn bộ tài liệu
+        self.scopes: List[Hashable] = []
+
+    def __len__(self) -> int:
+        return len(self.answers)
+
+
+class SemanticAnswerCache:
+    """
+    Cache câu trả lời theo độ tương đồng của embedding câu hỏi, phân theo uid.
+    Trong một uid, entry được dùng gần nhất nằm cuối danh sách; entry cũ nhất bị loại khi đầy.
+    """
+
+    def __init__(
+        self,
+        threshold: float = ANSWER_CACHE_THRESHOLD,
+        max_entries_per_user: int = ANSWER_CACHE_MAX_ENTRIES_PER_USER,
+        max_users: int = ANSWER_CACHE_MAX_USERS,
+    ):
+        self.threshold = threshold
+        self.max_entries_per_user = max(1, max_entries_per_user)
+        self.max_users = max(1, max_users)
+        self._users: "OrderedDict[Hashable, _UserAnswers]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = {"lru": 0, "stale": 0, "invalidated": 0}
+
+    def __len__(self) -> int:
+        return sum(len(user) for user in self._users.values())
+
+    @staticmethod
+    def _normalize(vector: Sequence[float]) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32).ravel()
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def _user(self, uid: Hashable, generation: Optional[str], create: bool) -> Optional[_UserAnswers]:
+        user = self._users.get(uid)
+        if user is not None and user.generation != generation:
+            # Tài liệu đã được tải lại: các câu trả lời cũ không còn đúng
+            self.evictions["stale"] += len(user)
+            del self._users[uid]
+            user = None
+        if user is None and create:
+            while len(self._users) >= self.max_users:
+                _, oldest = self._users.popitem(last=False)
+                self.evictions["lru"] += len(oldest)
+            user = self._users[uid] = _UserAnswers(generation)
+        if user is not None:
+            self._users.move_to_end(uid)
+        return user
+
+    def lookup(
+        self, uid: Hashable, generation: Optional[str], query_vector: Sequence[float], scope: Hashable = None
+    ) -> Optional[Any]:
+        """
+        Trả về câu trả lời đã lưu cho câu hỏi tương tự nhất (nếu >= threshold) trong cùng
+        phạm vi `scope`, ngược lại None.
+        """
+        query = self._normalize(query_vector)
+        with self._lock:
+            user = self._user(uid, generation, create=False)
+            if user is None or not len(user) or user.vectors.shape[1] != query.shape[0]:
+                self.misses += 1
+                return None
+            scores = user.vectors @ query
+            if any(s != scope for s in user.scopes):
+                scores = np.where([s == scope for s in user.scopes], scores, -np.inf)
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                self.misses += 1
+                return None
+            self.hits += 1
+            answer = user.answers[best]
+            self._touch(user, best)
+            return answer
+
+    @staticmethod
+    def _touch(user: _UserAnswers, i: int) -> None:
+        last = len(user) - 1
+        if i == last:
+            return
+        order = [j for j in range(len(user)) if j != i] + [i]
+        user.vectors = user.vectors[order]
+        user.questions = [user.questions[j] for j in order]
+        user.answers = [user.answers[j] for j in order]
+        user.scopes = [user.scopes[j] for j in order]
+
+    def store(
+        self,
+        uid: Hashable,
+        generation: Optional[str],
+        query_vector: Sequence[float],
+        question: str,
+        answer: Any,
+        scope: Hashable = None,
+    ) -> None:
+        query = self._normalize(query_vector)
+        with self._lock:
+            user = self._user(uid, generation, create=True)
+            if user.vectors is not None and user.vectors.shape[1] != query.shape[0]:
+                # Model embedding đã đổi: bắt đầu lại danh sách của uid này
+                self.evictions["stale"] += len(user)
+                user.vectors, user.questions, user.answers, user.scopes = None, [], [], []
+            if user.vectors is None:
+                user.vectors = query[None, :]
+            else:
+                user.vectors = np.vstack([user.vectors, query])
+            user.questions.append(question)
+            user.answers.append(answer)
+            user.scopes.append(scope)
+            self.stores += 1
+            excess = len(user) - self.max_entries_per_user
+            if excess > 0:
+                user.vectors = user.vectors[excess:]
+                user.questions = user.questions[excess:]
+                user.answers = user.answers[excess:]
+                user.scopes = user.scopes[excess:]
+                self.evictions["lru"] += excess
+
+    def invalidate(self, uid: Hashable, generation: Optional[str] = None) -> bool:
+        """Loại các câu trả lời của `uid`; nếu có `generation`, giữ lại khi chúng đã ở generation đó."""
+        with self._lock:
+            user = self._users.get(uid)
+            if user is None or (generation is not None and user.generation == generation):
+                return False
+            del self._users[uid]
+            self.evictions["invalidated"] += len(user)
+            return True
+
+    def clear(self) -> None:
+        with self._lock:
+            self._users.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "users": len(self._users),
+            "entries": len(self),
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+            "stores": self.stores,
+            "evictions": dict(self.evictions),
+        }
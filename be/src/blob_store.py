@@ -0,0 +1,117 @@
+"""
+Kho blob tạm cho file tải lên (mô hình claim-check).
+
+API ghi file tải lên theo từng khối vào Redis hoặc một thư mục dùng chung, rồi chỉ
+gửi tham chiếu (chuỗi ngắn) qua Celery thay cho toàn bộ bytes của PDF. Worker đọc
+blob theo tham chiếu và xóa nó sau khi xử lý xong.
+
+Tham chiếu có dạng "redis:<key>" hoặc "file:<đường dẫn>".
+"""
+import asyncio
+import logging
+import os
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# "redis" (mặc định, dùng chung Redis với worker) hoặc "filesystem" (thư mục dùng chung).
+BLOB_STORE_BACKEND = os.environ.get("BLOB_STORE_BACKEND", "redis").lower()
+BLOB_STORE_DIR = os.environ.get("BLOB_STORE_DIR", "/tmp/simpl-rag-blobs")
+# Kích thước file tải lên tối đa (byte).
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", 50 * 1024 * 1024))
+# Blob chưa được xử lý sẽ tự hết hạn sau khoảng thời gian này (giây).
+BLOB_TTL = int(os.environ.get("BLOB_TTL", 3600))
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+_REDIS_PREFIX = "redis:"
+_FILE_PREFIX = "file:"
+
+
+class BlobTooLarge(Exception):
+    def __init__(self, *args):
+        super().__init__(*args)
+
+
+async def save_upload(file, async_redis_binary_client, max_bytes: int = MAX_UPLOAD_BYTES, backend: str = None) -> str:
+    """
+    Ghi UploadFile vào kho blob theo từng khối UPLOAD_CHUNK_SIZE, không đọc toàn bộ file vào bộ nhớ.
+    Ném BlobTooLarge (và xóa phần đã ghi) nếu file vượt quá `max_bytes`.
+    """
+    backend = backend or BLOB_STORE_BACKEND
+    if file.size is not None and file.size > max_bytes:
+        raise BlobTooLarge(f"File exceeds the {max_bytes} bytes upload limit.")
+
+    blob_id = uuid.uuid4().hex
+    if backend == "filesystem":
+        ref = _FILE_PREFIX + os.path.join(BLOB_STORE_DIR, f"{blob_id}.pdf")
+    else:
+        ref = _REDIS_PREFIX + f"blob:{blob_id}"
+
+    written = 0
+    handle = None
+    try:
+        if backend == "filesystem":
+            os.makedirs(BLOB_STORE_DIR, exist_ok=True)
+            handle = open(ref[len(_FILE_PREFIX):], "wb")
+        while True:
+            chunk = await file.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            written += len(chunk)
+            if written > max_bytes:
+                raise BlobTooLarge(f"File exceeds the {max_bytes} bytes upload limit.")
+            if handle is not None:
+                await asyncio.to_thread(handle.write, chunk)
+            elif written == len(chunk):
+                await async_redis_binary_client.set(ref[len(_REDIS_PREFIX):], chunk, ex=BLOB_TTL)
+            else:
+                await async_redis_binary_client.append(ref[len(_REDIS_PREFIX):], chunk)
+        if written == 0 and handle is None:
+            await async_redis_binary_client.set(ref[len(_REDIS_PREFIX):], b"", ex=BLOB_TTL)
+    except BaseException:
+        if handle is not None:
+            handle.close()
+            handle = None
+        await delete_blob_async(ref, async_redis_binary_client)
+        raise
+    finally:
+        if handle is not None:
+            handle.close()
+    return ref
+
+
+def read_blob(ref: str, redis_client) -> bytes:
+    """Đọc nội dung blob (phía worker, client Redis đồng bộ)."""
+    if ref.startswith(_FILE_PREFIX):
+        with open(ref[len(_FILE_PREFIX):], "rb") as f:
+            return f.read()
+    if ref.startswith(_REDIS_PREFIX):
+        data = redis_client.get(ref[len(_REDIS_PREFIX):])
+        if data is None:
+            raise FileNotFoundError(f"Blob {ref} not found or expired.")
+        return data
+    raise ValueError(f"Unknown blob reference: {ref}")
+
+
+def delete_blob(ref: str, redis_client) -> None:
+    try:
+        if ref.startswith(_FILE_PREFIX):
+            os.remove(ref[len(_FILE_PREFIX):])
+        elif ref.startswith(_REDIS_PREFIX):
+            redis_client.delete(ref[len(_REDIS_PREFIX):])
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logger.warning(f"Không thể xóa blob {ref}: {e}")
+
+
+async def delete_blob_async(ref: str, async_redis_binary_client) -> None:
+    try:
+        if ref.startswith(_FILE_PREFIX):
+            await asyncio.to_thread(os.remove, ref[len(_FILE_PREFIX):])
+        elif ref.startswith(_REDIS_PREFIX):
+            await async_redis_binary_client.delete(ref[len(_REDIS_PREFIX):])
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logger.warning(f"Không thể xóa blob {ref}: {e}")
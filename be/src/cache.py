@@ -0,0 +1,169 @@
+"""
+Cache cục bộ có giới hạn bộ nhớ cho các vectorstore đã giải mã.
+
+- Giới hạn tổng dung lượng (byte), mỗi entry được ghi nhận kích thước riêng.
+- Loại bỏ theo LRU khi vượt ngân sách và theo thời gian không hoạt động (idle TTL).
+- Mỗi entry mang một "generation": khi worker xử lý xong tài liệu mới,
+  generation trong Redis thay đổi và entry cũ sẽ bị coi là miss.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class _CacheEntry:
+    __slots__ = ("value", "size", "generation", "last_access")
+
+    def __init__(self, value: Any, size: int, generation: Optional[str], last_access: float):
+        self.value = value
+        self.size = size
+        self.generation = generation
+        self.last_access = last_access
+
+
+class VectorStoreCache:
+    """Cache LRU + idle TTL có giới hạn byte và bộ đếm hit/miss/eviction."""
+
+    def __init__(self, max_bytes: int, ttl: float, clock: Callable[[], float] = time.monotonic):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._clock = clock
+        self._entries: "OrderedDict[Hashable, _CacheEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = {"lru": 0, "ttl": 0, "stale": 0, "invalidated": 0}
+        self.rejected = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    @property
+    def current_bytes(self) -> int:
+        return self._bytes
+
+    def _remove(self, key: Hashable, reason: str) -> None:
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+        self.evictions[reason] += 1
+
+    def get(self, key: Hashable, generation: Optional[str] = None) -> Any:
+        """
+        Trả về giá trị trong cache hoặc None nếu miss.
+        Entry hết hạn hoặc có generation khác với `generation` bị loại bỏ.
+        """
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if now - entry.last_access > self.ttl:
+                self._remove(key, "ttl")
+                self.misses += 1
+                return None
+            if entry.generation != generation:
+                self._remove(key, "stale")
+                self.misses += 1
+                return None
+            entry.last_access = now
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.value
+
+    def peek_generation(self, key: Hashable) -> Optional[str]:
+        """Generation của entry còn hạn (không tính hit/miss, không đổi thứ tự LRU), hoặc None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or self._clock() - entry.last_access > self.ttl:
+                return None
+            return entry.generation
+
+    def put(self, key: Hashable, value: Any, size: int, generation: Optional[str] = None) -> bool:
+        """
+        Thêm entry vào cache, loại bỏ các entry ít dùng nhất cho đến khi đủ ngân sách.
+        Entry lớn hơn toàn bộ ngân sách sẽ không được lưu.
+        """
+        if size > self.max_bytes:
+            self.rejected += 1
+            logger.warning(f"Entry {key} ({size} bytes) vượt quá ngân sách cache ({self.max_bytes} bytes), bỏ qua.")
+            return False
+        with self._lock:
+            if key in self._entries:
+                old = self._entries.pop(key)
+                self._bytes -= old.size
+            while self._entries and self._bytes + size > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest, "lru")
+            self._entries[key] = _CacheEntry(value, size, generation, self._clock())
+            self._bytes += size
+            return True
+
+    def resize(self, key: Hashable, size: int) -> bool:
+        """
+        Cập nhật kích thước của entry (vd. sau khi giá trị dựng thêm cấu trúc lười trong bộ nhớ),
+        loại các entry ít dùng nhất nếu vượt ngân sách. Trả về False nếu entry không còn trong cache.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False
+            if entry.size == size:
+                return True
+            if size > self.max_bytes:
+                self._remove(key, "lru")
+                self.rejected += 1
+                return False
+            self._bytes += size - entry.size
+            entry.size = size
+            while self._bytes > self.max_bytes:
+                oldest = next(k for k in self._entries if k != key)
+                self._remove(oldest, "lru")
+            return True
+
+    def invalidate(self, key: Hashable, generation: Optional[str] = None) -> bool:
+        """Loại entry của `key`; nếu có `generation`, entry đã ở đúng generation đó được giữ lại."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or (generation is not None and entry.generation == generation):
+                return False
+            self._remove(key, "invalidated")
+            return True
+
+    def evict_expired(self) -> int:
+        """Quét và loại bỏ tất cả các entry đã quá idle TTL. Trả về số entry bị loại."""
+        now = self._clock()
+        with self._lock:
+            expired = [k for k, e in self._entries.items() if now - e.last_access > self.ttl]
+            for key in expired:
+                self._remove(key, "ttl")
+        if expired:
+            logger.info(f"Đã loại bỏ {len(expired)} vectorstore hết hạn khỏi cache cục bộ.")
+        return len(expired)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+            "evictions": dict(self.evictions),
+            "rejected": self.rejected,
+        }
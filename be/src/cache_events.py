@@ -0,0 +1,172 @@
+"""
+Giữ cache cục bộ của các API instance nhất quán với Redis qua pub/sub (không polling).
+
+- Worker phát một sự kiện JSON {"uid", "generation", "reason"} lên CACHE_EVENTS_CHANNEL
+  mỗi khi ghi chỉ mục mới của người dùng (tải lên, thêm hoặc xóa tài liệu).
+- Mỗi API instance chạy một `CacheInvalidationListener` trong lifespan: nhận các sự kiện đó
+  và thông báo hết hạn key của Redis (`__keyevent@<db>__:expired`) rồi loại entry cục bộ của uid.
+- Khi mất kết nối, các sự kiện trong khoảng đó có thể đã bị lỡ: sau khi đăng ký lại,
+  listener gọi `on_reset` để xóa toàn bộ cache cục bộ, nên tính đúng đắn không phụ thuộc
+  vào việc người dùng luôn được định tuyến tới cùng một instance.
+"""
+import asyncio
+import json
+import logging
+import os
+import re
+from typing import Any, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+CACHE_EVENTS_ENABLED = os.environ.get("CACHE_EVENTS_ENABLED", "True").lower() in ("true", "1", "t")
+CACHE_EVENTS_CHANNEL = os.environ.get("CACHE_EVENTS_CHANNEL", "vectorstore:events")
+# Tự bật thông báo hết hạn key (notify-keyspace-events "Ex") khi listener khởi động.
+CACHE_EVENTS_CONFIGURE_KEYSPACE = os.environ.get("CACHE_EVENTS_CONFIGURE_KEYSPACE", "True").lower() in ("true", "1", "t")
+# Thời gian chờ (giây) tối đa giữa hai lần kết nối lại.
+CACHE_EVENTS_MAX_BACKOFF = float(os.environ.get("CACHE_EVENTS_MAX_BACKOFF", 30))
+
+# Các key mà khi hết hạn thì dữ liệu cục bộ của uid không còn dùng được
+_USER_KEY = re.compile(r"^user:(?P<uid>.+):(?:vectorstore|generation|status)$")
+
+
+def _decode(value) -> str:
+    return value.decode("utf-8") if isinstance(value, bytes) else str(value)
+
+
+def publish_invalidation(redis_client, uid: str, generation=None, reason: str = "updated") -> int:
+    """Phát sự kiện loại cache của `uid` (đồng bộ, dùng trong worker). Trả về số subscriber nhận được."""
+    message = {"uid": uid, "generation": None if generation is None else str(generation), "reason": reason}
+    return redis_client.publish(CACHE_EVENTS_CHANNEL, json.dumps(message))
+
+
+def parse_event(channel, data, channel_name: str = CACHE_EVENTS_CHANNEL) -> Optional[Tuple[str, Optional[str], str]]:
+    """
+    Chuyển một message pub/sub thành (uid, generation, reason), hoặc None nếu không liên quan.
+    Thông báo hết hạn key có generation None (mọi entry của uid đều bị loại).
+    """
+    channel, data = _decode(channel), _decode(data)
+    if channel == channel_name:
+        try:
+            event = json.loads(data)
+            return str(event["uid"]), event.get("generation"), event.get("reason", "updated")
+        except (ValueError, KeyError, TypeError):
+            logger.warning(f"Bỏ qua sự kiện cache không hợp lệ: {data!r}")
+            return None
+    if channel.endswith(":expired"):
+        match = _USER_KEY.match(data)
+        if match:
+            return match.group("uid"), None, "expired"
+    return None
+
+
+async def enable_expiry_notifications(redis_client) -> bool:
+    """Thêm cờ "Ex" vào notify-keyspace-events (giữ các cờ đã có). Trả về False nếu Redis không cho phép."""
+    try:
+        current = (await redis_client.config_get("notify-keyspace-events")).get("notify-keyspace-events", "")
+        current = _decode(current)
+        if "E" in current and ("x" in current or "A" in current):
+            return True
+        flags = "".join(sorted(set(current) | {"E", "x"}))
+        await redis_client.config_set("notify-keyspace-events", flags)
+        return True
+    except Exception as e:
+        logger.warning(f"Không bật được thông báo hết hạn key của Redis ({e}); chỉ dựa vào sự kiện của worker.")
+        return False
+
+
+class CacheInvalidationListener:
+    """
+    Đăng ký CACHE_EVENTS_CHANNEL và kênh hết hạn key của `db`, gọi
+    `on_invalidate(uid, generation, reason)` cho mỗi sự kiện liên quan.
+    """
+
+    def __init__(
+        self,
+        redis_client,
+        on_invalidate: Callable[[str, Optional[str], str], Any],
+        on_reset: Optional[Callable[[], Any]] = None,
+        db: int = 1,
+        channel: str = CACHE_EVENTS_CHANNEL,
+        configure_keyspace: bool = CACHE_EVENTS_CONFIGURE_KEYSPACE,
+        max_backoff: float = CACHE_EVENTS_MAX_BACKOFF,
+    ):
+        self.redis_client = redis_client
+        self.on_invalidate = on_invalidate
+        self.on_reset = on_reset
+        self.channel = channel
+        self.expired_channel = f"__keyevent@{db}__:expired"
+        self.configure_keyspace = configure_keyspace
+        self.max_backoff = max_backoff
+        self.subscribed = asyncio.Event()
+        self.events = 0
+        self.expired = 0
+        self.resets = 0
+        self._backoff = 0.5
+        self._task: Optional[asyncio.Task] = None
+
+    def handle(self, channel, data) -> bool:
+        event = parse_event(channel, data, self.channel)
+        if event is None:
+            return False
+        uid, generation, reason = event
+        if reason == "expired":
+            self.expired += 1
+        else:
+            self.events += 1
+        self.on_invalidate(uid, generation, reason)
+        return True
+
+    async def _listen_once(self, connected_before: bool) -> None:
+        if self.configure_keyspace:
+            await enable_expiry_notifications(self.redis_client)
+        pubsub = self.redis_client.pubsub(ignore_subscribe_messages=True)
+        try:
+            await pubsub.subscribe(self.channel, self.expired_channel)
+            if connected_before and self.on_reset is not None:
+                # Có thể đã lỡ sự kiện trong lúc mất kết nối
+                self.resets += 1
+                self.on_reset()
+            self.subscribed.set()
+            self._backoff = 0.5
+            while True:
+                message = await pubsub.get_message(timeout=None)
+                if message is not None and message.get("type") == "message":
+                    self.handle(message["channel"], message["data"])
+        finally:
+            self.subscribed.clear()
+            await pubsub.aclose()
+
+    async def run(self) -> None:
+        connected_before = False
+        while True:
+            try:
+                await self._listen_once(connected_before)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Mất kết nối tới kênh sự kiện cache ({e}), thử lại sau {self._backoff:.1f}s.")
+                connected_before = True
+                await asyncio.sleep(self._backoff)
+                self._backoff = min(self._backoff * 2, self.max_backoff)
+
+    def start(self) -> asyncio.Task:
+        self._task = asyncio.create_task(self.run())
+        return self._task
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "subscribed": self.subscribed.is_set(),
+            "events": self.events,
+            "expired": self.expired,
+            "resets": self.resets,
+        }
@@ -1,11 +1,24 @@
 import json
-import pickle
 import time
 import logging
+import uuid
 from celery import Celery
+from celery.signals import task_postrun, worker_process_shutdown
 from redis import Redis
 
-from src.rag.preprocess import PDFLoader, SplittingDocuments, StoringDocuments
+from src.blob_store import delete_blob, read_blob
+from src.cache_events import publish_invalidation
+from src.metrics import EVENTS, PAYLOAD_BYTES, STAGE_SECONDS, MetricsPusher, registry
+from src.rag.collection import append_document, remove_document, tag_document
+from src.rag.embedding_cache import CachedEmbeddings
+from src.rag.index_format import load_index, serialize_index
+from src.rag.lexical import build_lexical_index
+from src.rag.quantize import dequantize_index, quantize_index
+from src.rag.pdf_extract import count_pages, iter_pages
+from src.rag.pipeline import ProgressReporter, ingest_pages
+from src.rag.preprocess import EMBEDDING_MODEL_NAME, LOCAL_EMBEDDINGS, SplittingDocuments, embedding_scheduler
+from src.rag.search import normalize_rows
+from src.task_events import TaskEventPublisher
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(name)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -26,34 +39,169 @@ celery_app.conf.update(
     broker_transport_options={'visibility_timeout': 3600}
 )
 
+# Mỗi tiến trình worker đẩy chỉ số của mình vào Redis để API xuất tại /metrics.
+metrics_pusher = MetricsPusher(registry, redis_client)
+
+@task_postrun.connect
+def _push_metrics(**kwargs):
+    metrics_pusher.push()
+
+@worker_process_shutdown.connect
+def _flush_metrics(**kwargs):
+    metrics_pusher.push(force=True)
+
+# Khóa theo uid cho thao tác đọc-sửa-ghi chỉ mục (thêm/xóa tài liệu).
+INDEX_LOCK_TIMEOUT = 600
+
+def document_status_key(uid, doc_id):
+    """
+    Trạng thái riêng của một tài liệu đang được thêm vào bộ sưu tập: trong lúc xử lý,
+    `user:{uid}:status` vẫn là "ready" để các tài liệu đã có vẫn truy vấn được.
+    """
+    return f"user:{uid}:doc_status:{doc_id}"
+
+def _index_lock(uid):
+    return redis_client.lock(f"user:{uid}:index_lock", timeout=INDEX_LOCK_TIMEOUT, blocking_timeout=INDEX_LOCK_TIMEOUT)
+
+def _load_user_index(uid):
+    with STAGE_SECONDS.time("redis_read"):
+        data = redis_client.get(f"user:{uid}:vectorstore")
+    if not data:
+        return None
+    with STAGE_SECONDS.time("deserialize"):
+        index, _ = load_index(data)
+    # Các chunk mới được nối vào dưới dạng float32, cả chỉ mục được lượng tử hóa lại khi ghi
+    return dequantize_index(index)
+
+def _publish_index(uid, index, reason="updated"):
+    """
+    Dựng chỉ mục BM25, lượng tử hóa embedding (EMBEDDING_QUANTIZATION), serialize chỉ mục,
+    ghi vào Redis, tăng generation và báo cho các API instance loại cache cục bộ của uid.
+    """
+    with STAGE_SECONDS.time("lexical_index"):
+        build_lexical_index(index)
+    with STAGE_SECONDS.time("quantize"):
+        quantize_index(index)
+    with STAGE_SECONDS.time("serialize"):
+        serialized_vs = serialize_index(index)
+    PAYLOAD_BYTES.set(len(serialized_vs), "index")
+    with STAGE_SECONDS.time("redis_write"):
+        redis_client.set(f"user:{uid}:vectorstore", serialized_vs, ex=1800)
+
+    # Generation tăng dần toàn cục (không hết hạn) để các API instance
+    # nhận biết vectorstore trong cache cục bộ đã cũ sau khi người dùng tải lại.
+    generation = redis_client.incr("vectorstore:generation")
+    redis_client.set(f"user:{uid}:generation", generation, ex=1800)
+    publish_invalidation(redis_client, uid, generation, reason)
+    return generation
+
 @celery_app.task(bind=True)
-def process_document(self, file_content: bytes, uid):
+def process_document(self, blob_ref, uid, doc_id=None, append=False, filename=None):
     """
     Tác vụ Celery để xử lý tài liệu.
-    Tác vụ này nhận nội dung file dưới dạng bytes.
+    Tác vụ này nhận tham chiếu tới blob trong kho tạm (xem src/blob_store.py);
+    vẫn chấp nhận bytes trực tiếp cho các message cũ còn trong hàng đợi.
+    Với `append=True`, các chunk của tài liệu được nối vào chỉ mục hiện có của người dùng
+    (các tài liệu cũ không bị embed lại); ngược lại chỉ mục được thay thế.
     """
-    logger.info(f"Task {self.request.id}: Starting to process document for uid={uid}")
+    doc_id = doc_id or uuid.uuid4().hex
+    started = time.perf_counter()
+    logger.info(f"Task {self.request.id}: Starting to process document {doc_id} for uid={uid}")
+    # Trạng thái và tiến độ được đẩy tới client qua pub/sub (xem src/task_events.py)
+    task_events = TaskEventPublisher(redis_client, self.request.id, uid, doc_id)
+    task_events.publish("STARTED")
     
     try:
-        # Bước 1: Tải và chia nhỏ tài liệu từ nội dung bytes
-        docs = PDFLoader(file_content)
-        splitted_docs = SplittingDocuments(docs)
+        with STAGE_SECONDS.time("blob_read"):
+            file_content = blob_ref if isinstance(blob_ref, bytes) else read_blob(blob_ref, redis_client)
+        PAYLOAD_BYTES.set(len(file_content), "pdf")
 
-        # Bước 2: Tạo vector store
-        vectorstores = StoringDocuments(splitted_docs)
+        # Bước 1 + 2: Trích xuất, chia nhỏ và embed theo dạng luồng: các trang được
+        # chia chunk và gửi embed ngay khi sẵn sàng, tiến độ được ghi vào user:{uid}:status.
+        # Embedding đã có trong cache Redis được dùng lại, phần còn lại đi qua embedding_scheduler.
+        # Embedding cục bộ tính lại nhanh hơn đọc Redis: chỉ gộp các chunk trùng nhau.
+        embedder = CachedEmbeddings(
+            embedding_scheduler, None if LOCAL_EMBEDDINGS else redis_client, model_name=EMBEDDING_MODEL_NAME
+        )
+        status_key = document_status_key(uid, doc_id) if append else f"user:{uid}:status"
+        reporter = ProgressReporter(redis_client, uid, ttl=1800, task=self, events=task_events, key=status_key)
+        # "pdf_extract", "split" và "embed_batch" chồng lên nhau trong pipeline; "ingest" là tổng thời gian
+        with STAGE_SECONDS.time("ingest"):
+            index = ingest_pages(
+                STAGE_SECONDS.time_iter(iter_pages(file_content), "pdf_extract"),
+                SplittingDocuments,
+                embedder,
+                pages_total=count_pages(file_content),
+                on_progress=reporter,
+            )
+        tag_document(index, doc_id, filename)
         
-        # Bước 3: Serialize và lưu vector store vào Redis
-        serialized_vs = pickle.dumps(vectorstores)
-        redis_client.set(f"user:{uid}:vectorstore", serialized_vs, ex=1800)
+        # Bước 3: Serialize (định dạng nhị phân, xem src/rag/index_format.py) và lưu vào Redis.
+        # Embedding được chuẩn hóa sẵn để API dùng trực tiếp ma trận mà không cần sao chép.
+        # Tài liệu lớn: dựng thêm chỉ mục ANN (IVF) để lưu cùng các chunk
+        index.embeddings = normalize_rows(index.embeddings)
+        if append:
+            with _index_lock(uid):
+                base = _load_user_index(uid)
+                with STAGE_SECONDS.time("ann_index"):
+                    index = append_document(base, index)
+                _publish_index(uid, index, reason="appended")
+        else:
+            with STAGE_SECONDS.time("ann_index"):
+                index = append_document(None, index)
+            # Cùng khóa với thêm/xóa tài liệu: một thao tác đã đọc chỉ mục cũ không được ghi đè bản thay thế
+            with _index_lock(uid):
+                _publish_index(uid, index, reason="uploaded")
 
-        # Bước 4: Cập nhật trạng thái người dùng trong Redis
+        # Bước 4: Cập nhật trạng thái người dùng (và của tài liệu vừa thêm) trong Redis
         redis_client.set(f"user:{uid}:status", "ready", ex=1800)
+        if append:
+            redis_client.set(status_key, "ready", ex=1800)
         
-        logger.info(f"Task {self.request.id}: Successfully processed document for uid={uid}")
+        cache_stats = embedder.stats()
+        STAGE_SECONDS.observe(time.perf_counter() - started, "process_document")
+        EVENTS.inc("document_processed")
+        logger.info(
+            f"Task {self.request.id}: Successfully processed document {doc_id} for uid={uid} "
+            f"({len(index)} chunks in index, embedding cache hit ratio {cache_stats['hit_ratio']:.2f})"
+        )
 
-        return "success"
+        result = {
+            "status": "success",
+            "doc_id": doc_id,
+            "chunks": len(index),
+            "embedding_cache": cache_stats,
+        }
+        task_events.publish("SUCCESS", result)
+        return result
     except Exception as e:
         logger.error(f"Task {self.request.id}: Failed to process document for uid={uid} with error: {e}")
-        redis_client.set(f"user:{uid}:status", f"error: {str(e)}", ex=1800)
+        EVENTS.inc("document_failed")
+        if append:
+            redis_client.set(document_status_key(uid, doc_id), f"error: {str(e)}", ex=1800)
+        if append and redis_client.exists(f"user:{uid}:vectorstore"):
+            # Các tài liệu đã có vẫn truy vấn được
+            redis_client.set(f"user:{uid}:status", "ready", ex=1800)
+        else:
+            redis_client.set(f"user:{uid}:status", f"error: {str(e)}", ex=1800)
         self.update_state(state='FAILURE', meta={'exc': str(e)})
+        task_events.publish("FAILURE", {'exc': str(e)})
         raise e
+    finally:
+        # Blob chỉ cần cho lần xử lý này
+        if isinstance(blob_ref, str):
+            delete_blob(blob_ref, redis_client)
+
+@celery_app.task(bind=True)
+def delete_document(self, uid, doc_id):
+    """Xóa một tài liệu khỏi chỉ mục của người dùng và nén chỉ mục lại (không embed lại)."""
+    with _index_lock(uid):
+        index = _load_user_index(uid)
+        if index is None:
+            return {"status": "not_found", "doc_id": doc_id}
+        compacted = remove_document(index, doc_id)
+        if compacted is None:
+            return {"status": "not_found", "doc_id": doc_id}
+        _publish_index(uid, compacted, reason="deleted")
+    logger.info(f"Task {self.request.id}: Removed document {doc_id} for uid={uid} ({len(compacted)} chunks left)")
+    return {"status": "success", "doc_id": doc_id, "chunks": len(compacted)}
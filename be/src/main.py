@@ -1,20 +1,38 @@
 import asyncio
 import json
+from contextlib import aclosing
 import logging
-import pickle  # Dùng để serialize/deserialize vectorstore
-import time
 import os  # Thêm import os để quản lý file
-from typing import Annotated, Union
-from fastapi import FastAPI, Form, UploadFile, HTTPException
+import time
+import uuid
+from typing import Annotated, List, Union
+from fastapi import FastAPI, Form, Request, UploadFile, HTTPException, WebSocket
 from fastapi.concurrency import asynccontextmanager
 from fastapi.datastructures import FormData
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from celery.result import AsyncResult
 from redis.asyncio import Redis as AsyncRedis
 from redis import Redis
-from src.celery_worker import process_document
-from src.rag.preprocess import QuotaRateLimit, RetrieveDocument
+from src.answer_cache import ANSWER_CACHE_ENABLED, SemanticAnswerCache
+from src.blob_store import MAX_UPLOAD_BYTES, BlobTooLarge, delete_blob_async, save_upload
+from src.cache import VectorStoreCache
+from src.cache_events import CACHE_EVENTS_ENABLED, CacheInvalidationListener
+from src.metrics import CONTENT_TYPE, PAYLOAD_BYTES, REQUEST_SECONDS, STAGE_SECONDS, load_worker_snapshots, registry
+from src.request_prelude import PreludeResult, run_prelude
+from src.celery_worker import delete_document, document_status_key, process_document
+from src.task_events import TASK_EVENTS_ENABLED, TaskEventHub, parse_task_event, task_event_key, task_event_stream
+from src.rag.index_format import load_index, serialize_index
+from src.rag.collection import list_documents
+from src.rag.concurrency import llm_limiter
+from src.rag.embedding_cache import QueryEmbeddingCache, normalize_text
+from src.rag.embedding_scheduler import is_rate_limit_error
+from src.rag.preprocess import (
+    EMBEDDING_BACKEND, EMBEDDING_MODEL_NAME, LOCAL_EMBEDDINGS, QuotaRateLimit, GenerateAnswer, RetrieveDocumentStream,
+    embedding_scheduler, embeddings,
+)
+from src.rag.search import RETRIEVAL_MODES, NumpyRetriever, VectorSearchEngine
 import dotenv
 dotenv.load_dotenv()
 USE_MOCK_EMBEDDINGS = os.environ.get("USE_MOCK_EMBEDDINGS", "False").lower() in ("true", "1", "t")
@@ -27,20 +45,203 @@ logger = logging.getLogger(__name__)
 # 1800 giây = 30 phút.
 INACTIVITY_TTL = 1800
 
+# Ngân sách bộ nhớ (byte) cho cache vectorstore cục bộ của mỗi tiến trình API.
+VECTORSTORE_CACHE_MAX_BYTES = int(os.environ.get("VECTORSTORE_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+# Số câu hỏi tối đa trong một request /api/v1/retrieve/batch và số câu trả lời được sinh song song.
+BATCH_MAX_QUESTIONS = int(os.environ.get("BATCH_MAX_QUESTIONS", 50))
+BATCH_MAX_CONCURRENCY = int(os.environ.get("BATCH_MAX_CONCURRENCY", 8))
+# Dùng chung embedding câu hỏi giữa các instance API qua Redis (ngoài LRU trong tiến trình).
+# Mặc định tắt với embedding cục bộ (tính lại nhanh hơn một round trip Redis).
+QUERY_EMBEDDING_CACHE_REDIS = os.environ.get(
+    "QUERY_EMBEDDING_CACHE_REDIS", "False" if LOCAL_EMBEDDINGS else "True"
+).lower() in ("true", "1", "t")
+
 async_redis_client = AsyncRedis(host="redis", port=6379, db=1, decode_responses=True)
 async_redis_binary_client = AsyncRedis(host="redis", port=6379, db=1, decode_responses=False)
 
 # Cache cục bộ để lưu trữ vectorstore đã được giải mã,
 # giúp tránh việc tải và giải mã lại nhiều lần.
-users_vectorstores_cache = {}
+# Giới hạn theo byte, loại bỏ theo LRU và theo INACTIVITY_TTL giống các key trong Redis.
+users_vectorstores_cache = VectorStoreCache(max_bytes=VECTORSTORE_CACHE_MAX_BYTES, ttl=INACTIVITY_TTL)
+
+# Cache embedding câu hỏi (LRU cục bộ + Redis), dùng cho mọi lần truy xuất.
+query_embeddings = QueryEmbeddingCache(
+    embeddings,
+    model_name=EMBEDDING_MODEL_NAME,
+    async_redis_client=async_redis_binary_client if QUERY_EMBEDDING_CACHE_REDIS else None,
+    # Lô câu hỏi của /api/v1/retrieve/batch đi qua scheduler (quota, thử lại khi gặp 429)
+    batch_embedder=embedding_scheduler,
+)
+
+# Cache câu trả lời theo độ tương đồng của câu hỏi, theo uid và generation của tài liệu.
+answer_cache = SemanticAnswerCache()
+# Chỉ dùng lại câu trả lời của đúng câu hỏi đó (sau chuẩn hóa). Bật mặc định với embedding giả lập:
+# MockEmbeddings trả về cùng một vector cho mọi câu hỏi nên độ tương đồng luôn là 1.
+ANSWER_CACHE_EXACT = os.environ.get(
+    "ANSWER_CACHE_EXACT", "True" if EMBEDDING_BACKEND == "mock" else "False"
+).lower() in ("true", "1", "t")
+# Phạm vi riêng cho câu trả lời soạn sẵn của /api/v1/retrieve/mock
+MOCK_ANSWER_SCOPE = "mock"
+
+# Listener sự kiện loại cache (worker + hết hạn key trong Redis), được khởi động trong lifespan.
+cache_events_listener: CacheInvalidationListener = None
+
+# Subscriber dùng chung cho sự kiện trạng thái task (thay cho polling task_status), khởi động trong lifespan.
+task_event_hub: TaskEventHub = None
+
+def invalidate_user_caches(uid: str, generation: str = None, reason: str = None):
+    """
+    Loại vectorstore và câu trả lời đã cache của `uid`. Với `generation`, các entry đã ở
+    đúng generation đó (instance này đã tải bản mới trước khi nhận sự kiện) được giữ lại.
+    """
+    dropped = users_vectorstores_cache.invalidate(uid, generation)
+    answer_cache.invalidate(uid, generation)
+    if dropped:
+        logger.info(f"Đã loại vectorstore cục bộ của uid={uid} ({reason}).")
+
+def clear_local_caches():
+    users_vectorstores_cache.clear()
+    answer_cache.clear()
+
+async def get_user_vectorstore(uid: str, prelude: PreludeResult = None):
+    """
+    Lấy bộ máy tìm kiếm (VectorSearchEngine) của người dùng: ưu tiên cache cục bộ,
+    nếu chưa có thì tải chỉ mục nhị phân từ Redis (np.frombuffer, không sao chép embedding).
+    Payload pickle cũ được chuyển đổi và ghi lại theo định dạng mới.
+    Entry trong cache có generation khác với `user:{uid}:generation` được coi là cũ.
+    Nếu có `prelude` (xem check_retrieve_request), generation và payload đã đọc sẵn được dùng lại.
+    """
+    if prelude is not None:
+        generation = prelude.generation
+    else:
+        generation = await async_redis_client.get(f"user:{uid}:generation")
+    vectorstore = users_vectorstores_cache.get(uid, generation)
+    if vectorstore is not None:
+        # BM25 và bảng từ được dựng lười ở các lần truy xuất trước: đo lại dung lượng trong cache
+        users_vectorstores_cache.resize(uid, vectorstore.nbytes())
+        return vectorstore
+
+    # Nếu chưa có trong cache, tải từ Redis và giải mã
+    key = f"user:{uid}:vectorstore"
+    if prelude is not None and prelude.payload is not None:
+        serialized_vectorstore = prelude.payload
+    else:
+        with STAGE_SECONDS.time("redis_read"):
+            serialized_vectorstore = await async_redis_binary_client.get(key)
+
+    if not serialized_vectorstore:
+        raise HTTPException(status_code=404, detail="Vectorstore data not found in Redis.")
+
+    PAYLOAD_BYTES.set(len(serialized_vectorstore), "index_loaded")
+    with STAGE_SECONDS.time("deserialize"):
+        index, legacy = await asyncio.to_thread(load_index, serialized_vectorstore)
+        if legacy:
+            migrated = await asyncio.to_thread(serialize_index, index)
+            await async_redis_binary_client.set(key, migrated, keepttl=True)
+
+        vectorstore = VectorSearchEngine(index)
+
+    # Lưu vào cache để sử dụng cho các lần sau
+    users_vectorstores_cache.put(uid, vectorstore, size=vectorstore.nbytes(), generation=generation)
+    return vectorstore
+
+async def embed_query_async(query_text: str):
+    """Embed câu hỏi qua cache embedding câu hỏi, không chặn event loop."""
+    with STAGE_SECONDS.time("embed_query"):
+        return await query_embeddings.aembed_query(query_text)
+
+def document_filter(doc_ids):
+    """Bộ lọc metadata và phạm vi cache câu trả lời cho danh sách doc_id (None = mọi tài liệu)."""
+    if not doc_ids:
+        return None, None
+    return {"doc_id": list(doc_ids)}, tuple(sorted(set(doc_ids)))
+
+def check_retrieval_mode(mode):
+    if mode is not None and mode not in RETRIEVAL_MODES:
+        raise HTTPException(status_code=400, detail=f"Unknown retrieval mode, expected one of {', '.join(RETRIEVAL_MODES)}.")
+
+def answer_cache_scope(query_text: str, scope=None):
+    """Phạm vi của câu hỏi trong cache câu trả lời; với ANSWER_CACHE_EXACT gồm cả câu hỏi đã chuẩn hóa."""
+    if ANSWER_CACHE_EXACT:
+        return (scope, normalize_text(query_text).lower())
+    return scope
+
+async def answer_with_cache(uid: str, query_text: str, answer, generation: str = None, scope=None):
+    """
+    Trả lời qua cache ngữ nghĩa: embed câu hỏi một lần, trả về câu trả lời đã lưu nếu có câu hỏi
+    đủ giống (trong cùng phạm vi tài liệu `scope`), ngược lại gọi `answer(query_vector)` rồi lưu
+    kết quả theo `generation` của tài liệu.
+    """
+    query_vector = await embed_query_async(query_text)
+    if not ANSWER_CACHE_ENABLED:
+        return await answer(query_vector)
+    scope = answer_cache_scope(query_text, scope)
+    cached = answer_cache.lookup(uid, generation, query_vector, scope=scope)
+    if cached is not None:
+        return cached
+    result = await answer(query_vector)
+    answer_cache.store(uid, generation, query_vector, query_text, result, scope=scope)
+    return result
+
+async def check_rate_limit(uid: str, scope: str, detail: str, **kwargs) -> PreludeResult:
+    """
+    Chạy prelude (rate-limit + kiểm tra trạng thái + làm mới TTL + tải payload) trong một
+    round trip Redis. Ném HTTPException tương ứng nếu request bị từ chối.
+    """
+    with STAGE_SECONDS.time("prelude"):
+        prelude = await run_prelude(async_redis_binary_client, uid, scope, ttl=INACTIVITY_TTL, **kwargs)
+    if prelude.outcome == "limited":
+        raise HTTPException(
+            status_code=429, detail=detail, headers={"Retry-After": str(max(1, round(prelude.retry_after)))}
+        )
+    return prelude
+
+async def check_retrieve_request(uid: str, fetch_payload: bool = True) -> PreludeResult:
+    """
+    Rate-limit (mặc định 3 giây giữa hai câu hỏi) và kiểm tra tài liệu của người dùng đã sẵn sàng.
+    Chỉ tải payload chỉ mục khi cache cục bộ không có đúng generation hiện tại.
+    """
+    prelude = await check_rate_limit(
+        uid,
+        "retrieve",
+        "Too many requests. Please wait before asking another question.",
+        fetch_payload=fetch_payload,
+        cached_generation=users_vectorstores_cache.peek_generation(uid),
+    )
+    if prelude.outcome == "missing":
+        raise HTTPException(status_code=404, detail="User session not found. Please upload a document first.")
+    if prelude.outcome == "not_ready":
+        raise HTTPException(status_code=400, detail="Document is still being processed. Please wait.")
+    return prelude
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    global cache_events_listener, task_event_hub
     scheduler = AsyncIOScheduler(timezone="Asia/Ho_Chi_Minh")
+    # Định kỳ dọn các vectorstore không còn được truy cập trong INACTIVITY_TTL
+    scheduler.add_job(users_vectorstores_cache.evict_expired, "interval", seconds=60)
+    scheduler.start()
+    # Nhận sự kiện tải lại/xóa tài liệu từ worker và thông báo hết hạn key để giữ cache
+    # cục bộ nhất quán giữa các instance; khi mất kết nối thì xóa toàn bộ cache cục bộ.
+    if CACHE_EVENTS_ENABLED:
+        cache_events_listener = CacheInvalidationListener(
+            async_redis_client, invalidate_user_caches, on_reset=clear_local_caches
+        )
+        cache_events_listener.start()
+    # Một kết nối pub/sub cho mọi client đang theo dõi tiến độ xử lý tài liệu trên instance này
+    if TASK_EVENTS_ENABLED:
+        task_event_hub = TaskEventHub(async_redis_client)
+        task_event_hub.start()
     try:
         yield
     finally:
-        pass
+        if cache_events_listener is not None:
+            await cache_events_listener.stop()
+            cache_events_listener = None
+        if task_event_hub is not None:
+            await task_event_hub.stop()
+            task_event_hub = None
+        scheduler.shutdown(wait=False)
 
 # Khởi tạo FastAPI app
 app = FastAPI(lifespan=lifespan)
@@ -55,6 +256,39 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+def format_sse(event: str, data) -> str:
+    """Định dạng một sự kiện Server-Sent Events với dữ liệu JSON."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+# Phần dư cho phép của body multipart ngoài nội dung file (boundary, header, trường uid)
+_MULTIPART_OVERHEAD = 64 * 1024
+
+@app.middleware("http")
+async def reject_oversized_uploads(request: Request, call_next):
+    """Từ chối sớm dựa trên Content-Length, trước khi body được đọc và phân tích."""
+    if request.url.path == "/api/v1/document":
+        content_length = request.headers.get("content-length")
+        if content_length and content_length.isdigit() and int(content_length) > MAX_UPLOAD_BYTES + _MULTIPART_OVERHEAD:
+            return JSONResponse(
+                status_code=413,
+                content={"detail": f"File exceeds the {MAX_UPLOAD_BYTES} bytes upload limit."},
+            )
+    return await call_next(request)
+
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    """Thời gian xử lý request theo route (mẫu đường dẫn, không theo uid/doc_id cụ thể)."""
+    started = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    REQUEST_SECONDS.observe(
+        time.perf_counter() - started,
+        request.method,
+        route.path if route is not None else "unmatched",
+        str(response.status_code),
+    )
+    return response
+
 # Endpoint test
 @app.get("/")
 def read_root():
@@ -62,91 +296,114 @@ def read_root():
 
 # Endpoint xử lý tải file
 @app.post("/api/v1/document")
-async def get_document_from_client(file: UploadFile | None, uid: Annotated[str, Form()]):
+async def get_document_from_client(
+    file: UploadFile | None, uid: Annotated[str, Form()], append: Annotated[bool, Form()] = False
+):
+    """
+    Nhận PDF và xử lý nền. Mặc định tài liệu mới thay thế bộ sưu tập của người dùng;
+    với `append=true`, tài liệu được thêm vào bộ sưu tập (các tài liệu cũ không bị embed lại).
+    """
     if not file:
         raise HTTPException(status_code=400, detail="No upload file sent")
     
-    # --- Bắt đầu logic Rate-Limiting ---
-    # Đọc thời gian yêu cầu gần nhất từ Redis
-    last_request_time_str = await async_redis_client.get(f"user:{uid}:doc_last_request")
-    current_time = time.time()
-    
-    if last_request_time_str:
-        last_request_time = float(last_request_time_str)
-        # Kiểm tra nếu thời gian giữa hai yêu cầu nhỏ hơn 3 giây
-        if (current_time - last_request_time) < 3:
-            raise HTTPException(status_code=429, detail="Too many requests. Please wait before uploading another document.")
-    
-    # Cập nhật thời gian yêu cầu gần nhất
-    await async_redis_client.set(f"user:{uid}:doc_last_request", current_time, ex=INACTIVITY_TTL)
-    # --- Kết thúc logic Rate-Limiting ---
+    await check_rate_limit(
+        uid, "doc", "Too many requests. Please wait before uploading another document.", check_status=False
+    )
 
+    # Ghi file vào kho blob theo từng khối; chỉ tham chiếu được gửi qua Celery
     try:
-        contents = await file.read()
-        
-        # Gửi trực tiếp nội dung bytes đến Celery worker
-        task = process_document.delay(contents, uid)
-            
-        await async_redis_client.set(f"user:{uid}:status", "processing", ex=INACTIVITY_TTL)
+        with STAGE_SECONDS.time("blob_write"):
+            blob_ref = await save_upload(file, async_redis_binary_client)
+    except BlobTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+    try:
+        doc_id = uuid.uuid4().hex
+        # Thêm tài liệu: các tài liệu đã có vẫn truy vấn được, chỉ tài liệu mới mang trạng thái "processing".
+        # Cache cục bộ được loại khi worker ghi chỉ mục mới (xem src/cache_events.py).
+        keep_serving = append and await async_redis_client.exists(f"user:{uid}:vectorstore")
+        if keep_serving:
+            await async_redis_client.set(document_status_key(uid, doc_id), "processing", ex=INACTIVITY_TTL)
+        else:
+            await async_redis_client.set(f"user:{uid}:status", "processing", ex=INACTIVITY_TTL)
+        task = process_document.delay(blob_ref, uid, doc_id, append, file.filename)
+        if not keep_serving:
+            users_vectorstores_cache.invalidate(uid)
+            answer_cache.invalidate(uid)
         
         return {
             'status': 202,
             'message': 'Upload accepted, processing in background.',
-            'task_id': task.id
+            'task_id': task.id,
+            'doc_id': doc_id
         }
     except Exception as e:
         logger.error(f"Error processing document upload: {e}")
+        await delete_blob_async(blob_ref, async_redis_binary_client)
         raise HTTPException(status_code=500, detail=f"Upload failed: {e}")
 
-# Endpoint lấy thông tin
-@app.post('/api/v1/retrieve')
-async def retrieve_documents(query_text: Annotated[str, Form()], uid: Annotated[str, Form()]):
-    # --- Bắt đầu logic Rate-Limiting ---
-    # Đọc thời gian yêu cầu gần nhất từ Redis
-    last_request_time_str = await async_redis_client.get(f"user:{uid}:retrieve_last_request")
-    current_time = time.time()
-    
-    if last_request_time_str:
-        last_request_time = float(last_request_time_str)
-        # Kiểm tra nếu thời gian giữa hai yêu cầu nhỏ hơn 3 giây
-        if (current_time - last_request_time) < 3:
-            raise HTTPException(status_code=429, detail="Too many requests. Please wait before asking another question.")
-    
-    # Cập nhật thời gian yêu cầu gần nhất
-    await async_redis_client.set(f"user:{uid}:retrieve_last_request", current_time, ex=INACTIVITY_TTL)
-    # --- Kết thúc logic Rate-Limiting ---
-
-    status = await async_redis_client.get(f"user:{uid}:status")
-    
-    if status is None:
+@app.delete("/api/v1/document/{doc_id}")
+async def delete_document_from_collection(doc_id: str, uid: str):
+    """Xóa một tài liệu khỏi bộ sưu tập của người dùng (xử lý nền, không embed lại các tài liệu còn lại)."""
+    prelude = await check_rate_limit(
+        uid, "doc", "Too many requests. Please wait before changing your documents."
+    )
+    if prelude.outcome == "missing":
         raise HTTPException(status_code=404, detail="User session not found. Please upload a document first.")
-    
-    if status != "ready":
+    if prelude.outcome == "not_ready":
         raise HTTPException(status_code=400, detail="Document is still being processed. Please wait.")
+
+    task = delete_document.delay(uid, doc_id)
+    return {
+        'status': 202,
+        'message': 'Delete accepted, processing in background.',
+        'task_id': task.id
+    }
+
+@app.get("/api/v1/document/{doc_id}/status")
+async def get_document_status(doc_id: str, uid: str):
+    """Trạng thái của một tài liệu đang được thêm vào bộ sưu tập (processing, ready hoặc error)."""
+    status = await async_redis_client.get(document_status_key(uid, doc_id))
+    if status is None:
+        raise HTTPException(status_code=404, detail="Document status not found.")
+    return {'status': 200, 'doc_id': doc_id, 'document_status': status}
+
+@app.get("/api/v1/documents")
+async def get_documents(uid: str):
+    """Các tài liệu trong bộ sưu tập của người dùng (số chunk, số trang, tên file)."""
+    vectorstore = await get_user_vectorstore(uid)
+    documents = list_documents(vectorstore.index)
+    return {
+        'status': 200,
+        'documents': [{'doc_id': doc_id, **info} for doc_id, info in documents.items()]
+    }
+
+# Endpoint lấy thông tin
+@app.post('/api/v1/retrieve')
+async def retrieve_documents(
+    query_text: Annotated[str, Form()],
+    uid: Annotated[str, Form()],
+    doc_ids: Annotated[List[str] | None, Form()] = None,
+    mode: Annotated[str | None, Form()] = None,
+):
+    check_retrieval_mode(mode)
+    prelude = await check_retrieve_request(uid)
+    search_filter, scope = document_filter(doc_ids)
     
     try:
         # Tối ưu hóa hiệu suất: Kiểm tra cache cục bộ trước
-        vectorstore = users_vectorstores_cache.get(uid)
-        
-        if not vectorstore:
-            # Nếu chưa có trong cache, tải từ Redis và giải mã
-            serialized_vectorstore = await async_redis_binary_client.get(f"user:{uid}:vectorstore")
-            
-            if not serialized_vectorstore:
-                raise HTTPException(status_code=404, detail="Vectorstore data not found in Redis.")
-            
-            def deserialize_vectorstore_sync(data):
-                return pickle.loads(data)
-
-            vectorstore = await asyncio.to_thread(deserialize_vectorstore_sync, serialized_vectorstore)
-            
-            # Lưu vào cache để sử dụng cho các lần sau
-            users_vectorstores_cache[uid] = vectorstore
-        retriever = vectorstore
-        if not USE_MOCK_EMBEDDINGS:
-            retriever = vectorstore.as_retriever()
-        
-        result = await asyncio.to_thread(RetrieveDocument, query_text, retriever)
+        vectorstore = await get_user_vectorstore(uid, prelude)
+        mode, hits = vectorstore.keyword_search(query_text, mode, filter=search_filter)
+
+        if hits is not None:
+            # Tra cứu từ khóa: không cần embed câu hỏi (và do đó bỏ qua cache ngữ nghĩa)
+            result = await GenerateAnswer(query_text, [doc for doc, _ in hits])
+        else:
+            async def answer(query_vector):
+                hits = vectorstore.similarity_search(query_text, query_vector, mode, filter=search_filter)
+                return await GenerateAnswer(query_text, [doc for doc, _ in hits])
+
+            result = await answer_with_cache(uid, query_text, answer, prelude.generation, (scope, mode))
 
         return {
             'status': 200,
@@ -159,6 +416,112 @@ async def retrieve_documents(query_text: Annotated[str, Form()], uid: Annotated[
         logger.error(f"Error retrieving document: {e}")
         raise HTTPException(status_code=500, detail=f"Error processing request: {str(e)}")
 
+@app.post('/api/v1/retrieve/batch')
+async def retrieve_documents_batch(
+    questions: Annotated[List[str], Form()],
+    uid: Annotated[str, Form()],
+    doc_ids: Annotated[List[str] | None, Form()] = None,
+):
+    """
+    Trả lời nhiều câu hỏi trên cùng tài liệu trong một request (tính là một lượt rate-limit).
+    Mọi câu hỏi được embed trong một lần gọi và chấm điểm bằng một phép nhân ma trận;
+    câu trả lời được sinh song song (tối đa BATCH_MAX_CONCURRENCY). Lỗi của từng câu hỏi
+    được trả về trong kết quả của câu đó thay vì làm hỏng cả request.
+    """
+    if not questions:
+        raise HTTPException(status_code=400, detail="No questions sent")
+    if len(questions) > BATCH_MAX_QUESTIONS:
+        raise HTTPException(status_code=400, detail=f"Too many questions, the limit is {BATCH_MAX_QUESTIONS}.")
+
+    prelude = await check_retrieve_request(uid)
+    search_filter, scope = document_filter(doc_ids)
+
+    try:
+        vectorstore = await get_user_vectorstore(uid, prelude)
+        query_vectors = await query_embeddings.aembed_queries(questions)
+        search_results = vectorstore.similarity_search_with_score_by_vectors(query_vectors, filter=search_filter)
+    except HTTPException:
+        raise
+    except QuotaRateLimit:
+        raise HTTPException(status_code=429, detail="Rate limit exceeded, please wait.")
+    except Exception as e:
+        logger.error(f"Error retrieving documents for batch: {e}")
+        raise HTTPException(status_code=500, detail=f"Error processing request: {str(e)}")
+
+    semaphore = asyncio.Semaphore(BATCH_MAX_CONCURRENCY)
+
+    async def answer_one(question, query_vector, hits):
+        # Cùng khóa với /api/v1/retrieve ở chế độ dense, để câu trả lời được dùng chung giữa hai endpoint
+        cache_scope = answer_cache_scope(question, (scope, "dense"))
+        if ANSWER_CACHE_ENABLED:
+            cached = answer_cache.lookup(uid, prelude.generation, query_vector, scope=cache_scope)
+            if cached is not None:
+                return {'status': 200, 'question': question, 'message': cached}
+        try:
+            async with semaphore:
+                message = await GenerateAnswer(question, [doc for doc, _ in hits])
+        except Exception as e:
+            if is_rate_limit_error(e):
+                return {'status': 429, 'question': question, 'error': "Rate limit exceeded, please wait."}
+            logger.error(f"Error answering batch question: {e}")
+            return {'status': 500, 'question': question, 'error': f"Error processing request: {str(e)}"}
+        if ANSWER_CACHE_ENABLED:
+            answer_cache.store(uid, prelude.generation, query_vector, question, message, scope=cache_scope)
+        return {'status': 200, 'question': question, 'message': message}
+
+    results = await asyncio.gather(
+        *(answer_one(q, v, hits) for q, v, hits in zip(questions, query_vectors, search_results))
+    )
+    return {
+        'status': 200,
+        'results': results
+    }
+
+@app.post('/api/v1/retrieve/stream')
+async def retrieve_documents_stream(
+    request: Request,
+    query_text: Annotated[str, Form()],
+    uid: Annotated[str, Form()],
+    doc_ids: Annotated[List[str] | None, Form()] = None,
+    mode: Annotated[str | None, Form()] = None,
+):
+    """
+    Trả lời dạng Server-Sent Events: sự kiện "sources" (các chunk được truy xuất) được gửi trước,
+    sau đó là các sự kiện "token" ngay khi LLM sinh ra, và cuối cùng là "done" (hoặc "error").
+    Khi client ngắt kết nối, lời gọi LLM đang chạy bị hủy.
+    """
+    check_retrieval_mode(mode)
+    prelude = await check_retrieve_request(uid)
+    vectorstore = await get_user_vectorstore(uid, prelude)
+    search_filter, _ = document_filter(doc_ids)
+    retriever = NumpyRetriever(engine=vectorstore, embeddings=query_embeddings, filter=search_filter, mode=mode)
+
+    async def event_stream():
+        async with aclosing(RetrieveDocumentStream(query_text, retriever)) as events:
+            try:
+                async for kind, payload in events:
+                    if await request.is_disconnected():
+                        logger.info(f"Client của uid={uid} đã ngắt kết nối, hủy việc sinh câu trả lời.")
+                        return
+                    if kind == "sources":
+                        payload = [
+                            {"id": doc.id, "metadata": doc.metadata, "page_content": doc.page_content}
+                            for doc in payload
+                        ]
+                    yield format_sse(kind, payload)
+                yield format_sse("done", {"question": query_text})
+            except QuotaRateLimit:
+                yield format_sse("error", {"status": 429, "detail": "Rate limit exceeded, please wait."})
+            except Exception as e:
+                logger.error(f"Error streaming answer: {e}")
+                yield format_sse("error", {"status": 500, "detail": f"Error processing request: {str(e)}"})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 @app.post('/api/v1/retrieve/mock')
 async def retrieve_documents_mock(query_text: Annotated[str, Form()], uid: Annotated[str, Form()]):
     """
@@ -169,58 +532,23 @@ async def retrieve_documents_mock(query_text: Annotated[str, Form()], uid: Annot
     
     
 
-    # --- Bắt đầu logic Rate-Limiting ---
-    # Đọc thời gian yêu cầu gần nhất từ Redis
-    last_request_time_str = await async_redis_client.get(f"user:{uid}:retrieve_last_request")
-    current_time = time.time()
-    
-    if last_request_time_str:
-        last_request_time = float(last_request_time_str)
-        # Kiểm tra nếu thời gian giữa hai yêu cầu nhỏ hơn 3 giây
-        if (current_time - last_request_time) < 3:
-            raise HTTPException(status_code=429, detail="Too many requests. Please wait before asking another question.")
-    
-    # Cập nhật thời gian yêu cầu gần nhất
-    await async_redis_client.set(f"user:{uid}:retrieve_last_request", current_time, ex=INACTIVITY_TTL)
-    # --- Kết thúc logic Rate-Limiting ---
-
-    status = await async_redis_client.get(f"user:{uid}:status")
-    
-    if status is None:
-        raise HTTPException(status_code=404, detail="User session not found. Please upload a document first.")
-    
-    if status != "ready":
-        raise HTTPException(status_code=400, detail="Document is still being processed. Please wait.")
+    prelude = await check_retrieve_request(uid)
     
     try:
-        # Tối ưu hóa hiệu suất: Kiểm tra cache cục bộ trước
-        vectorstore = users_vectorstores_cache.get(uid)
-        
-        if not vectorstore:
-            # Nếu chưa có trong cache, tải từ Redis và giải mã
-            serialized_vectorstore = await async_redis_binary_client.get(f"user:{uid}:vectorstore")
-            
-            if not serialized_vectorstore:
-                raise HTTPException(status_code=404, detail="Vectorstore data not found in Redis.")
-            
-            def deserialize_vectorstore_sync(data):
-                return pickle.loads(data)
-
-            vectorstore = await asyncio.to_thread(deserialize_vectorstore_sync, serialized_vectorstore)
-            
-            # Lưu vào cache để sử dụng cho các lần sau
-            users_vectorstores_cache[uid] = vectorstore
-        
+        async def answer(query_vector):
+            # Tối ưu hóa hiệu suất: Kiểm tra cache cục bộ trước
+            await get_user_vectorstore(uid, prelude)
+
+            # Dữ liệu giả lập cho phản hồi
+            mock_responses = {
+                "default": "Đây là một câu trả lời giả lập. Vui lòng kiểm tra lại câu hỏi của bạn.",
+                "tên của tôi là gì?": "Tên của bạn là Nguyễn Văn A.",
+                "tôi đang ở đâu?": "Bạn đang ở Thành phố Hồ Chí Minh."
+            }
+            return mock_responses.get(query_text.lower(), mock_responses["default"])
 
-        # Dữ liệu giả lập cho phản hồi
-        mock_responses = {
-            "default": "Đây là một câu trả lời giả lập. Vui lòng kiểm tra lại câu hỏi của bạn.",
-            "tên của tôi là gì?": "Tên của bạn là Nguyễn Văn A.",
-            "tôi đang ở đâu?": "Bạn đang ở Thành phố Hồ Chí Minh."
-        }
-        
         # Trả về phản hồi giả lập
-        response_message = mock_responses.get(query_text.lower(), mock_responses["default"])
+        response_message = await answer_with_cache(uid, query_text, answer, prelude.generation, MOCK_ANSWER_SCOPE)
         
         return {
             'status': 200,
@@ -233,8 +561,59 @@ async def retrieve_documents_mock(query_text: Annotated[str, Form()], uid: Annot
         logger.error(f"Error retrieving document: {e}")
         raise HTTPException(status_code=500, detail=f"Error processing request: {str(e)}")
 
-@app.get("/api/v1/task_status")
-async def get_task_status(task_id: str):
+@app.get("/api/v1/cache/stats")
+async def get_cache_stats():
+    """Thống kê cache vectorstore cục bộ (hit/miss/eviction) và sự kiện loại cache đã nhận."""
+    stats = users_vectorstores_cache.stats()
+    if cache_events_listener is not None:
+        stats["invalidation_events"] = cache_events_listener.stats()
+    return stats
+
+@app.get("/api/v1/query_embedding_cache/stats")
+async def get_query_embedding_cache_stats():
+    """Thống kê cache embedding câu hỏi (hit theo tầng, thời gian tiết kiệm được)."""
+    return query_embeddings.stats()
+
+@app.get("/api/v1/answer_cache/stats")
+async def get_answer_cache_stats():
+    """Thống kê cache câu trả lời ngữ nghĩa (hit-rate, số entry, eviction)."""
+    return answer_cache.stats()
+
+@app.get("/api/v1/llm/stats")
+async def get_llm_stats():
+    """Số lời gọi LLM đang chạy và đang chờ trên tiến trình này."""
+    return {
+        "limit": llm_limiter.limit,
+        "in_flight": llm_limiter.in_flight,
+        "waiting": llm_limiter.waiting,
+    }
+
+def _cache_gauges():
+    """Thống kê các cache và LLM của tiến trình, được tính lúc xuất /metrics."""
+    vectorstores = users_vectorstores_cache.stats()
+    yield "simplrag_vectorstore_cache_bytes", "gauge", "Dung lượng cache vectorstore cục bộ.", {}, vectorstores["bytes"]
+    yield "simplrag_vectorstore_cache_entries", "gauge", "Số vectorstore trong cache cục bộ.", {}, vectorstores["entries"]
+    for name, cache in (("vectorstore", vectorstores), ("answer", answer_cache.stats())):
+        yield "simplrag_cache_hits_total", "counter", "Số lần hit theo cache.", {"cache": name}, cache["hits"]
+        yield "simplrag_cache_misses_total", "counter", "Số lần miss theo cache.", {"cache": name}, cache["misses"]
+    yield "simplrag_llm_in_flight", "gauge", "Số lời gọi LLM đang chạy.", {}, llm_limiter.in_flight
+    yield "simplrag_llm_waiting", "gauge", "Số lời gọi LLM đang chờ.", {}, llm_limiter.waiting
+    if task_event_hub is not None:
+        yield "simplrag_task_event_watchers", "gauge", "Số client đang theo dõi sự kiện task.", {}, task_event_hub.watchers
+
+registry.add_collector(_cache_gauges)
+
+@app.get("/metrics")
+async def get_metrics():
+    """Chỉ số của tiến trình API và của các worker (đẩy qua Redis) theo định dạng Prometheus."""
+    try:
+        workers = await load_worker_snapshots(async_redis_binary_client)
+    except Exception as e:
+        logger.warning(f"Không đọc được chỉ số của worker: {e}")
+        workers = {}
+    return PlainTextResponse(registry.render(workers), media_type=CONTENT_TYPE)
+
+def _celery_task_status(task_id: str):
     task_result = AsyncResult(task_id, app=process_document)
     
     if task_result.ready():
@@ -242,10 +621,95 @@ async def get_task_status(task_id: str):
         result = task_result.result
     else:
         status = "Processing"
-        result = None
+        # Tiến độ (số trang đã trích xuất, số chunk đã embed) do process_document ghi lại
+        result = task_result.info if task_result.state == "PROGRESS" else None
         
     return {
         "task_id": task_id,
         "status": status,
         "result": result
     }
+
+@app.get("/api/v1/task_status")
+async def get_task_status(task_id: str):
+    """
+    Trạng thái của task theo kiểu polling. Ưu tiên sự kiện mới nhất do worker ghi lại (một lệnh GET
+    không chặn event loop); chỉ hỏi result backend của Celery (đồng bộ, chạy trong thread pool)
+    khi task chưa có sự kiện nào (vd. task xóa tài liệu hoặc task chưa được worker nhận).
+    Client nên dùng /api/v1/task_events (SSE) hoặc WebSocket /api/v1/ws/task_events thay cho polling.
+    """
+    data = await async_redis_client.get(task_event_key(task_id))
+    event = parse_task_event(data) if data else None
+    if event is not None:
+        return {"task_id": task_id, "status": event["status"], "result": event["result"]}
+    return await asyncio.to_thread(_celery_task_status, task_id)
+
+def check_task_event_request(task_id: str | None, uid: str | None) -> TaskEventHub:
+    if task_event_hub is None:
+        raise HTTPException(status_code=503, detail="Task events are disabled.")
+    if not task_id and not uid:
+        raise HTTPException(status_code=400, detail="Either task_id or uid is required.")
+    return task_event_hub
+
+@app.get("/api/v1/task_events")
+async def stream_task_events(request: Request, task_id: str | None = None, uid: str | None = None):
+    """
+    Server-Sent Events cho tiến độ xử lý tài liệu: mỗi sự kiện "task" có cùng các trường
+    "status"/"result" như /api/v1/task_status, kèm "state" (PENDING, STARTED, PROGRESS, SUCCESS,
+    FAILURE) và "seq". Với `task_id`, luồng kết thúc sau trạng thái cuối; với `uid`, luồng nhận
+    sự kiện của mọi task của người dùng cho tới khi client ngắt kết nối.
+    """
+    hub = check_task_event_request(task_id, uid)
+
+    async def event_stream():
+        async with aclosing(task_event_stream(hub, async_redis_client, task_id=task_id, uid=uid)) as events:
+            async for event in events:
+                if await request.is_disconnected():
+                    return
+                # Dòng chú thích giữ kết nối qua proxy khi không có sự kiện
+                yield ": keepalive\n\n" if event is None else format_sse("task", event)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.websocket("/api/v1/ws/task_events")
+async def websocket_task_events(websocket: WebSocket, task_id: str | None = None, uid: str | None = None):
+    """Giống /api/v1/task_events nhưng qua WebSocket: mỗi sự kiện là một message JSON."""
+    try:
+        hub = check_task_event_request(task_id, uid)
+    except HTTPException as e:
+        await websocket.close(code=1008, reason=e.detail)
+        return
+    await websocket.accept()
+
+    async def forward():
+        async with aclosing(task_event_stream(hub, async_redis_client, task_id=task_id, uid=uid)) as events:
+            async for event in events:
+                if event is not None:
+                    await websocket.send_json(event)
+
+    async def wait_disconnect():
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+
+    # Dừng ngay khi client ngắt kết nối, kể cả lúc đang chờ sự kiện
+    sender = asyncio.create_task(forward())
+    receiver = asyncio.create_task(wait_disconnect())
+    done, pending = await asyncio.wait({sender, receiver}, return_when=asyncio.FIRST_COMPLETED)
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+    if sender in done:
+        if sender.exception() is not None:
+            logger.error(f"Error streaming task events: {sender.exception()}")
+            await websocket.close(code=1011)
+        else:
+            await websocket.close()
+
+@app.get("/api/v1/task_events/stats")
+async def get_task_event_stats():
+    """Thống kê subscriber sự kiện task của instance này (số client đang theo dõi, sự kiện đã phát)."""
+    return task_event_hub.stats() if task_event_hub is not None else {"enabled": False}
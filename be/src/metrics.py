@@ -0,0 +1,346 @@
+"""
+Đo đạc nhẹ cho từng bước xử lý (không cần thư viện ngoài), xuất theo định dạng văn bản Prometheus.
+
+- `Histogram` (thời gian từng bước), `Counter` (số sự kiện) và `Gauge` (kích thước payload gần nhất),
+  có nhãn cố định. Mỗi lần ghi chỉ tốn một lần bisect và một lock, nên chi phí trên đường
+  xử lý chính là không đáng kể (cỡ micro giây).
+- API xuất các chỉ số của tiến trình tại GET /metrics.
+- Worker Celery không có HTTP server: `MetricsPusher` ghi ảnh chụp (JSON) của registry vào Redis
+  (`metrics:worker:<host>:<pid>`, có TTL) sau mỗi task, API gộp chúng vào /metrics với nhãn `worker`.
+"""
+import bisect
+import functools
+import inspect
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "True").lower() in ("true", "1", "t")
+# Chu kỳ tối thiểu (giây) giữa hai lần worker đẩy chỉ số và thời gian sống của ảnh chụp trong Redis.
+METRICS_PUSH_INTERVAL = float(os.environ.get("METRICS_PUSH_INTERVAL", 10))
+METRICS_WORKER_TTL = int(os.environ.get("METRICS_WORKER_TTL", 300))
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+WORKERS_KEY = "metrics:workers"
+
+# Mốc thời gian (giây) mặc định: từ 1ms tới vài phút (LLM, PDF lớn)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: Sequence[Tuple[str, str]] = ()) -> str:
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[LabelValues, Any] = {}
+
+    def _key(self, labelvalues: Sequence[str]) -> LabelValues:
+        if len(labelvalues) != len(self.labelnames):
+            raise ValueError(f"{self.name} cần các nhãn {self.labelnames}, nhận được {labelvalues}")
+        return tuple(str(v) for v in labelvalues)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            samples = [[list(key), value] for key, value in self._values.items()]
+        return {"type": self.type, "help": self.help, "labelnames": list(self.labelnames), "samples": samples}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, *labelvalues: str, amount: float = 1) -> None:
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labelvalues)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, *labelvalues: str) -> float:
+        return self._values.get(self._key(labelvalues), 0)
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def set(self, value: float, *labelvalues: str) -> None:
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labelvalues)
+        with self._lock:
+            self._values[key] = value
+
+    def value(self, *labelvalues: str) -> Optional[float]:
+        return self._values.get(self._key(labelvalues))
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labelvalues: str) -> None:
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labelvalues)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [số mẫu theo từng mốc (không cộng dồn, phần tử cuối là +Inf), tổng, số mẫu]
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][i] += 1
+            state[1] += value
+            state[2] += 1
+
+    def count(self, *labelvalues: str) -> int:
+        state = self._values.get(self._key(labelvalues))
+        return state[2] if state else 0
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            samples = [[list(key), [list(s[0]), s[1], s[2]]] for key, s in self._values.items()]
+        return {
+            "type": self.type,
+            "help": self.help,
+            "labelnames": list(self.labelnames),
+            "buckets": list(self.buckets),
+            "samples": samples,
+        }
+
+    @contextmanager
+    def time(self, *labelvalues: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labelvalues)
+
+    def timed(self, *labelvalues: str) -> Callable:
+        """Decorator đo thời gian chạy của hàm (đồng bộ hoặc async)."""
+
+        def decorator(func):
+            if inspect.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def async_wrapper(*args, **kwargs):
+                    with self.time(*labelvalues):
+                        return await func(*args, **kwargs)
+                return async_wrapper
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.time(*labelvalues):
+                    return func(*args, **kwargs)
+            return wrapper
+
+        return decorator
+
+    def time_iter(self, iterable: Iterable, *labelvalues: str) -> Iterator:
+        """Bọc một iterator, đo thời gian sinh từng phần tử (vd. trích xuất từng trang PDF)."""
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            self.observe(time.perf_counter() - start, *labelvalues)
+            yield item
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], Iterable[Tuple[str, str, str, Dict[str, str], float]]]] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Chỉ số {metric.name} đã được đăng ký")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help, labelnames))
+
+    def gauge(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def add_collector(self, collector: Callable[[], Iterable[Tuple[str, str, str, Dict[str, str], float]]]) -> None:
+        """
+        `collector()` trả về các mẫu (name, type, help, labels, value) được tính lúc xuất
+        (vd. thống kê cache sẵn có), type là "gauge" hoặc "counter".
+        """
+        self._collectors.append(collector)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        return {name: metric.snapshot() for name, metric in self._metrics.items()}
+
+    def clear(self) -> None:
+        for metric in self._metrics.values():
+            metric.clear()
+
+    def render(self, remote: Optional[Dict[str, Dict[str, Dict[str, Any]]]] = None) -> str:
+        """
+        Văn bản Prometheus của registry này, cộng với các ảnh chụp `remote` ({worker_id: snapshot})
+        được gắn thêm nhãn `worker`.
+        """
+        families: Dict[str, Dict[str, Any]] = {}
+        sources: Dict[str, List[Tuple[Dict[str, Any], Tuple[Tuple[str, str], ...]]]] = {}
+        for name, snapshot in self.snapshot().items():
+            families[name] = snapshot
+            sources.setdefault(name, []).append((snapshot, ()))
+        for worker, snapshots in (remote or {}).items():
+            for name, snapshot in snapshots.items():
+                families.setdefault(name, snapshot)
+                sources.setdefault(name, []).append((snapshot, (("worker", worker),)))
+
+        lines: List[str] = []
+        for name, family in families.items():
+            lines.append(f"# HELP {name} {family['help']}")
+            lines.append(f"# TYPE {name} {family['type']}")
+            for snapshot, extra in sources[name]:
+                lines.extend(_render_samples(name, snapshot, extra))
+        for collector in self._collectors:
+            try:
+                gauges = list(collector())
+            except Exception as e:
+                logger.warning(f"Không thu thập được chỉ số: {e}")
+                continue
+            seen = set()
+            for name, type, help, labels, value in gauges:
+                if name not in seen:
+                    seen.add(name)
+                    lines.append(f"# HELP {name} {help}")
+                    lines.append(f"# TYPE {name} {type}")
+                lines.append(f"{name}{_labels(list(labels), list(labels.values()))} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _render_samples(name: str, snapshot: Dict[str, Any], extra: Sequence[Tuple[str, str]]) -> List[str]:
+    labelnames = snapshot["labelnames"]
+    lines = []
+    if snapshot["type"] != "histogram":
+        for values, value in snapshot["samples"]:
+            lines.append(f"{name}{_labels(labelnames, values, extra)} {_number(value)}")
+        return lines
+    bounds = list(snapshot["buckets"]) + [float("inf")]
+    for values, (counts, total, count) in snapshot["samples"]:
+        cumulative = 0
+        for bound, n in zip(bounds, counts):
+            cumulative += n
+            le = (("le", _number(float(bound))),)
+            lines.append(f"{name}_bucket{_labels(labelnames, values, tuple(extra) + le)} {cumulative}")
+        lines.append(f"{name}_sum{_labels(labelnames, values, extra)} {_number(float(total))}")
+        lines.append(f"{name}_count{_labels(labelnames, values, extra)} {count}")
+    return lines
+
+
+class MetricsPusher:
+    """Đẩy ảnh chụp registry của tiến trình worker vào Redis, tối đa một lần mỗi `interval` giây."""
+
+    def __init__(
+        self,
+        registry: Registry,
+        redis_client,
+        worker_id: Optional[str] = None,
+        interval: float = METRICS_PUSH_INTERVAL,
+        ttl: int = METRICS_WORKER_TTL,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.registry = registry
+        self.redis_client = redis_client
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.interval = interval
+        self.ttl = ttl
+        self._clock = clock
+        self._last_push: Optional[float] = None
+
+    def push(self, force: bool = False) -> bool:
+        now = self._clock()
+        if not force and self._last_push is not None and now - self._last_push < self.interval:
+            return False
+        self._last_push = now
+        try:
+            pipe = self.redis_client.pipeline()
+            pipe.set(f"metrics:worker:{self.worker_id}", json.dumps(self.registry.snapshot()), ex=self.ttl)
+            pipe.sadd(WORKERS_KEY, self.worker_id)
+            pipe.execute()
+            return True
+        except Exception as e:
+            logger.warning(f"Không đẩy được chỉ số của worker {self.worker_id}: {e}")
+            return False
+
+
+async def load_worker_snapshots(async_redis_client) -> Dict[str, Dict[str, Dict[str, Any]]]:
+    """Đọc ảnh chụp chỉ số của các worker còn sống; worker đã hết hạn bị xóa khỏi danh sách."""
+    workers = sorted(await async_redis_client.smembers(WORKERS_KEY))
+    if not workers:
+        return {}
+    workers = [w.decode("utf-8") if isinstance(w, bytes) else w for w in workers]
+    payloads = await async_redis_client.mget([f"metrics:worker:{w}" for w in workers])
+    snapshots, gone = {}, []
+    for worker, payload in zip(workers, payloads):
+        if payload is None:
+            gone.append(worker)
+            continue
+        try:
+            snapshots[worker] = json.loads(payload)
+        except ValueError:
+            gone.append(worker)
+    if gone:
+        await async_redis_client.srem(WORKERS_KEY, *gone)
+    return snapshots
+
+
+# Registry dùng chung của tiến trình và các chỉ số của pipeline
+registry = Registry()
+
+STAGE_SECONDS = registry.histogram(
+    "simplrag_stage_seconds", "Thời gian của từng bước xử lý (tải lên và truy xuất).", ("stage",)
+)
+PAYLOAD_BYTES = registry.gauge(
+    "simplrag_payload_bytes", "Kích thước payload gần nhất theo loại (PDF tải lên, chỉ mục đã serialize).", ("kind",)
+)
+EVENTS = registry.counter(
+    "simplrag_events_total", "Số sự kiện theo loại (task thành công/thất bại, chunk đã embed...).", ("event",)
+)
+REQUEST_SECONDS = registry.histogram(
+    "simplrag_http_request_seconds", "Thời gian xử lý request HTTP theo route.", ("method", "route", "status")
+)
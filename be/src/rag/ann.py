@@ -0,0 +1,156 @@
+"""
+Chỉ mục lân cận gần đúng (ANN) kiểu IVF-flat, viết thuần NumPy.
+
+Lúc ingest, các embedding (đã chuẩn hóa) được phân cụm bằng spherical k-means
+thành `n_lists` cụm. Mỗi chunk thuộc danh sách của centroid gần nhất; các danh sách
+được lưu liền nhau theo dạng CSR (offsets + ids). Khi truy vấn, chỉ `nprobe` cụm gần
+câu hỏi nhất được quét chính xác, nên chi phí giảm từ O(n) xuống ~O(n * nprobe / n_lists).
+
+ANN tắt theo mặc định (ANN_ENABLED): tìm kiếm chính xác chỉ mất vài ms cho hàng chục nghìn chunk,
+không đáng so với lời gọi LLM, trong khi IVF làm mất một phần ngữ cảnh top-k. Điểm vận hành khi bật,
+đo bằng `python -m benchmark.bench_ann` (dữ liệu tổng hợp 768 chiều, recall@4 so với tìm kiếm chính xác):
+
+    chunk    cụm   nprobe  recall@4  ANN (ms)  chính xác (ms)
+    20000    141        8     0.839      0.83            3.01
+    20000    141       64     0.946      7.23            3.01
+    50000    223       16     0.979      2.23           14.07   <- mặc định khi bật
+   100000    316       16     0.991      3.71           29.13
+
+Recall phụ thuộc mạnh vào độ phân cụm của embedding (cùng 100000 chunk với --noise 4 chỉ còn
+0.674 ở nprobe=16): đo lại trên embedding thật trước khi bật.
+"""
+import logging
+import os
+import sys
+from typing import Optional
+
+import numpy as np
+
+from src.rag.index_format import VectorIndex
+
+logger = logging.getLogger(__name__)
+
+ANN_ENABLED = os.environ.get("ANN_ENABLED", "False").lower() in ("true", "1", "t")
+# Khi bật, chỉ dựng và dùng chỉ mục ANN cho tài liệu có từ ngần này chunk trở lên;
+# khi tắt, mọi tài liệu (kể cả chỉ mục đã có IVF) dùng tìm kiếm chính xác.
+ANN_MIN_CHUNKS = int(os.environ.get("ANN_MIN_CHUNKS", 50000)) if ANN_ENABLED else sys.maxsize
+# Số cụm được quét cho mỗi truy vấn: tăng để tăng recall, giảm để giảm độ trễ.
+ANN_NPROBE = int(os.environ.get("ANN_NPROBE", 16))
+
+_CENTROIDS = "ivf_centroids"
+_OFFSETS = "ivf_offsets"
+_IDS = "ivf_ids"
+
+
+def _assign(matrix: np.ndarray, centroids: np.ndarray, batch_size: int = 4096) -> np.ndarray:
+    """Gán mỗi hàng vào centroid có tích vô hướng lớn nhất (theo lô để giới hạn bộ nhớ)."""
+    labels = np.empty(len(matrix), dtype=np.int64)
+    for start in range(0, len(matrix), batch_size):
+        labels[start:start + batch_size] = np.argmax(matrix[start:start + batch_size] @ centroids.T, axis=1)
+    return labels
+
+
+def spherical_kmeans(matrix: np.ndarray, n_clusters: int, n_iter: int = 10, seed: int = 0) -> np.ndarray:
+    """K-means trên mặt cầu đơn vị (độ đo cosine). Trả về centroid đã chuẩn hóa."""
+    rng = np.random.default_rng(seed)
+    n_clusters = max(1, min(n_clusters, len(matrix)))
+    centroids = matrix[rng.choice(len(matrix), n_clusters, replace=False)].astype(np.float32)
+    for _ in range(n_iter):
+        labels = _assign(matrix, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, matrix)
+        counts = np.bincount(labels, minlength=n_clusters)
+        empty = counts == 0
+        if empty.any():
+            # Khởi tạo lại các cụm rỗng bằng điểm ngẫu nhiên
+            sums[empty] = matrix[rng.choice(len(matrix), int(empty.sum()), replace=False)]
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        centroids = (sums / norms).astype(np.float32)
+    return centroids
+
+
+class IVFFlatIndex:
+    """Chỉ mục IVF-flat: centroid (n_lists x d) và các danh sách chunk dạng CSR."""
+
+    def __init__(self, centroids: np.ndarray, offsets: np.ndarray, ids: np.ndarray):
+        self.centroids = centroids
+        self.offsets = offsets
+        self.ids = ids
+
+    @property
+    def n_lists(self) -> int:
+        return len(self.centroids)
+
+    @classmethod
+    def build(cls, matrix: np.ndarray, n_lists: Optional[int] = None, n_iter: int = 10, seed: int = 0) -> "IVFFlatIndex":
+        """Dựng chỉ mục từ ma trận embedding đã chuẩn hóa. Mặc định n_lists ≈ sqrt(n)."""
+        if n_lists is None:
+            n_lists = int(np.sqrt(len(matrix)))
+        centroids = spherical_kmeans(matrix, n_lists, n_iter=n_iter, seed=seed)
+        return cls.from_labels(centroids, _assign(matrix, centroids))
+
+    @classmethod
+    def from_labels(cls, centroids: np.ndarray, labels: np.ndarray) -> "IVFFlatIndex":
+        ids = np.argsort(labels, kind="stable").astype(np.int32)
+        offsets = np.zeros(len(centroids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(labels, minlength=len(centroids)), out=offsets[1:])
+        return cls(centroids, offsets, ids)
+
+    def labels(self) -> np.ndarray:
+        """Cụm của từng chunk (khôi phục từ dạng CSR)."""
+        labels = np.empty(len(self.ids), dtype=np.int64)
+        for p in range(self.n_lists):
+            labels[self.ids[self.offsets[p]:self.offsets[p + 1]]] = p
+        return labels
+
+    def extend(self, matrix: np.ndarray) -> "IVFFlatIndex":
+        """Thêm các chunk mới (nối tiếp sau các chunk hiện có) vào cụm gần nhất, giữ nguyên centroid."""
+        labels = np.concatenate([self.labels(), _assign(matrix, self.centroids)])
+        return self.from_labels(self.centroids, labels)
+
+    def subset(self, keep: np.ndarray) -> "IVFFlatIndex":
+        """Chỉ giữ các chunk có keep[i] = True; chỉ số chunk được đánh lại liên tục."""
+        return self.from_labels(self.centroids, self.labels()[keep])
+
+    def candidates(self, query: np.ndarray, nprobe: int) -> np.ndarray:
+        """Chỉ số các chunk nằm trong `nprobe` cụm gần câu truy vấn nhất."""
+        nprobe = max(1, min(nprobe, self.n_lists))
+        centroid_scores = self.centroids @ query
+        if nprobe < self.n_lists:
+            probes = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+        else:
+            probes = np.arange(self.n_lists)
+        return np.concatenate([self.ids[self.offsets[p]:self.offsets[p + 1]] for p in probes])
+
+    def attach(self, index: VectorIndex) -> None:
+        """Lưu chỉ mục vào các section phụ của VectorIndex để serialize cùng các chunk."""
+        index.extras[_CENTROIDS] = self.centroids
+        index.extras[_OFFSETS] = self.offsets
+        index.extras[_IDS] = self.ids
+        index.extra_info["ivf"] = {"n_lists": self.n_lists, "built_chunks": int(len(self.ids))}
+
+    @classmethod
+    def from_index(cls, index: VectorIndex) -> Optional["IVFFlatIndex"]:
+        if _CENTROIDS not in index.extras:
+            return None
+        return cls(index.extras[_CENTROIDS], index.extras[_OFFSETS], index.extras[_IDS])
+
+    @staticmethod
+    def detach(index: VectorIndex) -> None:
+        for name in (_CENTROIDS, _OFFSETS, _IDS):
+            index.extras.pop(name, None)
+        index.extra_info.pop("ivf", None)
+
+
+def build_ann_index(index: VectorIndex, min_chunks: int = ANN_MIN_CHUNKS) -> bool:
+    """
+    Dựng chỉ mục IVF cho tài liệu lớn và gắn vào VectorIndex.
+    Embedding của index phải được chuẩn hóa trước. Trả về True nếu đã dựng.
+    """
+    if len(index) < min_chunks:
+        return False
+    ivf = IVFFlatIndex.build(index.embeddings)
+    ivf.attach(index)
+    logger.info(f"Đã dựng chỉ mục IVF với {ivf.n_lists} cụm cho {len(index)} chunk.")
+    return True
@@ -0,0 +1,91 @@
+"""
+Bộ sưu tập nhiều tài liệu của một người dùng trong cùng một chỉ mục.
+
+Mỗi chunk mang `doc_id` trong metadata (và id dạng "<doc_id>:<số thứ tự>"), nên có thể:
+- thêm tài liệu mới bằng cách nối các chunk vừa embed vào chỉ mục hiện có,
+- xóa một tài liệu bằng cách lọc bỏ các hàng của nó (không embed lại),
+- lọc kết quả truy xuất theo tài liệu (filter={"doc_id": [...]}).
+
+Chỉ mục ANN (IVF) được mở rộng/thu gọn theo các centroid sẵn có và chỉ dựng lại khi
+số chunk đã thay đổi quá nhiều so với lúc dựng.
+"""
+import logging
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+from src.rag.ann import ANN_MIN_CHUNKS, IVFFlatIndex, build_ann_index
+from src.rag.index_format import VectorIndex, concat_indexes, select_rows
+
+logger = logging.getLogger(__name__)
+
+# Dựng lại IVF khi số chunk lệch quá hệ số này so với lúc dựng (centroid không còn đại diện tốt).
+_IVF_REBUILD_FACTOR = 2.0
+
+
+def tag_document(index: VectorIndex, doc_id: str, filename: Optional[str] = None) -> VectorIndex:
+    """Gắn `doc_id` (và tên file) vào metadata và id của mọi chunk trong chỉ mục."""
+    for metadata in index.metadatas:
+        metadata["doc_id"] = doc_id
+        if filename:
+            metadata["source"] = filename
+    index.ids = [f"{doc_id}:{i}" for i in range(len(index))]
+    return index
+
+
+def _refresh_ann(index: VectorIndex, ivf: Optional[IVFFlatIndex], built_chunks: int, min_chunks: int) -> None:
+    if len(index) < min_chunks:
+        return
+    if ivf is not None and len(index) <= built_chunks * _IVF_REBUILD_FACTOR and len(index) * _IVF_REBUILD_FACTOR >= built_chunks:
+        ivf.attach(index)
+        index.extra_info["ivf"]["built_chunks"] = built_chunks
+        return
+    build_ann_index(index, min_chunks=min_chunks)
+
+
+def append_document(base: Optional[VectorIndex], new: VectorIndex, min_chunks: int = ANN_MIN_CHUNKS) -> VectorIndex:
+    """
+    Nối các chunk (đã chuẩn hóa) của tài liệu mới vào chỉ mục hiện có.
+    Các chunk cũ không được embed lại; IVF sẵn có được mở rộng bằng cách gán các chunk mới
+    vào centroid gần nhất.
+    """
+    if base is None or not len(base):
+        build_ann_index(new, min_chunks=min_chunks)
+        return new
+
+    ivf = IVFFlatIndex.from_index(base)
+    built_chunks = int(base.extra_info.get("ivf", {}).get("built_chunks", len(base)))
+    merged = concat_indexes(base, new)
+    if ivf is not None:
+        ivf = ivf.extend(new.embeddings)
+    _refresh_ann(merged, ivf, built_chunks, min_chunks)
+    return merged
+
+
+def remove_document(index: VectorIndex, doc_id: str, min_chunks: int = ANN_MIN_CHUNKS) -> Optional[VectorIndex]:
+    """
+    Xóa mọi chunk của `doc_id` và nén chỉ mục lại. Trả về None nếu không có chunk nào thuộc tài liệu đó.
+    """
+    keep = np.fromiter((m.get("doc_id") != doc_id for m in index.metadatas), dtype=bool, count=len(index))
+    if keep.all():
+        return None
+    ivf = IVFFlatIndex.from_index(index)
+    built_chunks = int(index.extra_info.get("ivf", {}).get("built_chunks", len(index)))
+    compacted = select_rows(index, keep)
+    if ivf is not None:
+        ivf = ivf.subset(keep)
+    _refresh_ann(compacted, ivf, built_chunks, min_chunks)
+    return compacted
+
+
+def list_documents(index: VectorIndex) -> Dict[Any, Dict[str, Any]]:
+    """Các tài liệu trong chỉ mục: doc_id -> {chunks, pages, source}."""
+    documents: Dict[Any, Dict[str, Any]] = {}
+    for metadata in index.metadatas:
+        doc_id = metadata.get("doc_id")
+        info = documents.setdefault(doc_id, {"chunks": 0, "pages": 0, "source": metadata.get("source")})
+        info["chunks"] += 1
+        page = metadata.get("page")
+        if isinstance(page, int):
+            info["pages"] = max(info["pages"], page + 1)
+    return documents
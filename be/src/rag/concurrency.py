@@ -0,0 +1,48 @@
+"""
+Giới hạn số lời gọi LLM đang chạy đồng thời trong một tiến trình API.
+
+Semaphore được tạo riêng cho từng event loop (lần đầu sử dụng) để có thể khởi tạo
+limiter ở mức module mà không gắn với một loop cụ thể.
+"""
+import asyncio
+import os
+import weakref
+
+# Số lời gọi LLM tối đa đang chạy cùng lúc trên mỗi tiến trình API.
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", 32))
+
+
+class ConcurrencyLimiter:
+    """Async context manager giới hạn số tác vụ chạy đồng thời, có bộ đếm để giám sát."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_flight = 0
+        self.waiting = 0
+        self._semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = (
+            weakref.WeakKeyDictionary()
+        )
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.limit)
+        return semaphore
+
+    async def __aenter__(self):
+        self.waiting += 1
+        try:
+            await self._semaphore().acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.in_flight -= 1
+        self._semaphore().release()
+        return False
+
+
+llm_limiter = ConcurrencyLimiter(LLM_MAX_CONCURRENCY)
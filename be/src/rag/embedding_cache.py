@@ -0,0 +1,411 @@
+"""
+Cache embedding theo nội dung (content-addressed) lưu trong Redis.
+
+Khóa là hash SHA-256 của văn bản chunk đã chuẩn hóa cộng với tên model embedding,
+nên cùng một đoạn văn bản (tải lại cùng PDF, PDF trùng lặp giữa các uid) chỉ được
+embed một lần. Các chunk trùng nhau trong cùng một tài liệu (kể cả giữa các lô
+embed song song) cũng được gộp lại trước khi gọi `embed_documents`.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from src.rag.embedding_scheduler import QuotaRateLimit, is_rate_limit_error, query_task_kwargs
+
+logger = logging.getLogger(__name__)
+
+# Thời gian sống (giây) của một embedding trong cache, được làm mới mỗi lần dùng lại.
+EMBEDDING_CACHE_TTL = int(os.environ.get("EMBEDDING_CACHE_TTL", 7 * 24 * 3600))
+# Số embedding tối đa được giữ trong cache (LRU theo thời điểm dùng gần nhất). 0 = không giới hạn.
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.environ.get("EMBEDDING_CACHE_MAX_ENTRIES", 1_000_000))
+# Số embedding câu hỏi giữ trong bộ nhớ của mỗi tiến trình API.
+QUERY_EMBEDDING_CACHE_SIZE = int(os.environ.get("QUERY_EMBEDDING_CACHE_SIZE", 10_000))
+# Thời gian sống (giây) của embedding câu hỏi trong tầng Redis dùng chung.
+QUERY_EMBEDDING_CACHE_TTL = int(os.environ.get("QUERY_EMBEDDING_CACHE_TTL", 24 * 3600))
+
+_KEY_PREFIX = "embcache"
+# Embedding câu hỏi tách riêng với embedding chunk (một số model embed khác nhau theo loại tác vụ)
+_QUERY_KEY_PREFIX = "qembcache"
+_LRU_KEY = f"{_KEY_PREFIX}:lru"
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """Chuẩn hóa Unicode (NFC) và khoảng trắng để các chunk giống nhau có cùng khóa."""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFC", text)).strip()
+
+
+def embedding_cache_key(text: str, model_name: str, prefix: str = _KEY_PREFIX) -> str:
+    digest = hashlib.sha256(f"{model_name}\x00{normalize_text(text)}".encode("utf-8")).hexdigest()
+    return f"{prefix}:{model_name}:{digest}"
+
+
+class CachedEmbeddings:
+    """
+    Bọc một đối tượng embeddings (có `embed_documents`/`embed_query`) với cache Redis.
+    `redis_client=None` chỉ thực hiện gộp các chunk trùng nhau.
+    Mỗi chunk duy nhất chỉ được embed một lần trong suốt vòng đời của đối tượng, kể cả khi các lô
+    chứa nó được embed song song, nên mỗi tài liệu dùng một CachedEmbeddings riêng.
+    """
+
+    def __init__(
+        self,
+        embeddings: Any,
+        redis_client=None,
+        model_name: str = "default",
+        ttl: int = EMBEDDING_CACHE_TTL,
+        max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES,
+    ):
+        self.embeddings = embeddings
+        self.redis_client = redis_client
+        self.model_name = model_name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.requested = 0
+        self.unique = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # khóa -> Future của embedding, dùng chung giữa các lô của cùng một tài liệu
+        self._futures: Dict[str, Future] = {}
+
+    def embed_array(self, texts: List[str]) -> np.ndarray:
+        """Embed danh sách văn bản, trả về ma trận float32 (len(texts) x d). An toàn luồng."""
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+
+        keys = [embedding_cache_key(t, self.model_name) for t in texts]
+        # Gộp các chunk trùng nhau, giữ văn bản của lần xuất hiện đầu tiên
+        first_text: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            first_text.setdefault(key, text)
+        unique_keys = list(first_text)
+
+        # Chunk đã (hoặc đang) được embed bởi một lô khác: chờ kết quả của lô đó thay vì embed lại
+        with self._lock:
+            claimed = [k for k in unique_keys if k not in self._futures]
+            for key in claimed:
+                self._futures[key] = Future()
+            futures = {k: self._futures[k] for k in unique_keys}
+            self.requested += len(texts)
+            self.unique += len(claimed)
+
+        vectors: Dict[str, np.ndarray] = {}
+        if claimed:
+            try:
+                vectors = self._embed_unique(claimed, first_text)
+            except BaseException as e:
+                # Bỏ các chunk lỗi khỏi bảng để lần gọi sau (vd. task được chạy lại) embed lại
+                with self._lock:
+                    for key in claimed:
+                        del self._futures[key]
+                for key in claimed:
+                    futures[key].set_exception(e)
+                raise
+            for key in claimed:
+                futures[key].set_result(vectors[key])
+        for key in unique_keys:
+            if key not in vectors:
+                vectors[key] = futures[key].result()
+
+        return np.stack([vectors[k] for k in keys]).astype(np.float32, copy=False)
+
+    def _embed_unique(self, unique_keys: List[str], first_text: Dict[str, str]) -> Dict[str, np.ndarray]:
+        vectors: Dict[str, np.ndarray] = {}
+        if self.redis_client is not None:
+            for key, raw in zip(unique_keys, self.redis_client.mget(unique_keys)):
+                if raw:
+                    vectors[key] = np.frombuffer(raw, dtype="<f4")
+        hit_keys = list(vectors)
+        miss_keys = [k for k in unique_keys if k not in vectors]
+        with self._lock:
+            self.hits += len(hit_keys)
+            self.misses += len(miss_keys)
+
+        if miss_keys:
+            miss_texts = [first_text[k] for k in miss_keys]
+            if hasattr(self.embeddings, "embed_array"):
+                fresh = self.embeddings.embed_array(miss_texts)
+            else:
+                fresh = np.asarray(self.embeddings.embed_documents(miss_texts), dtype=np.float32)
+            for key, vector in zip(miss_keys, fresh):
+                vectors[key] = vector
+
+        if self.redis_client is not None:
+            self._store(hit_keys, miss_keys, vectors)
+        return vectors
+
+    def _store(self, hit_keys: List[str], miss_keys: List[str], vectors: Dict[str, np.ndarray]) -> None:
+        now = time.time()
+        pipe = self.redis_client.pipeline(transaction=False)
+        for key in miss_keys:
+            pipe.set(key, np.ascontiguousarray(vectors[key], dtype="<f4").tobytes(), ex=self.ttl)
+        for key in hit_keys:
+            pipe.expire(key, self.ttl)
+        touched = hit_keys + miss_keys
+        if self.max_entries and touched:
+            pipe.zadd(_LRU_KEY, {key: now for key in touched})
+            pipe.zcard(_LRU_KEY)
+        results = pipe.execute()
+
+        if self.max_entries and touched:
+            excess = int(results[-1]) - self.max_entries
+            if excess > 0:
+                # Loại các embedding lâu không được dùng nhất để giữ cache trong giới hạn
+                evicted = self.redis_client.zrange(_LRU_KEY, 0, excess - 1)
+                pipe = self.redis_client.pipeline(transaction=False)
+                pipe.delete(*evicted)
+                pipe.zremrangebyrank(_LRU_KEY, 0, excess - 1)
+                pipe.execute()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_array(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embeddings.embed_query(text)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "model": self.model_name,
+            "chunks": self.requested,
+            "unique_chunks": self.unique,
+            "deduplicated": self.requested - self.unique,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / self.unique if self.unique else 0.0,
+        }
+
+
+class QueryEmbeddingCache:
+    """
+    Cache embedding câu hỏi hai tầng: LRU trong bộ nhớ tiến trình và (tùy chọn) Redis dùng chung
+    giữa các instance API. Khóa là tên model + văn bản đã chuẩn hóa.
+
+    Thời gian tiết kiệm được ước lượng bằng độ trễ trung bình của các lần gọi model thật
+    trừ đi độ trễ của lần tra cache.
+    `batch_embedder` (vd. EmbeddingScheduler, mặc định là `embeddings`) embed các câu hỏi của
+    aembed_queries trong một lần gọi, với cùng loại tác vụ câu hỏi như embed_query.
+    """
+
+    def __init__(
+        self,
+        embeddings: Any,
+        model_name: str = "default",
+        max_entries: int = QUERY_EMBEDDING_CACHE_SIZE,
+        redis_client=None,
+        async_redis_client=None,
+        ttl: int = QUERY_EMBEDDING_CACHE_TTL,
+        clock=time.perf_counter,
+        batch_embedder: Any = None,
+    ):
+        self.embeddings = embeddings
+        self.batch_embedder = batch_embedder if batch_embedder is not None else embeddings
+        self.model_name = model_name
+        self.max_entries = max(1, max_entries)
+        self.redis_client = redis_client
+        self.async_redis_client = async_redis_client
+        self.ttl = ttl
+        self._clock = clock
+        self._entries: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.local_hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+        self.miss_seconds = 0.0
+        self.saved_seconds = 0.0
+
+    def _key(self, text: str) -> str:
+        return embedding_cache_key(text, self.model_name, prefix=_QUERY_KEY_PREFIX)
+
+    def _get_local(self, key: str) -> Optional[List[float]]:
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+            return vector
+
+    def _put_local(self, key: str, vector: List[float]) -> None:
+        with self._lock:
+            self._entries[key] = vector
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _record_hit(self, tier: str, elapsed: float) -> None:
+        with self._lock:
+            if tier == "local":
+                self.local_hits += 1
+            else:
+                self.redis_hits += 1
+            if self.misses:
+                self.saved_seconds += max(0.0, self.miss_seconds / self.misses - elapsed)
+
+    def _record_miss(self, elapsed: float) -> None:
+        with self._lock:
+            self.misses += 1
+            self.miss_seconds += elapsed
+
+    @staticmethod
+    def _decode(raw: bytes) -> List[float]:
+        return np.frombuffer(raw, dtype="<f4").tolist()
+
+    @staticmethod
+    def _encode(vector: List[float]) -> bytes:
+        return np.asarray(vector, dtype="<f4").tobytes()
+
+    def embed_query(self, text: str) -> List[float]:
+        start = self._clock()
+        key = self._key(text)
+        vector = self._get_local(key)
+        if vector is not None:
+            self._record_hit("local", self._clock() - start)
+            return vector
+        if self.redis_client is not None:
+            try:
+                raw = self.redis_client.get(key)
+            except Exception as e:
+                logger.warning(f"Không đọc được cache embedding câu hỏi từ Redis: {e}")
+                raw = None
+            if raw:
+                vector = self._decode(raw)
+                self._put_local(key, vector)
+                self._record_hit("redis", self._clock() - start)
+                return vector
+
+        vector = list(self.embeddings.embed_query(text))
+        self._record_miss(self._clock() - start)
+        self._put_local(key, vector)
+        if self.redis_client is not None:
+            try:
+                self.redis_client.set(key, self._encode(vector), ex=self.ttl)
+            except Exception as e:
+                logger.warning(f"Không ghi được cache embedding câu hỏi vào Redis: {e}")
+        return vector
+
+    async def aembed_query(self, text: str) -> List[float]:
+        start = self._clock()
+        key = self._key(text)
+        vector = self._get_local(key)
+        if vector is not None:
+            self._record_hit("local", self._clock() - start)
+            return vector
+        if self.async_redis_client is not None:
+            try:
+                raw = await self.async_redis_client.get(key)
+            except Exception as e:
+                logger.warning(f"Không đọc được cache embedding câu hỏi từ Redis: {e}")
+                raw = None
+            if raw:
+                vector = self._decode(raw)
+                self._put_local(key, vector)
+                self._record_hit("redis", self._clock() - start)
+                return vector
+
+        if hasattr(self.embeddings, "aembed_query"):
+            vector = await self.embeddings.aembed_query(text)
+        else:
+            vector = await asyncio.to_thread(self.embeddings.embed_query, text)
+        vector = list(vector)
+        self._record_miss(self._clock() - start)
+        self._put_local(key, vector)
+        if self.async_redis_client is not None:
+            try:
+                await self.async_redis_client.set(key, self._encode(vector), ex=self.ttl)
+            except Exception as e:
+                logger.warning(f"Không ghi được cache embedding câu hỏi vào Redis: {e}")
+        return vector
+
+    def _embed_queries(self, texts: List[str]):
+        """
+        Embed các câu hỏi trong một lần gọi. Vector phải cùng loại tác vụ (RETRIEVAL_QUERY) với
+        embed_query vì được lưu chung khóa; lỗi 429 của nhà cung cấp được chuyển thành QuotaRateLimit.
+        """
+        if hasattr(self.batch_embedder, "embed_queries"):
+            return self.batch_embedder.embed_queries(texts)
+        try:
+            return self.batch_embedder.embed_documents(texts, **query_task_kwargs(self.batch_embedder))
+        except Exception as e:
+            if is_rate_limit_error(e) and not isinstance(e, QuotaRateLimit):
+                raise QuotaRateLimit(f"Embedding provider returned 429: {e}") from e
+            raise
+
+    async def aembed_queries(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed nhiều câu hỏi: câu đã có trong cache (cục bộ hoặc Redis) được dùng lại,
+        các câu còn lại được embed bằng một lần gọi `batch_embedder` duy nhất.
+        """
+        start = self._clock()
+        keys = [self._key(t) for t in texts]
+        vectors: Dict[str, List[float]] = {}
+        for key in keys:
+            vector = self._get_local(key)
+            if vector is not None:
+                vectors[key] = vector
+                self._record_hit("local", 0.0)
+        remote = [k for k in dict.fromkeys(keys) if k not in vectors]
+        if remote and self.async_redis_client is not None:
+            try:
+                raws = await self.async_redis_client.mget(remote)
+            except Exception as e:
+                logger.warning(f"Không đọc được cache embedding câu hỏi từ Redis: {e}")
+                raws = [None] * len(remote)
+            for key, raw in zip(remote, raws):
+                if raw:
+                    vectors[key] = self._decode(raw)
+                    self._put_local(key, vectors[key])
+                    self._record_hit("redis", 0.0)
+
+        first_text: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in vectors:
+                first_text.setdefault(key, text)
+        if first_text:
+            miss_keys = list(first_text)
+            fresh = await asyncio.to_thread(self._embed_queries, [first_text[k] for k in miss_keys])
+            elapsed = self._clock() - start
+            for key, vector in zip(miss_keys, fresh):
+                vectors[key] = list(vector)
+                self._put_local(key, vectors[key])
+                # Thời gian của lần gọi lô được chia đều cho các câu hỏi trong lô
+                self._record_miss(elapsed / len(miss_keys))
+            if self.async_redis_client is not None:
+                try:
+                    pipe = self.async_redis_client.pipeline(transaction=False)
+                    for key in miss_keys:
+                        pipe.set(key, self._encode(vectors[key]), ex=self.ttl)
+                    await pipe.execute()
+                except Exception as e:
+                    logger.warning(f"Không ghi được cache embedding câu hỏi vào Redis: {e}")
+        return [vectors[k] for k in keys]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        hits = self.local_hits + self.redis_hits
+        total = hits + self.misses
+        return {
+            "model": self.model_name,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "local_hits": self.local_hits,
+            "redis_hits": self.redis_hits,
+            "misses": self.misses,
+            "hit_ratio": hits / total if total else 0.0,
+            "avg_miss_seconds": self.miss_seconds / self.misses if self.misses else 0.0,
+            "saved_seconds": self.saved_seconds,
+        }
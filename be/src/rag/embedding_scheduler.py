@@ -0,0 +1,183 @@
+"""
+Bộ lập lịch gọi API embedding: chia lô, chạy song song có giới hạn, giới hạn tốc độ
+phía client bằng token bucket và thử lại với exponential backoff khi gặp lỗi 429.
+"""
+import inspect
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+try:
+    from google.api_core.exceptions import ResourceExhausted, TooManyRequests
+except ImportError:  # pragma: no cover - phụ thuộc tùy chọn
+    ResourceExhausted = TooManyRequests = None
+
+logger = logging.getLogger(__name__)
+
+# Số văn bản trong một lần gọi embed_documents (Gemini cho phép tối đa 100).
+EMBEDDING_BATCH_SIZE = int(os.environ.get("EMBEDDING_BATCH_SIZE", 100))
+# Số lô được gửi song song từ mỗi tiến trình worker.
+EMBEDDING_MAX_CONCURRENCY = int(os.environ.get("EMBEDDING_MAX_CONCURRENCY", 4))
+# Quota phía client cho mỗi tiến trình: số request/phút và số request dồn tối đa.
+EMBEDDING_REQUESTS_PER_MINUTE = float(os.environ.get("EMBEDDING_REQUESTS_PER_MINUTE", 1500))
+EMBEDDING_BURST = int(os.environ.get("EMBEDDING_BURST", 10))
+# Thời gian chờ quota tối đa (giây) trước khi bỏ cuộc và ném QuotaRateLimit.
+EMBEDDING_MAX_QUOTA_WAIT = float(os.environ.get("EMBEDDING_MAX_QUOTA_WAIT", 60))
+EMBEDDING_MAX_RETRIES = int(os.environ.get("EMBEDDING_MAX_RETRIES", 5))
+
+
+class QuotaRateLimit(Exception):
+    def __init__(self, *args):
+        super().__init__(*args)
+
+
+_RATE_LIMIT_ERRORS = tuple(
+    e for e in (QuotaRateLimit, ResourceExhausted, TooManyRequests) if e is not None
+)
+
+
+class TokenBucket:
+    """Token bucket an toàn luồng: `rate` token/giây, tối đa `capacity` token."""
+
+    def __init__(
+        self,
+        rate: float,
+        capacity: int,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._clock = clock
+        self._sleep = sleep
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, tokens: float = 1, timeout: Optional[float] = None) -> bool:
+        """Chờ đến khi đủ token. Trả về False nếu phải chờ lâu hơn `timeout` giây."""
+        deadline = None if timeout is None else self._clock() + timeout
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return True
+                wait = (tokens - self._tokens) / self.rate
+            if deadline is not None and self._clock() + wait > deadline:
+                return False
+            self._sleep(wait)
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """Nhận diện lỗi vượt quota (HTTP 429 / RESOURCE_EXHAUSTED) từ các client khác nhau.
+
+    Chỉ dựa vào mã trạng thái và kiểu exception của provider, không dò chuỗi thông báo
+    (thông báo lỗi khác có thể chứa "429" hay "quota"). Đi theo chuỗi __cause__ vì
+    langchain_google_genai bọc lỗi gốc trong GoogleGenerativeAIError.
+    """
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        if isinstance(error, _RATE_LIMIT_ERRORS):
+            return True
+        for attr in ("code", "status_code", "status"):
+            if getattr(error, attr, None) in (429, "429", "RESOURCE_EXHAUSTED"):
+                return True
+        if getattr(getattr(error, "response", None), "status_code", None) == 429:
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+
+def query_task_kwargs(embeddings: Any) -> Dict[str, str]:
+    """
+    Tham số để `embed_documents` embed văn bản như câu hỏi (task_type RETRIEVAL_QUERY của Gemini),
+    hoặc {} nếu model không phân biệt loại tác vụ.
+    """
+    try:
+        parameters = inspect.signature(embeddings.embed_documents).parameters
+    except (AttributeError, TypeError, ValueError):
+        return {}
+    return {"task_type": "RETRIEVAL_QUERY"} if "task_type" in parameters else {}
+
+
+class EmbeddingScheduler:
+    """
+    Bọc một đối tượng embeddings: chia văn bản thành các lô `batch_size`, gửi song song
+    tối đa `max_concurrency` lô, mỗi lô lấy một token từ limiter trước khi gọi API.
+    """
+
+    def __init__(
+        self,
+        embeddings: Any,
+        batch_size: int = EMBEDDING_BATCH_SIZE,
+        max_concurrency: int = EMBEDDING_MAX_CONCURRENCY,
+        limiter: Optional[TokenBucket] = None,
+        max_retries: int = EMBEDDING_MAX_RETRIES,
+        max_quota_wait: float = EMBEDDING_MAX_QUOTA_WAIT,
+        base_delay: float = 1.0,
+        max_delay: float = 30.0,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.embeddings = embeddings
+        self.batch_size = max(1, batch_size)
+        self.max_concurrency = max(1, max_concurrency)
+        self.limiter = limiter or TokenBucket(EMBEDDING_REQUESTS_PER_MINUTE / 60.0, EMBEDDING_BURST)
+        self.max_retries = max_retries
+        self.max_quota_wait = max_quota_wait
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._sleep = sleep
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="embed")
+
+    def _embed_batch(self, texts: List[str], **kwargs) -> np.ndarray:
+        for attempt in range(self.max_retries + 1):
+            if not self.limiter.acquire(timeout=self.max_quota_wait):
+                raise QuotaRateLimit("Embedding quota exhausted on the client side.")
+            try:
+                return np.asarray(self.embeddings.embed_documents(texts, **kwargs), dtype=np.float32)
+            except Exception as e:
+                if not is_rate_limit_error(e):
+                    raise
+                if attempt == self.max_retries:
+                    raise QuotaRateLimit(f"Embedding provider kept returning 429: {e}") from e
+                delay = min(self.max_delay, self.base_delay * 2 ** attempt) * random.uniform(0.5, 1.0)
+                logger.warning(f"Embedding bị giới hạn quota (lần {attempt + 1}), thử lại sau {delay:.1f}s.")
+                self._sleep(delay)
+
+    def embed_array(self, texts: List[str], **kwargs) -> np.ndarray:
+        """Embed danh sách văn bản theo lô song song, giữ nguyên thứ tự. Trả về ma trận float32."""
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        if len(batches) == 1:
+            return self._embed_batch(batches[0], **kwargs)
+        futures = [self._executor.submit(self._embed_batch, batch, **kwargs) for batch in batches]
+        try:
+            return np.concatenate([f.result() for f in futures])
+        except BaseException:
+            for f in futures:
+                f.cancel()
+            raise
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_array(texts).tolist()
+
+    def embed_queries(self, texts: List[str]) -> np.ndarray:
+        """Embed nhiều câu hỏi theo lô (cùng quota và cơ chế thử lại với embed_array)."""
+        return self.embed_array(texts, **query_task_kwargs(self.embeddings))
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embeddings.embed_query(text)
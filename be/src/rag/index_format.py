@@ -0,0 +1,479 @@
+"""
+Định dạng nhị phân gọn nhẹ cho chỉ mục vector của người dùng.
+
+Bố cục (little-endian):
+
+    [0:8)    MAGIC
+    [8:12)   phiên bản định dạng (uint32)
+    [12:16)  độ dài header JSON (uint32)
+    [16:..)  header JSON (utf-8)
+    ...      vùng dữ liệu (căn lề ALIGNMENT byte) chứa các section, mỗi section
+             cũng được căn lề ALIGNMENT byte, offset tính từ đầu vùng dữ liệu
+
+Header mô tả số chunk, số chiều, metadata, id và bảng section
+(offset, length, dtype, shape, codec). Ma trận embedding là một khối
+float32 liên tục nên có thể đọc lại bằng `np.frombuffer` mà không cần sao chép.
+Văn bản các chunk được gói vào một blob utf-8 kèm mảng offsets (n + 1 phần tử),
+có thể nén bằng zstd hoặc lz4 nếu thư viện tương ứng được cài đặt.
+Từ phiên bản 2, chỉ mục dựng từ các trang (ChunkSpans) lưu văn bản mỗi trang đúng một lần
+trong blob đó, kèm section "chunk_spans" (n x 3: hàng trang, byte đầu, byte cuối); phần
+chồng lấp giữa các chunk không bị lưu hai lần. Payload phiên bản 1 vẫn đọc được.
+Các mảng phụ (vd. chỉ mục ANN) được lưu thành section "extra:<tên>" và cũng
+được đọc lại không sao chép.
+"""
+import json
+import logging
+import os
+import pickle
+import struct
+import sys
+from collections.abc import Sequence
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - phụ thuộc tùy chọn
+    zstandard = None
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:  # pragma: no cover - phụ thuộc tùy chọn
+    lz4_frame = None
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"SRAGIDX\x00"
+FORMAT_VERSION = 2
+ALIGNMENT = 64
+_PREAMBLE = struct.Struct("<8sII")
+_EXTRA_PREFIX = "extra:"
+
+# Codec nén văn bản mặc định khi serialize: "none", "zstd" hoặc "lz4".
+INDEX_TEXT_CODEC = os.environ.get("INDEX_TEXT_CODEC", "none").lower()
+
+
+class IndexFormatError(ValueError):
+    """Dữ liệu không phải là chỉ mục hợp lệ hoặc có phiên bản không hỗ trợ."""
+
+
+def _compress(codec: str, data: bytes) -> bytes:
+    if codec == "none":
+        return data
+    if codec == "zstd":
+        if zstandard is None:
+            raise IndexFormatError("Codec 'zstd' yêu cầu gói 'zstandard'.")
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    if codec == "lz4":
+        if lz4_frame is None:
+            raise IndexFormatError("Codec 'lz4' yêu cầu gói 'lz4'.")
+        return lz4_frame.compress(data)
+    raise IndexFormatError(f"Codec không được hỗ trợ: {codec}")
+
+
+def _decompress(codec: str, data, raw_length: int) -> bytes:
+    if codec == "none":
+        return data
+    if codec == "zstd":
+        if zstandard is None:
+            raise IndexFormatError("Codec 'zstd' yêu cầu gói 'zstandard'.")
+        return zstandard.ZstdDecompressor().decompress(bytes(data), max_output_size=raw_length)
+    if codec == "lz4":
+        if lz4_frame is None:
+            raise IndexFormatError("Codec 'lz4' yêu cầu gói 'lz4'.")
+        return lz4_frame.decompress(bytes(data))
+    raise IndexFormatError(f"Codec không được hỗ trợ: {codec}")
+
+
+class PackedTexts(Sequence):
+    """
+    Danh sách văn bản chunk chỉ đọc, được giải mã từ blob utf-8 khi truy cập.
+    Không tạo ra n đối tượng str khi tải chỉ mục.
+    """
+
+    def __init__(self, blob, offsets: np.ndarray):
+        self._blob = memoryview(blob)
+        self._offsets = offsets
+
+    @classmethod
+    def pack(cls, texts: Sequence[str]) -> "PackedTexts":
+        encoded = [t.encode("utf-8") for t in texts]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(e) for e in encoded], out=offsets[1:])
+        return cls(b"".join(encoded), offsets)
+
+    @property
+    def blob(self) -> memoryview:
+        return self._blob
+
+    @property
+    def offsets(self) -> np.ndarray:
+        return self._offsets
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        start, end = int(self._offsets[i]), int(self._offsets[i + 1])
+        return str(self._blob[start:end], "utf-8")
+
+    def nbytes(self) -> int:
+        return int(self._blob.nbytes + self._offsets.nbytes)
+
+    def take(self, rows: np.ndarray) -> "PackedTexts":
+        """Các văn bản ở vị trí `rows` (giữ thứ tự), sao chép byte trực tiếp không giải mã."""
+        lengths = np.diff(self._offsets)[rows]
+        offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        blob = b"".join(self._blob[int(self._offsets[i]):int(self._offsets[i + 1])] for i in rows)
+        return PackedTexts(blob, offsets)
+
+    @classmethod
+    def concat(cls, first: "PackedTexts", second: "PackedTexts") -> "PackedTexts":
+        blob = bytes(first.blob) + bytes(second.blob)
+        offsets = np.concatenate([first.offsets, second.offsets[1:] + first.offsets[-1]])
+        return cls(blob, offsets)
+
+
+class ChunkSpans(Sequence):
+    """
+    Văn bản chunk biểu diễn bằng offset trên văn bản trang: mỗi trang được lưu một lần
+    (PackedTexts) và chunk thứ i là (hàng trang, byte đầu, byte cuối) trong trang đó.
+    Phần chồng lấp giữa các chunk liền nhau không bị lưu hai lần; văn bản chunk chỉ được
+    giải mã khi truy cập (vd. lúc dựng prompt).
+    """
+
+    def __init__(self, pages: PackedTexts, spans: np.ndarray):
+        self._pages = pages
+        self._spans = np.asarray(spans).reshape(-1, 3)
+
+    @classmethod
+    def from_chunks(cls, pages: Sequence[str], chunks: Sequence[Document]) -> "ChunkSpans":
+        """
+        Dựng từ văn bản các trang (`pages[i]` là trang có metadata "page" = i) và các chunk
+        đã chia từ chúng. Vị trí chunk lấy từ metadata "start_index" (add_start_index của
+        text splitter) hoặc được tìm lại trong trang; chunk không nằm nguyên văn trong trang
+        nào được lưu riêng như một trang phụ.
+        """
+        texts = list(pages)
+        spans = np.zeros((len(chunks), 3), dtype=np.int32)
+        # (vị trí ký tự, vị trí byte) đã tính gần nhất của mỗi trang: start_index tăng dần
+        # nên chỉ cần mã hóa phần văn bản giữa hai chunk liên tiếp
+        cursors: Dict[int, Tuple[int, int]] = {}
+        for i, chunk in enumerate(chunks):
+            content = chunk.page_content
+            row = chunk.metadata.get("page")
+            start = -1
+            if isinstance(row, int) and 0 <= row < len(pages):
+                text = texts[row]
+                start = chunk.metadata.get("start_index", -1)
+                if not isinstance(start, int) or text[start:start + len(content)] != content:
+                    start = text.find(content)
+            if start < 0:
+                row, start = len(texts), 0
+                texts.append(content)
+                text = content
+            char_pos, byte_pos = cursors.get(row, (0, 0))
+            if start < char_pos:
+                char_pos, byte_pos = 0, 0
+            byte_pos += len(text[char_pos:start].encode("utf-8"))
+            cursors[row] = (start, byte_pos)
+            spans[i] = (row, byte_pos, byte_pos + len(content.encode("utf-8")))
+        return cls(PackedTexts.pack(texts), spans)
+
+    @classmethod
+    def wrap(cls, texts: Sequence[str]) -> "ChunkSpans":
+        """ChunkSpans tương đương với `texts`, mỗi chunk là một trang riêng (dùng khi nối với chỉ mục cũ)."""
+        if isinstance(texts, ChunkSpans):
+            return texts
+        packed = texts if isinstance(texts, PackedTexts) else PackedTexts.pack(texts)
+        spans = np.zeros((len(packed), 3), dtype=np.int32)
+        spans[:, 0] = np.arange(len(packed))
+        spans[:, 2] = np.diff(packed.offsets)
+        return cls(packed, spans)
+
+    @property
+    def pages(self) -> PackedTexts:
+        return self._pages
+
+    @property
+    def spans(self) -> np.ndarray:
+        return self._spans
+
+    def __len__(self) -> int:
+        return len(self._spans)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        row, start, end = (int(v) for v in self._spans[i])
+        base = int(self._pages.offsets[row])
+        return str(self._pages.blob[base + start:base + end], "utf-8")
+
+    def nbytes(self) -> int:
+        return int(self._pages.nbytes() + self._spans.nbytes)
+
+    def take(self, rows: np.ndarray) -> "ChunkSpans":
+        """Các chunk ở vị trí `rows`; trang không còn chunk nào tham chiếu bị loại bỏ."""
+        spans = np.array(self._spans[rows], dtype=np.int32)
+        used, spans[:, 0] = np.unique(spans[:, 0], return_inverse=True)
+        return ChunkSpans(self._pages.take(used), spans)
+
+    @classmethod
+    def concat(cls, first: "ChunkSpans", second: "ChunkSpans") -> "ChunkSpans":
+        spans = np.array(second.spans, dtype=np.int32)
+        spans[:, 0] += len(first.pages)
+        return cls(PackedTexts.concat(first.pages, second.pages), np.concatenate([first.spans, spans]))
+
+
+class VectorIndex:
+    """
+    Chỉ mục vector của một người dùng: ma trận embedding float32 (n x d),
+    văn bản chunk (PackedTexts hoặc ChunkSpans), metadata và id tương ứng.
+    """
+
+    def __init__(
+        self,
+        embeddings: np.ndarray,
+        texts: Sequence[str],
+        metadatas: Optional[List[Dict[str, Any]]] = None,
+        ids: Optional[List[str]] = None,
+        extras: Optional[Dict[str, np.ndarray]] = None,
+        extra_info: Optional[Dict[str, Any]] = None,
+    ):
+        embeddings = np.asarray(embeddings)
+        # float16/int8: embedding đã lượng tử hóa (xem src/rag/quantize.py)
+        if embeddings.dtype not in (np.float32, np.float16, np.int8):
+            embeddings = embeddings.astype(np.float32)
+        if embeddings.ndim != 2:
+            embeddings = embeddings.reshape(len(texts), -1)
+        if len(embeddings) != len(texts):
+            raise ValueError("Số embedding và số chunk văn bản không khớp.")
+        if not isinstance(texts, (PackedTexts, ChunkSpans)):
+            texts = PackedTexts.pack(texts)
+        self.embeddings = embeddings
+        self.texts = texts
+        self.metadatas = metadatas if metadatas is not None else [{} for _ in range(len(texts))]
+        self.ids = ids if ids is not None else [str(i) for i in range(len(texts))]
+        # Các mảng phụ (vd. chỉ mục ANN) được lưu thành section riêng, kèm tham số dạng JSON
+        self.extras: Dict[str, np.ndarray] = dict(extras or {})
+        self.extra_info: Dict[str, Any] = dict(extra_info or {})
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    @property
+    def dim(self) -> int:
+        return int(self.embeddings.shape[1]) if self.embeddings.ndim == 2 else 0
+
+    def document(self, i: int) -> Document:
+        return Document(id=self.ids[i], page_content=self.texts[i], metadata=self.metadatas[i])
+
+    def nbytes(self) -> int:
+        """Ước lượng dung lượng bộ nhớ (byte) mà chỉ mục đang chiếm, gồm cả metadata và id."""
+        extras = sum(a.nbytes for a in self.extras.values())
+        objects = objects_nbytes(self.metadatas) + objects_nbytes(self.ids)
+        return int(self.embeddings.nbytes + self.texts.nbytes() + extras + objects)
+
+
+def objects_nbytes(objects: Sequence[Any]) -> int:
+    """Ước lượng dung lượng của một list đối tượng Python (chuỗi, hoặc dict một cấp như metadata)."""
+    total = sys.getsizeof(objects)
+    for obj in objects:
+        total += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            total += sum(sys.getsizeof(k) + sys.getsizeof(v) for k, v in obj.items())
+    return total
+
+
+def concat_indexes(first: VectorIndex, second: VectorIndex) -> VectorIndex:
+    """
+    Nối hai chỉ mục (các chunk của `second` đứng sau `first`), không embed lại.
+    Các mảng phụ (vd. ANN) không được giữ lại; phía gọi dựng lại nếu cần.
+    """
+    if len(first) and len(second) and first.dim != second.dim:
+        raise ValueError(f"Số chiều embedding không khớp: {first.dim} và {second.dim}.")
+    if not len(first):
+        return VectorIndex(second.embeddings, second.texts, list(second.metadatas), list(second.ids))
+    if not len(second):
+        return VectorIndex(first.embeddings, first.texts, list(first.metadatas), list(first.ids))
+    if isinstance(first.texts, PackedTexts) and isinstance(second.texts, PackedTexts):
+        texts = PackedTexts.concat(first.texts, second.texts)
+    else:
+        texts = ChunkSpans.concat(ChunkSpans.wrap(first.texts), ChunkSpans.wrap(second.texts))
+    return VectorIndex(
+        embeddings=np.concatenate([first.embeddings, second.embeddings]),
+        texts=texts,
+        metadatas=list(first.metadatas) + list(second.metadatas),
+        ids=list(first.ids) + list(second.ids),
+    )
+
+
+def select_rows(index: VectorIndex, keep: np.ndarray) -> VectorIndex:
+    """Chỉ mục mới chỉ gồm các chunk có keep[i] = True (giữ thứ tự, không embed lại)."""
+    rows = np.flatnonzero(keep)
+    return VectorIndex(
+        embeddings=index.embeddings[rows],
+        texts=index.texts.take(rows),
+        metadatas=[index.metadatas[i] for i in rows],
+        ids=[index.ids[i] for i in rows],
+    )
+
+
+def index_from_vectorstore(vector_store) -> VectorIndex:
+    """Chuyển một InMemoryVectorStore của langchain sang VectorIndex."""
+    records = list(vector_store.store.values())
+    if records:
+        matrix = np.asarray([r["vector"] for r in records], dtype=np.float32)
+    else:
+        matrix = np.zeros((0, 0), dtype=np.float32)
+    return VectorIndex(
+        embeddings=matrix,
+        texts=[r["text"] for r in records],
+        metadatas=[r.get("metadata") or {} for r in records],
+        ids=[str(r["id"]) for r in records],
+    )
+
+
+def _align(n: int) -> int:
+    return (n + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def serialize_index(index: VectorIndex, codec: Optional[str] = None) -> bytes:
+    """Serialize VectorIndex sang định dạng nhị phân có phiên bản."""
+    codec = (codec or INDEX_TEXT_CODEC).lower()
+    # Với ChunkSpans, blob văn bản là văn bản các trang và vị trí chunk nằm trong "chunk_spans"
+    spans = index.texts.spans if isinstance(index.texts, ChunkSpans) else None
+    texts = index.texts.pages if spans is not None else index.texts
+    text_raw = bytes(texts.blob)
+    text_payload = _compress(codec, text_raw)
+    matrix = np.ascontiguousarray(index.embeddings)
+    matrix = matrix.astype(matrix.dtype.newbyteorder("<"), copy=False)
+    offsets = np.ascontiguousarray(texts.offsets, dtype="<i8")
+
+    blobs: List[Tuple[str, bytes, Dict[str, Any]]] = [
+        ("embeddings", matrix.tobytes(), {"dtype": matrix.dtype.str, "shape": list(matrix.shape)}),
+        ("text_offsets", offsets.tobytes(), {"dtype": "<i8", "shape": [len(offsets)]}),
+        ("text", text_payload, {"codec": codec, "raw_length": len(text_raw)}),
+    ]
+    if spans is not None:
+        spans = np.ascontiguousarray(spans, dtype="<i4")
+        blobs.append(("chunk_spans", spans.tobytes(), {"dtype": "<i4", "shape": list(spans.shape)}))
+    for name, array in index.extras.items():
+        array = np.ascontiguousarray(array)
+        dtype = array.dtype.newbyteorder("<") if array.dtype.byteorder == ">" else array.dtype
+        array = array.astype(dtype, copy=False)
+        blobs.append((_EXTRA_PREFIX + name, array.tobytes(), {"dtype": dtype.str, "shape": list(array.shape)}))
+
+    # Offset của section tính từ đầu vùng dữ liệu (ngay sau header đã căn lề)
+    # để header không phụ thuộc vào chính độ dài của nó.
+    sections = {}
+    cursor = 0
+    for name, payload, info in blobs:
+        sections[name] = {"offset": cursor, "length": len(payload), **info}
+        cursor = _align(cursor + len(payload))
+
+    header = {
+        "count": len(index),
+        "dim": index.dim,
+        "ids": index.ids,
+        "metadata": index.metadatas,
+        "extra_info": index.extra_info,
+        "sections": sections,
+    }
+    header_bytes = json.dumps(header, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    out = bytearray(_PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header_bytes)))
+    out += header_bytes
+    data_start = _align(len(out))
+    for name, payload, _ in blobs:
+        out += b"\x00" * (data_start + sections[name]["offset"] - len(out))
+        out += payload
+    return bytes(out)
+
+
+def is_index_payload(data) -> bool:
+    return bytes(data[: len(MAGIC)]) == MAGIC
+
+
+def _section_array(buffer: memoryview, data_start: int, section: Dict[str, Any]) -> np.ndarray:
+    dtype = np.dtype(section["dtype"])
+    shape = tuple(section["shape"])
+    count = int(np.prod(shape)) if shape else 0
+    array = np.frombuffer(buffer, dtype=dtype, count=count, offset=data_start + section["offset"])
+    return array.reshape(shape)
+
+
+def deserialize_index(data) -> VectorIndex:
+    """
+    Đọc VectorIndex từ bytes. Ma trận embedding và mảng offsets là view
+    trực tiếp trên `data` (chỉ đọc), không sao chép.
+    """
+    buffer = memoryview(data)
+    if len(buffer) < _PREAMBLE.size:
+        raise IndexFormatError("Dữ liệu chỉ mục quá ngắn.")
+    magic, version, header_length = _PREAMBLE.unpack_from(buffer, 0)
+    if magic != MAGIC:
+        raise IndexFormatError("Sai magic bytes, đây không phải chỉ mục nhị phân.")
+    if version > FORMAT_VERSION:
+        raise IndexFormatError(f"Phiên bản định dạng {version} chưa được hỗ trợ.")
+    header = json.loads(bytes(buffer[_PREAMBLE.size:_PREAMBLE.size + header_length]))
+    sections = header["sections"]
+    data_start = _align(_PREAMBLE.size + header_length)
+
+    embeddings = _section_array(buffer, data_start, sections["embeddings"])
+    offsets = _section_array(buffer, data_start, sections["text_offsets"])
+    text_section = sections["text"]
+    text_start = data_start + text_section["offset"]
+    text_blob = buffer[text_start:text_start + text_section["length"]]
+    text_blob = _decompress(text_section.get("codec", "none"), text_blob, text_section.get("raw_length", 0))
+    texts = PackedTexts(text_blob, offsets)
+    if "chunk_spans" in sections:
+        texts = ChunkSpans(texts, _section_array(buffer, data_start, sections["chunk_spans"]))
+
+    extras = {
+        name[len(_EXTRA_PREFIX):]: _section_array(buffer, data_start, section)
+        for name, section in sections.items()
+        if name.startswith(_EXTRA_PREFIX)
+    }
+
+    return VectorIndex(
+        embeddings=embeddings,
+        texts=texts,
+        metadatas=header["metadata"],
+        ids=header["ids"],
+        extras=extras,
+        extra_info=header.get("extra_info"),
+    )
+
+
+def load_index(data) -> Tuple[VectorIndex, bool]:
+    """
+    Tải chỉ mục từ payload Redis. Hỗ trợ cả payload pickle cũ (InMemoryVectorStore).
+    Trả về (index, legacy) với legacy=True nếu payload cần được ghi lại theo định dạng mới.
+    """
+    if is_index_payload(data):
+        return deserialize_index(data), False
+
+    logger.warning("Phát hiện vectorstore dạng pickle cũ, đang chuyển đổi sang định dạng nhị phân.")
+    try:
+        legacy = pickle.loads(data)
+    except Exception as e:
+        raise IndexFormatError(f"Không thể đọc payload chỉ mục: {e}") from e
+    if isinstance(legacy, VectorIndex):
+        return legacy, True
+    if hasattr(legacy, "store"):
+        return index_from_vectorstore(legacy), True
+    raise IndexFormatError(f"Kiểu payload cũ không được hỗ trợ: {type(legacy).__name__}")
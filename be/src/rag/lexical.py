@@ -0,0 +1,159 @@
+"""
+Chỉ mục đảo (inverted index) BM25 gọn nhẹ cho truy xuất theo từ khóa, viết thuần NumPy.
+
+Posting list của mọi từ được lưu liền nhau dạng CSR (offsets + chunk id + tần suất),
+từ vựng là một blob utf-8 kèm offsets. Tất cả được lưu thành các section phụ của
+VectorIndex ("extra:bm25_*"), nên được serialize cùng embedding và đọc lại không sao chép.
+Tokenizer giữ nguyên các mã như "AB-1234", "3.2.1" hay "v2_final" thành một từ.
+"""
+import logging
+import math
+import os
+import re
+import sys
+import unicodedata
+from collections import Counter
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from src.rag.index_format import PackedTexts, VectorIndex
+
+logger = logging.getLogger(__name__)
+
+BM25_K1 = float(os.environ.get("BM25_K1", 1.2))
+BM25_B = float(os.environ.get("BM25_B", 0.75))
+
+_TOKEN = re.compile(r"\w(?:[\w\-./]*\w)?")
+_VOCAB = "bm25_vocab"
+_VOCAB_OFFSETS = "bm25_vocab_offsets"
+_POSTING_OFFSETS = "bm25_offsets"
+_POSTING_IDS = "bm25_ids"
+_POSTING_TFS = "bm25_tfs"
+_DOC_LENGTHS = "bm25_doc_lengths"
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN.findall(unicodedata.normalize("NFC", text).lower())
+
+
+class BM25Index:
+    """Chỉ mục BM25: từ vựng đã sắp xếp và posting list dạng CSR."""
+
+    def __init__(
+        self,
+        vocab: PackedTexts,
+        offsets: np.ndarray,
+        ids: np.ndarray,
+        tfs: np.ndarray,
+        doc_lengths: np.ndarray,
+        k1: float = BM25_K1,
+        b: float = BM25_B,
+    ):
+        self.vocab = vocab
+        self.offsets = offsets
+        self.ids = ids
+        self.tfs = tfs
+        self.doc_lengths = doc_lengths
+        self.k1 = k1
+        self.b = b
+        self.avgdl = float(doc_lengths.mean()) if len(doc_lengths) else 0.0
+        self._terms: Optional[Dict[str, int]] = None
+        self._terms_nbytes = 0
+
+    @property
+    def n_docs(self) -> int:
+        return len(self.doc_lengths)
+
+    def term_id(self, term: str) -> Optional[int]:
+        # Bảng từ -> id chỉ được dựng ở lần tra cứu đầu tiên
+        if self._terms is None:
+            terms = {term: i for i, term in enumerate(self.vocab)}
+            # Khóa là chuỗi Python, giá trị là int (28 byte với id ngoài bộ đệm số nhỏ của CPython)
+            self._terms_nbytes = sys.getsizeof(terms) + sum(sys.getsizeof(t) + 28 for t in terms)
+            self._terms = terms
+        return self._terms.get(term)
+
+    @classmethod
+    def build(cls, texts: Sequence[str], k1: float = BM25_K1, b: float = BM25_B) -> "BM25Index":
+        postings: Dict[str, List[tuple]] = {}
+        doc_lengths = np.zeros(len(texts), dtype=np.int32)
+        for doc, text in enumerate(texts):
+            tokens = tokenize(text)
+            doc_lengths[doc] = len(tokens)
+            for term, tf in Counter(tokens).items():
+                postings.setdefault(term, []).append((doc, tf))
+
+        terms = sorted(postings)
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum([len(postings[t]) for t in terms], out=offsets[1:])
+        ids = np.empty(int(offsets[-1]), dtype=np.int32)
+        tfs = np.empty(int(offsets[-1]), dtype=np.uint16)
+        for i, term in enumerate(terms):
+            entries = np.asarray(postings[term], dtype=np.int64)
+            ids[offsets[i]:offsets[i + 1]] = entries[:, 0]
+            tfs[offsets[i]:offsets[i + 1]] = np.minimum(entries[:, 1], np.iinfo(np.uint16).max)
+        return cls(PackedTexts.pack(terms), offsets, ids, tfs, doc_lengths, k1=k1, b=b)
+
+    def contains_all(self, terms: Sequence[str]) -> bool:
+        return all(self.term_id(t) is not None for t in terms)
+
+    def scores(self, query: str) -> np.ndarray:
+        """Điểm BM25 của câu truy vấn với mọi chunk."""
+        scores = np.zeros(self.n_docs, dtype=np.float32)
+        if not self.n_docs:
+            return scores
+        norm = self.k1 * (1 - self.b + self.b * self.doc_lengths / max(self.avgdl, 1e-9))
+        for term in set(tokenize(query)):
+            t = self.term_id(term)
+            if t is None:
+                continue
+            start, end = int(self.offsets[t]), int(self.offsets[t + 1])
+            ids = self.ids[start:end]
+            tf = self.tfs[start:end].astype(np.float32)
+            idf = math.log(1 + (self.n_docs - len(ids) + 0.5) / (len(ids) + 0.5))
+            scores[ids] += idf * tf * (self.k1 + 1) / (tf + norm[ids])
+        return scores
+
+    def nbytes(self) -> int:
+        return int(
+            self.vocab.blob.nbytes + self.vocab.offsets.nbytes + self.offsets.nbytes
+            + self.ids.nbytes + self.tfs.nbytes + self.doc_lengths.nbytes
+        ) + self.terms_nbytes()
+
+    def terms_nbytes(self) -> int:
+        """Dung lượng bảng từ -> id (0 cho đến lần tra cứu đầu tiên)."""
+        return self._terms_nbytes
+
+    def attach(self, index: VectorIndex) -> None:
+        """Lưu chỉ mục vào các section phụ của VectorIndex."""
+        index.extras[_VOCAB] = np.frombuffer(self.vocab.blob, dtype=np.uint8)
+        index.extras[_VOCAB_OFFSETS] = self.vocab.offsets
+        index.extras[_POSTING_OFFSETS] = self.offsets
+        index.extras[_POSTING_IDS] = self.ids
+        index.extras[_POSTING_TFS] = self.tfs
+        index.extras[_DOC_LENGTHS] = self.doc_lengths
+        index.extra_info["bm25"] = {"k1": self.k1, "b": self.b, "terms": len(self.vocab)}
+
+    @classmethod
+    def from_index(cls, index: VectorIndex) -> Optional["BM25Index"]:
+        if _VOCAB not in index.extras:
+            return None
+        info = index.extra_info.get("bm25", {})
+        return cls(
+            PackedTexts(index.extras[_VOCAB], index.extras[_VOCAB_OFFSETS]),
+            index.extras[_POSTING_OFFSETS],
+            index.extras[_POSTING_IDS],
+            index.extras[_POSTING_TFS],
+            index.extras[_DOC_LENGTHS],
+            k1=info.get("k1", BM25_K1),
+            b=info.get("b", BM25_B),
+        )
+
+
+def build_lexical_index(index: VectorIndex) -> BM25Index:
+    """Dựng chỉ mục BM25 trên văn bản các chunk và gắn vào VectorIndex (thay chỉ mục cũ nếu có)."""
+    bm25 = BM25Index.build(index.texts)
+    bm25.attach(index)
+    logger.info(f"Đã dựng chỉ mục BM25 với {len(bm25.vocab)} từ cho {len(index)} chunk.")
+    return bm25
@@ -0,0 +1,95 @@
+"""
+Embedding cục bộ trên CPU bằng feature hashing, không gọi mạng và không cần huấn luyện.
+
+Mỗi văn bản được tách từ (cùng tokenizer với BM25), các từ đơn và cặp từ liền nhau được băm
+(crc32, ổn định giữa các tiến trình) vào `dim` ô với dấu +/-; tần suất được nén theo log và
+vector được chuẩn hóa L2. Cả lô được dựng bằng một lần np.bincount nên rất nhanh, và kết quả
+hoàn toàn xác định: cùng văn bản luôn cho cùng vector trên mọi máy.
+
+Độ tương đồng phản ánh mức trùng từ giữa câu hỏi và chunk (giống truy xuất từ khóa mềm),
+đủ cho triển khai nội bộ không được phép gọi API bên ngoài và cho kiểm thử có ý nghĩa.
+"""
+import os
+import zlib
+from typing import Dict, List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from src.rag.lexical import tokenize
+
+# Số chiều của vector và độ dài n-gram từ tối đa (1 = chỉ từ đơn, 2 = thêm cặp từ).
+LOCAL_EMBEDDING_DIM = int(os.environ.get("LOCAL_EMBEDDING_DIM", 768))
+LOCAL_EMBEDDING_NGRAMS = int(os.environ.get("LOCAL_EMBEDDING_NGRAMS", 2))
+
+# Giới hạn bảng nhớ (token -> ô, dấu) để bộ nhớ không tăng mãi với từ vựng lớn
+_MAX_MEMO = 1_000_000
+
+
+class HashingEmbeddings(Embeddings):
+    """Embedding feature-hashing theo lô, xác định, chạy hoàn toàn cục bộ."""
+
+    # Không cần giới hạn quota hay cache Redis: tính lại nhanh hơn một round trip mạng
+    local = True
+
+    def __init__(self, dim: int = LOCAL_EMBEDDING_DIM, ngrams: int = LOCAL_EMBEDDING_NGRAMS):
+        self.dim = dim
+        self.ngrams = max(1, ngrams)
+        self._memo: Dict[str, int] = {}
+
+    @property
+    def model_name(self) -> str:
+        return f"local-hashing-{self.dim}-{self.ngrams}"
+
+    def _code(self, token: str) -> int:
+        """Mã của token: ô * 2 + (1 nếu dấu dương)."""
+        h = zlib.crc32(token.encode("utf-8"))
+        code = (h % self.dim) * 2 + ((h >> 31) & 1)
+        if len(self._memo) >= _MAX_MEMO:
+            self._memo.clear()
+        self._memo[token] = code
+        return code
+
+    def _features(self, text: str) -> List[str]:
+        tokens = tokenize(text)
+        features = list(tokens)
+        for n in range(2, self.ngrams + 1):
+            features.extend(" ".join(tokens[i:i + n]) for i in range(len(tokens) - n + 1))
+        return features
+
+    def embed_array(self, texts: List[str]) -> np.ndarray:
+        """Ma trận float32 (len(texts) x dim), mỗi hàng đã chuẩn hóa L2 (hàng rỗng giữ nguyên 0)."""
+        # Bảng nhớ được dùng chung giữa các luồng embed của pipeline: chỉ đọc bằng get()
+        # (một thao tác nguyên tử) vì luồng khác có thể xóa bảng bất cứ lúc nào
+        lookup = self._memo.get
+        codes: List[int] = []
+        lengths = np.zeros(len(texts), dtype=np.int64)
+        for row, text in enumerate(texts):
+            features = self._features(text)
+            for feature in features:
+                code = lookup(feature)
+                codes.append(code if code is not None else self._code(feature))
+            lengths[row] = len(features)
+        codes = np.asarray(codes, dtype=np.int64)
+        signs = (codes & 1) * 2.0 - 1.0
+        flat = np.repeat(np.arange(len(texts), dtype=np.int64) * self.dim, lengths) + (codes >> 1)
+        counts = np.bincount(flat, weights=signs, minlength=len(texts) * self.dim)
+        matrix = counts.reshape(len(texts), self.dim).astype(np.float32)
+        # Nén tần suất (từ lặp nhiều lần không lấn át các từ khác)
+        np.copysign(np.log1p(np.abs(matrix)), matrix, out=matrix)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        np.divide(matrix, norms, out=matrix, where=norms > 0)
+        return matrix
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_array(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_array([text])[0].tolist()
+
+    # Một câu hỏi chỉ mất vài chục micro giây: gọi trực tiếp thay vì chuyển sang thread pool
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_documents(texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return self.embed_query(text)
@@ -0,0 +1,158 @@
+"""
+Trích xuất văn bản PDF theo từng trang, song song bằng nhiều tiến trình cho tài liệu lớn.
+
+Mỗi tiến trình con mở PdfReader một lần trên cùng nội dung bytes, sau đó lấy lần lượt
+số trang từ hàng đợi chung để trích xuất. Kết quả được ghép lại theo đúng thứ tự trang.
+Một trang vượt quá PDF_PAGE_TIMEOUT giây được bỏ qua (văn bản rỗng): các tiến trình hiện tại
+bị dừng và một nhóm tiến trình mới (với hàng đợi mới) tiếp tục các trang còn lại, nên một
+trang bất thường không làm treo cả task.
+
+Tiến trình được tạo bằng billiard (thư viện multiprocessing của Celery): tiến trình con của
+worker Celery prefork là tiến trình daemon, và multiprocessing không cho tiến trình daemon tạo
+tiến trình con. Pool của billiard không được dùng vì việc dừng pool khi còn tiến trình kẹt
+có thể bị treo.
+"""
+import io
+import logging
+import os
+import queue
+import time
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+import billiard
+from pypdf import PdfReader
+
+logger = logging.getLogger(__name__)
+
+# PDF có ít trang hơn ngưỡng này được trích xuất tuần tự (chi phí tạo tiến trình không đáng).
+PDF_PARALLEL_MIN_PAGES = int(os.environ.get("PDF_PARALLEL_MIN_PAGES", 32))
+# Số tiến trình trích xuất tối đa, mặc định bằng số CPU.
+PDF_EXTRACT_WORKERS = int(os.environ.get("PDF_EXTRACT_WORKERS", os.cpu_count() or 1))
+# Thời gian tối đa (giây) chờ một trang trong chế độ song song.
+PDF_PAGE_TIMEOUT = float(os.environ.get("PDF_PAGE_TIMEOUT", 30))
+
+_reader: Optional[PdfReader] = None
+
+
+def _init_worker(file_content: bytes) -> None:
+    global _reader
+    _reader = PdfReader(io.BytesIO(file_content))
+
+
+def _extract_page(page_number: int) -> str:
+    return _reader.pages[page_number].extract_text()
+
+
+def _worker_loop(file_content: bytes, tasks, results) -> None:
+    _init_worker(file_content)
+    while True:
+        page_number = tasks.get()
+        if page_number is None:
+            return
+        try:
+            results.put((page_number, _extract_page(page_number)))
+        except Exception as e:
+            results.put((page_number, e))
+
+
+def _start_workers(
+    file_content: bytes, pages: Sequence[int], n_workers: int
+) -> Tuple[List, "billiard.Queue", "billiard.Queue"]:
+    tasks, results = billiard.Queue(), billiard.Queue()
+    for page_number in pages:
+        tasks.put(page_number)
+    processes = [
+        billiard.Process(target=_worker_loop, args=(file_content, tasks, results), daemon=True)
+        for _ in range(max(1, min(n_workers, len(pages))))
+    ]
+    for process in processes:
+        tasks.put(None)
+        process.start()
+    return processes, tasks, results
+
+
+def _stop_workers(processes: List, tasks: Optional["billiard.Queue"]) -> None:
+    for process in processes:
+        if process.is_alive():
+            process.terminate()
+    for process in processes:
+        process.join()
+    if tasks is not None:
+        # Các trang chưa được lấy khỏi hàng đợi bị bỏ, không chờ ghi hết vào pipe
+        tasks.cancel_join_thread()
+        tasks.close()
+
+
+def _iter_pool_pages(file_content: bytes, n_pages: int, workers: int, page_timeout: float) -> Iterator[str]:
+    """Lấy kết quả từ các tiến trình theo đúng thứ tự trang; luôn dừng chúng khi kết thúc hoặc bị dừng giữa chừng."""
+    done = {}
+    timed_out = []
+    processes, tasks, results = _start_workers(file_content, range(n_pages), workers)
+    try:
+        for page_number in range(n_pages):
+            deadline = time.monotonic() + page_timeout
+            while page_number not in done:
+                remaining = deadline - time.monotonic()
+                try:
+                    if remaining <= 0:
+                        raise queue.Empty
+                    number, text = results.get(timeout=remaining)
+                except queue.Empty:
+                    # Không biết tiến trình nào đang kẹt: dừng tất cả, các trang còn lại chạy trên nhóm mới
+                    timed_out.append(page_number)
+                    done[page_number] = ""
+                    _stop_workers(processes, tasks)
+                    rest = [p for p in range(page_number + 1, n_pages) if p not in done]
+                    processes, tasks, results = _start_workers(file_content, rest, workers) if rest else ([], None, None)
+                    continue
+                if isinstance(text, Exception):
+                    raise text
+                done[number] = text
+            yield done.pop(page_number)
+    finally:
+        if timed_out:
+            logger.warning(f"Bỏ qua {len(timed_out)} trang PDF quá thời gian {page_timeout}s: {timed_out}")
+        _stop_workers(processes, tasks)
+
+
+def count_pages(file_content: bytes) -> int:
+    return len(PdfReader(io.BytesIO(file_content)).pages)
+
+
+def iter_pages(
+    file_content: bytes,
+    parallel: Optional[bool] = None,
+    min_pages: int = PDF_PARALLEL_MIN_PAGES,
+    workers: int = PDF_EXTRACT_WORKERS,
+    page_timeout: float = PDF_PAGE_TIMEOUT,
+) -> Iterator[str]:
+    """
+    Sinh văn bản của từng trang theo thứ tự ngay khi trang đó được trích xuất.
+    `parallel=None` tự chọn: song song khi PDF có ít nhất `min_pages` trang và
+    có nhiều hơn một CPU, ngược lại tuần tự.
+    """
+    reader = PdfReader(io.BytesIO(file_content))
+    n_pages = len(reader.pages)
+    if parallel is None:
+        parallel = n_pages >= min_pages and workers > 1
+
+    if parallel and n_pages > 1:
+        try:
+            pages = _iter_pool_pages(file_content, n_pages, workers, page_timeout)
+            # Tạo tiến trình ngay để lỗi (nếu có) xảy ra trước khi sinh trang đầu tiên
+            first = next(pages)
+        except (AssertionError, OSError) as e:
+            # Ví dụ: môi trường không cho tạo tiến trình (giới hạn tài nguyên, sandbox)
+            logger.warning(f"Không thể trích xuất PDF song song ({e}), chuyển sang tuần tự.")
+        else:
+            yield first
+            yield from pages
+            return
+
+    for page in reader.pages:
+        yield page.extract_text()
+
+
+def extract_pages(file_content: bytes, **kwargs) -> List[str]:
+    """Trích xuất văn bản của mọi trang (xem `iter_pages` cho các tham số)."""
+    return list(iter_pages(file_content, **kwargs))
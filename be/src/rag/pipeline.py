@@ -0,0 +1,194 @@
+"""
+Pipeline ingest dạng luồng: trích xuất trang -> chia chunk -> embed theo lô.
+
+Một luồng producer trích xuất và chia nhỏ từng trang ngay khi trang đó sẵn sàng,
+gom chunk thành các lô và đẩy vào hàng đợi có giới hạn. Luồng chính lấy các lô ra và
+gửi embed song song (tối đa `max_in_flight` lô). Khi hàng đợi đầy, producer bị chặn lại
+(backpressure) nên bộ nhớ không phình ra với PDF lớn, và việc chờ mạng của embedding
+bắt đầu ngay từ những trang đầu tiên thay vì sau khi cả PDF đã được phân tích.
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from typing import Callable, Iterable, List, Optional
+
+import numpy as np
+from langchain_core.documents import Document
+
+from src.metrics import EVENTS, STAGE_SECONDS
+from src.rag.embedding_scheduler import EMBEDDING_BATCH_SIZE, EMBEDDING_MAX_CONCURRENCY
+from src.rag.index_format import ChunkSpans, VectorIndex
+
+logger = logging.getLogger(__name__)
+
+# Số lô chunk tối đa chờ embed trong hàng đợi trước khi producer phải dừng lại.
+PIPELINE_QUEUE_SIZE = int(os.environ.get("PIPELINE_QUEUE_SIZE", 4))
+
+_DONE = object()
+
+
+@dataclass
+class IngestProgress:
+    pages_total: int = 0
+    pages_extracted: int = 0
+    chunks_split: int = 0
+    chunks_embedded: int = 0
+
+    def describe(self) -> str:
+        return (
+            f"processing: {self.pages_extracted}/{self.pages_total} pages extracted, "
+            f"{self.chunks_embedded}/{self.chunks_split} chunks embedded"
+        )
+
+
+def _embed(embedder, texts: List[str]) -> np.ndarray:
+    EVENTS.inc("chunks_embedded", amount=len(texts))
+    with STAGE_SECONDS.time("embed_batch"):
+        if hasattr(embedder, "embed_array"):
+            return embedder.embed_array(texts)
+        return np.asarray(embedder.embed_documents(texts), dtype=np.float32)
+
+
+def ingest_pages(
+    pages: Iterable[str],
+    split: Callable[[List[Document]], List[Document]],
+    embedder,
+    pages_total: int = 0,
+    on_progress: Optional[Callable[[IngestProgress], None]] = None,
+    batch_size: int = EMBEDDING_BATCH_SIZE,
+    max_in_flight: int = EMBEDDING_MAX_CONCURRENCY,
+    queue_size: int = PIPELINE_QUEUE_SIZE,
+) -> VectorIndex:
+    """
+    Chạy pipeline trên luồng văn bản các trang và trả về VectorIndex.
+    `split` nhận danh sách Document của một trang (vd. SplittingDocuments).
+    """
+    progress = IngestProgress(pages_total=pages_total)
+    batches: "queue.Queue" = queue.Queue(maxsize=max(1, queue_size))
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                batches.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    # Văn bản các trang được giữ lại một lần; chunk trong chỉ mục là offset trên trang
+    page_texts: List[str] = []
+
+    def produce():
+        pending: List[Document] = []
+        try:
+            for page_number, text in enumerate(pages):
+                page_texts.append(text)
+                progress.pages_extracted = page_number + 1
+                chunks = split([Document(page_content=text, metadata={"page": page_number})])
+                progress.chunks_split += len(chunks)
+                pending.extend(chunks)
+                while len(pending) >= batch_size:
+                    if not put(pending[:batch_size]):
+                        return
+                    pending = pending[batch_size:]
+            if pending:
+                put(pending)
+            put(_DONE)
+        except BaseException as e:
+            put(e)
+        finally:
+            # Dừng generator (vd. process pool trích xuất PDF) nếu pipeline bị hủy giữa chừng
+            close = getattr(pages, "close", None)
+            if close is not None:
+                close()
+
+    producer = threading.Thread(target=produce, name="ingest-producer", daemon=True)
+    producer.start()
+
+    chunks: List[Document] = []
+    futures: List[Future] = []
+    in_flight: List[Future] = []
+    executor = ThreadPoolExecutor(max_workers=max(1, max_in_flight), thread_name_prefix="ingest-embed")
+
+    def report():
+        if on_progress is not None:
+            on_progress(progress)
+
+    lock = threading.Lock()
+
+    def on_done(future: Future, size: int):
+        if not future.cancelled() and not future.exception():
+            with lock:
+                progress.chunks_embedded += size
+
+    try:
+        while True:
+            item = batches.get()
+            if item is _DONE:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            # Giới hạn số lô đang embed: chờ lô cũ nhất xong trước khi gửi thêm
+            while len(in_flight) >= max_in_flight:
+                in_flight.pop(0).result()
+                report()
+            future = executor.submit(_embed, embedder, [doc.page_content for doc in item])
+            future.add_done_callback(lambda f, n=len(item): on_done(f, n))
+            chunks.extend(item)
+            futures.append(future)
+            in_flight.append(future)
+            report()
+
+        vectors = [f.result() for f in futures]
+        report()
+    except BaseException:
+        stop.set()
+        for f in futures:
+            f.cancel()
+        raise
+    finally:
+        executor.shutdown(wait=True)
+        producer.join(timeout=5)
+
+    matrix = np.concatenate(vectors) if vectors else np.zeros((0, 0), dtype=np.float32)
+    return VectorIndex(
+        embeddings=matrix,
+        texts=ChunkSpans.from_chunks(page_texts, chunks),
+        metadatas=[dict(doc.metadata) for doc in chunks],
+    )
+
+
+class ProgressReporter:
+    """
+    Ghi tiến độ vào Redis (mặc định `user:{uid}:status`, hoặc `key`), tối đa một lần mỗi `interval` giây.
+    Nếu truyền `task` (Celery), tiến độ cũng được ghi vào trạng thái PROGRESS của task;
+    nếu truyền `events` (TaskEventPublisher), tiến độ được đẩy tới client qua pub/sub.
+    """
+
+    def __init__(self, redis_client, uid: str, ttl: int, interval: float = 0.5, task=None, events=None, key=None):
+        self.redis_client = redis_client
+        self.key = key or f"user:{uid}:status"
+        self.ttl = ttl
+        self.interval = interval
+        self.task = task
+        self.events = events
+        self._last = 0.0
+
+    def __call__(self, progress: IngestProgress) -> None:
+        now = time.monotonic()
+        if now - self._last < self.interval:
+            return
+        self._last = now
+        try:
+            self.redis_client.set(self.key, progress.describe(), ex=self.ttl)
+            if self.task is not None:
+                self.task.update_state(state="PROGRESS", meta=asdict(progress))
+            if self.events is not None:
+                self.events.publish("PROGRESS", asdict(progress))
+        except Exception as e:
+            logger.warning(f"Không thể ghi tiến độ vào {self.key}: {e}")
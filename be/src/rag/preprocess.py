@@ -1,6 +1,7 @@
-import io
+import functools
+import itertools
 import time
-from typing import Any, List, TypedDict
+from typing import Any, AsyncIterator, List, Optional, Tuple, TypedDict
 import os
 import dotenv
 import logging
@@ -8,16 +9,21 @@ import logging
 # Import các thư viện cần thiết, bao gồm InMemoryVectorStore
 from langchain.chat_models import init_chat_model
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
-from langchain_community.document_loaders import PyPDFLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_core.documents import Document
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
 from langchain_core.prompts import PromptTemplate
-from langchain_community.vectorstores import InMemoryVectorStore
-from langchain_core.runnables import RunnablePassthrough
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.vectorstores import VectorStoreRetriever
-from pypdf import PdfReader
+from langchain_core.retrievers import BaseRetriever
+import numpy as np
+from src.metrics import STAGE_SECONDS
 from src.rag import PROMPTS
+from src.rag.embedding_scheduler import EmbeddingScheduler, QuotaRateLimit
+from src.rag.concurrency import llm_limiter
+from src.rag.index_format import ChunkSpans, VectorIndex
+from src.rag.local_embeddings import HashingEmbeddings
+from src.rag.pdf_extract import extract_pages
 
 dotenv.load_dotenv()
 logger = logging.getLogger(__name__)
@@ -27,6 +33,15 @@ if not os.environ.get("GOOGLE_API_KEY"):
 
 # Khởi tạo đối tượng embeddings một lần duy nhất
 USE_MOCK_EMBEDDINGS = os.environ.get("USE_MOCK_EMBEDDINGS", "False").lower() in ("true", "1", "t")
+# Dùng LLM giả lập cục bộ thay cho Gemini (kiểm thử, streaming không cần mạng)
+USE_MOCK_LLM = os.environ.get("USE_MOCK_LLM", "False").lower() in ("true", "1", "t")
+MOCK_LLM_ANSWER = "Đây là một câu trả lời giả lập dựa trên tài liệu của bạn."
+EMBEDDING_BACKENDS = ("gemini", "hashing", "mock")
+# Nguồn embedding: "gemini" (API), "hashing" (feature hashing cục bộ trên CPU, không gọi mạng)
+# hoặc "mock". USE_MOCK_EMBEDDINGS vẫn được hỗ trợ và tương đương "mock".
+EMBEDDING_BACKEND = os.environ.get("EMBEDDING_BACKEND", "mock" if USE_MOCK_EMBEDDINGS else "gemini").lower()
+# Địa chỉ thay thế cho Gemini API (vd. máy chủ giả lập loadtest/fake_gemini.py khi kiểm thử tải)
+GEMINI_BASE_URL = os.environ.get("GEMINI_BASE_URL") or None
 
 # Định nghĩa một lớp mock để thay thế GoogleGenerativeAIEmbeddings
 class MockEmbeddings:
@@ -46,12 +61,27 @@ class MockEmbeddings:
         time.sleep(1)
         return [float(i) for i in range(768)]
 
-if USE_MOCK_EMBEDDINGS:
+if EMBEDDING_BACKEND == "mock":
+    EMBEDDING_MODEL_NAME = "mock"
     embeddings = MockEmbeddings()
-else:
+elif EMBEDDING_BACKEND == "hashing":
+    embeddings = HashingEmbeddings()
+    # Tên model gồm cả số chiều, để cache embedding không lẫn giữa các cấu hình
+    EMBEDDING_MODEL_NAME = embeddings.model_name
+    logger.info(f"Sử dụng embedding cục bộ {EMBEDDING_MODEL_NAME}, không gọi API embeddings.")
+elif EMBEDDING_BACKEND == "gemini":
     if not os.environ.get("GOOGLE_API_KEY"):
         logger.warning("GOOGLE API KEY is not found")
-    embeddings = GoogleGenerativeAIEmbeddings(model="models/gemini-embedding-001")
+    EMBEDDING_MODEL_NAME = "models/gemini-embedding-001"
+    embeddings = GoogleGenerativeAIEmbeddings(model=EMBEDDING_MODEL_NAME, base_url=GEMINI_BASE_URL)
+else:
+    raise ValueError(f"EMBEDDING_BACKEND không hợp lệ: {EMBEDDING_BACKEND}, cần một trong {', '.join(EMBEDDING_BACKENDS)}")
+
+# Embedding chạy trong tiến trình (vd. HashingEmbeddings) không cần quota, chia lô song song hay cache Redis
+LOCAL_EMBEDDINGS = getattr(embeddings, "local", False)
+
+# Gọi embed_documents theo lô, song song và tôn trọng quota của nhà cung cấp
+embedding_scheduler = embeddings if LOCAL_EMBEDDINGS else EmbeddingScheduler(embeddings)
 
 
     
@@ -60,63 +90,104 @@ class State(TypedDict):
     context: List[Document]
     answer: str
 
-def PDFLoader(file_content: bytes):
-    pdf_file_in_memory = io.BytesIO(file_content)
-    reader = PdfReader(pdf_file_in_memory)
-    pages = [page.extract_text() for page in reader.pages]
+@STAGE_SECONDS.timed("pdf_load")
+def PDFLoader(file_content: bytes, parallel: Optional[bool] = None):
+    """
+    Trích xuất văn bản từng trang của PDF. PDF lớn được trích xuất song song
+    bằng process pool (xem src/rag/pdf_extract.py); `parallel=None` để tự chọn.
+    """
+    pages = extract_pages(file_content, parallel=parallel)
     
     # We return a list of langchain Document objects
-    return [Document(page_content=text) for text in pages]
-    # loader = PyPDFLoader(
-    #     pdf_file_in_memory,
-    #     mode='page'
-    # )
-
-    # docs = loader.load()
-    # return docs
+    return [Document(page_content=text, metadata={"page": i}) for i, text in enumerate(pages)]
 
+@STAGE_SECONDS.timed("split")
 def SplittingDocuments(docs):
+    """
+    Chia các trang thành chunk. Mỗi chunk giữ metadata "page" của trang và "start_index"
+    (vị trí ký tự trong trang) để chỉ mục lưu chunk dưới dạng offset (xem ChunkSpans) và trích dẫn nguồn.
+    """
     text_splitter = RecursiveCharacterTextSplitter(
         chunk_size=1000,
         chunk_overlap=100,
+        add_start_index=True,
     )
     
     all_splits = text_splitter.split_documents(docs)
 
-    logger.warning(all_splits)
+    logger.debug(f"Đã chia {len(docs)} trang thành {len(all_splits)} chunk")
     return all_splits
 
-def StoringDocuments(splitted_docs):
+@STAGE_SECONDS.timed("embed")
+def StoringDocuments(splitted_docs, embedder=None, pages=None):
     """
-    Tạo một vector store trong bộ nhớ và lưu dữ liệu.
-    Hàm này không cần nhận embeddings nữa vì nó đã là global.
+    Embed các chunk và tạo chỉ mục vector (VectorIndex) trong bộ nhớ.
+    `embedder` mặc định là embedding_scheduler (chia lô, song song, giới hạn quota);
+    có thể truyền CachedEmbeddings để dùng lại embedding đã tính và gộp các chunk trùng nhau.
+    Nếu truyền `pages` (các trang từ PDFLoader), văn bản mỗi trang chỉ được lưu một lần
+    và các chunk là offset trên trang (ChunkSpans).
     """
-    # Tạo vector store trong bộ nhớ
-    vector_store = InMemoryVectorStore.from_documents(
-        documents=splitted_docs,
-        embedding=embeddings,
+    embedder = embedder or embedding_scheduler
+    texts = [doc.page_content for doc in splitted_docs]
+    if hasattr(embedder, "embed_array"):
+        vectors = embedder.embed_array(texts)
+    else:
+        vectors = np.asarray(embedder.embed_documents(texts), dtype=np.float32) if texts else np.zeros((0, 0))
+
+    if pages is not None:
+        texts = ChunkSpans.from_chunks([page.page_content for page in pages], splitted_docs)
+    return VectorIndex(
+        embeddings=vectors,
+        texts=texts,
+        metadatas=[dict(doc.metadata) for doc in splitted_docs],
     )
 
-    return vector_store
-
-def RetrieveDocument(query: str, vector_store: InMemoryVectorStore):
+@functools.lru_cache(maxsize=1)
+def GetLLM():
     """
-    Truy vấn thông tin từ vector store trong bộ nhớ.
+    Khởi tạo mô hình chat một lần cho mỗi tiến trình (giữ lại client và kết nối HTTP).
+    Với USE_MOCK_LLM, dùng mô hình giả lập cục bộ (trả lời cố định, hỗ trợ streaming)
+    để kiểm thử mà không gọi API.
     """
-    retriever = vector_store.as_retriever()
-    
-    # Khởi tạo llm và prompt
-    llm = init_chat_model("gemini-2.5-flash", model_provider="google_genai")
+    if USE_MOCK_LLM:
+        return GenericFakeChatModel(messages=itertools.cycle([AIMessage(content=MOCK_LLM_ANSWER)]))
+    return init_chat_model("gemini-2.5-flash", model_provider="google_genai", base_url=GEMINI_BASE_URL)
+
+@functools.lru_cache(maxsize=1)
+def GetAnswerChain():
+    """Chuỗi prompt | llm | parser dùng chung, nhận {"context", "question"}."""
     prompt = PromptTemplate.from_template(PROMPTS.RAG_PROMPT)
-    
-    qa_chain = (
-        {"context": retriever, "question": RunnablePassthrough()}
-        | prompt
-        | llm
-        | StrOutputParser()
-    )
-    return qa_chain.invoke(query)
+    return prompt | GetLLM() | StrOutputParser()
 
-class QuotaRateLimit(Exception):
-    def __init__(self, *args):
-        super().__init__(*args)
+@STAGE_SECONDS.timed("llm")
+async def GenerateAnswer(query: str, docs: List[Document]) -> str:
+    """
+    Sinh câu trả lời từ các chunk đã truy xuất bằng `ainvoke`, không chiếm luồng của thread pool
+    trong lúc chờ LLM. Số lời gọi LLM đồng thời bị giới hạn bởi llm_limiter (LLM_MAX_CONCURRENCY).
+    """
+    async with llm_limiter:
+        return await GetAnswerChain().ainvoke({"context": docs, "question": query})
+
+async def RetrieveDocumentStream(query: str, retriever: BaseRetriever, llm=None) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    Truy xuất bằng retriever rồi sinh câu trả lời dạng streaming: trước tiên sinh
+    ("sources", danh sách Document) rồi sinh ("token", đoạn văn bản) ngay khi LLM trả về qua `astream`.
+    Đóng generator (vd. client ngắt kết nối) sẽ hủy lời gọi LLM đang chạy.
+    """
+    started = time.perf_counter()
+    docs = await retriever.ainvoke(query)
+    yield "sources", docs
+
+    if llm is None:
+        answer_chain = GetAnswerChain()
+    else:
+        answer_chain = PromptTemplate.from_template(PROMPTS.RAG_PROMPT) | llm | StrOutputParser()
+    async with llm_limiter:
+        with STAGE_SECONDS.time("llm_stream"):
+            first = True
+            async for token in answer_chain.astream({"context": docs, "question": query}):
+                if token:
+                    if first:
+                        STAGE_SECONDS.observe(time.perf_counter() - started, "stream_first_token")
+                        first = False
+                    yield "token", token
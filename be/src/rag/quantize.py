@@ -0,0 +1,123 @@
+"""
+Lượng tử hóa ma trận embedding để giảm dung lượng trong Redis và bộ nhớ của API.
+
+- "float16": mỗi chiều 2 byte (giảm 2 lần), sai số không đáng kể với vector đã chuẩn hóa.
+- "int8": mỗi chiều 1 byte kèm một hệ số scale float32 cho mỗi vector (giảm ~4 lần).
+
+Khi tìm kiếm, ma trận lượng tử hóa được giải lượng tử theo từng khối hàng rồi nhân với
+câu hỏi float32 (BLAS), nên bộ nhớ tạm không phụ thuộc vào số chunk và điểm là chính xác
+đối với các vector đã lưu. Vector float32 gốc không được giữ lại (đó chính là phần bộ nhớ
+tiết kiệm được), nên không có bước chấm điểm lại nào chính xác hơn.
+"""
+import os
+from typing import Optional, Tuple
+
+import numpy as np
+
+from src.rag.index_format import VectorIndex
+
+QUANTIZATION_METHODS = ("none", "float16", "int8")
+# Cách lưu embedding trong chỉ mục: "none" (float32), "float16" hoặc "int8".
+EMBEDDING_QUANTIZATION = os.environ.get("EMBEDDING_QUANTIZATION", "none").lower()
+
+_SCALES = "embedding_scales"
+_BLOCK_ROWS = 8192
+_INT8_MAX = 127
+
+
+def quantize_rows(matrix: np.ndarray, method: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """Trả về (ma trận đã lượng tử hóa, scale theo hàng hoặc None)."""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if method == "none":
+        return matrix, None
+    if method == "float16":
+        return matrix.astype(np.float16), None
+    if method == "int8":
+        scales = np.abs(matrix).max(axis=1) / _INT8_MAX if matrix.size else np.zeros(len(matrix), dtype=np.float32)
+        scales = scales.astype(np.float32)
+        safe = np.where(scales > 0, scales, 1.0)
+        quantized = np.clip(np.rint(matrix / safe[:, None]), -_INT8_MAX, _INT8_MAX).astype(np.int8)
+        return quantized, scales
+    raise ValueError(f"Kiểu lượng tử hóa không được hỗ trợ: {method}")
+
+
+def embedding_scales(index: VectorIndex) -> Optional[np.ndarray]:
+    return index.extras.get(_SCALES)
+
+
+def quantization_of(index: VectorIndex) -> str:
+    return index.extra_info.get("quantization", {}).get("method", "none")
+
+
+def quantize_index(index: VectorIndex, method: str = None) -> VectorIndex:
+    """Lượng tử hóa embedding (đã chuẩn hóa) của chỉ mục tại chỗ."""
+    method = (method or EMBEDDING_QUANTIZATION).lower()
+    if quantization_of(index) != "none":
+        dequantize_index(index)
+    index.embeddings, scales = quantize_rows(index.embeddings, method)
+    if scales is not None:
+        index.extras[_SCALES] = scales
+    if method != "none":
+        index.extra_info["quantization"] = {"method": method}
+    return index
+
+
+def dequantize_index(index: VectorIndex) -> VectorIndex:
+    """Đưa embedding của chỉ mục về float32 tại chỗ (vd. trước khi nối thêm tài liệu)."""
+    method = quantization_of(index)
+    if method == "none":
+        return index
+    index.embeddings = dequantize_rows(index.embeddings, index.extras.get(_SCALES))
+    index.extras.pop(_SCALES, None)
+    index.extra_info.pop("quantization", None)
+    return index
+
+
+def dequantize_rows(matrix: np.ndarray, scales: Optional[np.ndarray]) -> np.ndarray:
+    matrix = matrix.astype(np.float32)
+    if scales is not None:
+        matrix *= scales[:, None]
+    return matrix
+
+
+class QuantizedScorer:
+    """Tính điểm tích vô hướng của câu hỏi với các hàng của ma trận float32/float16/int8."""
+
+    def __init__(self, matrix: np.ndarray, scales: Optional[np.ndarray] = None):
+        self.matrix = matrix
+        self.scales = scales
+
+    @property
+    def quantized(self) -> bool:
+        return self.matrix.dtype != np.float32
+
+    def rows(self, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Các hàng (đã giải lượng tử về float32)."""
+        matrix = self.matrix if rows is None else self.matrix[rows]
+        scales = None if self.scales is None else (self.scales if rows is None else self.scales[rows])
+        return dequantize_rows(matrix, scales)
+
+    def scores(self, query: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Điểm của câu hỏi (float32, đã chuẩn hóa) với các hàng `rows` (None = mọi hàng)."""
+        if not self.quantized:
+            matrix = self.matrix if rows is None else self.matrix[rows]
+            return matrix @ query
+        n = len(self.matrix) if rows is None else len(rows)
+        out = np.empty(n, dtype=np.float32)
+        for start in range(0, n, _BLOCK_ROWS):
+            block = slice(start, start + _BLOCK_ROWS)
+            out[block] = self.rows(block if rows is None else rows[block]) @ query
+        return out
+
+    def scores_many(self, queries: np.ndarray) -> np.ndarray:
+        """Điểm của nhiều câu hỏi với mọi hàng (len(queries) x n)."""
+        if not self.quantized:
+            return queries @ self.matrix.T
+        out = np.empty((len(queries), len(self.matrix)), dtype=np.float32)
+        for start in range(0, len(self.matrix), _BLOCK_ROWS):
+            block = slice(start, start + _BLOCK_ROWS)
+            out[:, block] = queries @ self.rows(block).T
+        return out
+
+    def nbytes(self) -> int:
+        return int(self.matrix.nbytes + (self.scales.nbytes if self.scales is not None else 0))
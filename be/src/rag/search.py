@@ -0,0 +1,346 @@
+"""
+Bộ máy tìm kiếm top-k vector hóa bằng NumPy.
+
+Các embedding được chuẩn hóa (L2) sẵn trong một ma trận float32 duy nhất, nên
+độ tương đồng cosine của câu truy vấn với toàn bộ chunk chỉ là một phép nhân
+ma trận - vector. Top-k được chọn bằng `np.argpartition` (O(n)) thay vì sắp xếp toàn bộ.
+Với tài liệu lớn có chỉ mục IVF (xem src/rag/ann.py), chỉ các cụm gần nhất được quét.
+
+Ngoài tìm kiếm dense, engine hỗ trợ tìm kiếm từ khóa BM25 (src/rag/lexical.py) và kết hợp
+hai cách (hybrid) bằng reciprocal-rank fusion. Câu hỏi dạng từ khóa thuần (mã số, tên riêng)
+có thể được trả lời chỉ bằng BM25, bỏ qua lời gọi embed_query.
+"""
+import asyncio
+import os
+import re
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from pydantic import ConfigDict
+
+from src.metrics import EVENTS, STAGE_SECONDS
+from src.rag.ann import ANN_MIN_CHUNKS, ANN_NPROBE, IVFFlatIndex
+from src.rag.index_format import VectorIndex
+from src.rag.lexical import BM25Index, tokenize
+from src.rag.quantize import QuantizedScorer, embedding_scales
+
+MetadataFilter = Union[Dict[str, Any], Callable[[Document], bool]]
+
+RETRIEVAL_MODES = ("dense", "lexical", "hybrid")
+# Chế độ truy xuất mặc định: "dense", "lexical" hoặc "hybrid".
+RETRIEVAL_MODE = os.environ.get("RETRIEVAL_MODE", "dense").lower()
+# Trả lời câu hỏi dạng từ khóa thuần bằng BM25, không cần embed câu hỏi.
+LEXICAL_FAST_PATH = os.environ.get("LEXICAL_FAST_PATH", "True").lower() in ("true", "1", "t")
+# Số từ tối đa của một câu hỏi được coi là tra cứu từ khóa.
+LEXICAL_FAST_PATH_MAX_TOKENS = int(os.environ.get("LEXICAL_FAST_PATH_MAX_TOKENS", 3))
+# Điểm BM25 tối thiểu của kết quả đầu tiên để tin fast path từ khóa; thấp hơn (vd. từ khóa xuất hiện
+# ở quá nhiều chunk) thì câu hỏi được embed và truy xuất theo RETRIEVAL_MODE.
+LEXICAL_FAST_PATH_MIN_SCORE = float(os.environ.get("LEXICAL_FAST_PATH_MIN_SCORE", 1.0))
+# Hằng số k của reciprocal-rank fusion.
+RRF_K = int(os.environ.get("RRF_K", 60))
+
+_IDENTIFIER = re.compile(r"\d|[\-./_]")
+
+
+def normalize_rows(matrix: np.ndarray, atol: float = 1e-4) -> np.ndarray:
+    """
+    Chuẩn hóa L2 từng hàng của ma trận (float32).
+    Nếu các hàng đã có độ dài 1 thì trả về chính ma trận (không sao chép).
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if matrix.size == 0:
+        return matrix
+    norms = np.linalg.norm(matrix, axis=1)
+    if np.allclose(norms, 1.0, atol=atol):
+        return matrix
+    norms[norms == 0] = 1.0
+    return matrix / norms[:, None]
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Chỉ số của k điểm cao nhất, sắp xếp giảm dần."""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k < len(scores):
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+class VectorSearchEngine:
+    """
+    Tìm kiếm cosine trên ma trận embedding đã chuẩn hóa của một VectorIndex.
+    Tự động dùng đường ANN (IVF) khi chỉ mục có sẵn IVF và đủ `ann_min_chunks` chunk,
+    ngược lại tìm kiếm chính xác.
+    """
+
+    def __init__(self, index: VectorIndex, nprobe: int = ANN_NPROBE, ann_min_chunks: int = ANN_MIN_CHUNKS):
+        self.index = index
+        # Embedding lượng tử hóa (float16/int8) được giữ nguyên, điểm tính qua QuantizedScorer
+        if index.embeddings.dtype == np.float32:
+            self.matrix = normalize_rows(index.embeddings)
+        else:
+            self.matrix = index.embeddings
+        self.scorer = QuantizedScorer(self.matrix, embedding_scales(index))
+        self.nprobe = nprobe
+        self.ivf = IVFFlatIndex.from_index(index) if len(index) >= ann_min_chunks else None
+        self._lexical = BM25Index.from_index(index)
+        self._lexical_in_index = self._lexical is not None
+        # Metadata và id là đối tượng Python: chỉ đo một lần, chỉ mục không đổi sau khi tải
+        self._index_nbytes = index.nbytes()
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def nbytes(self) -> int:
+        """
+        Dung lượng bộ nhớ của engine, gồm cả các cấu trúc dựng lười (BM25 của chỉ mục cũ,
+        bảng từ của BM25): giá trị tăng lên sau lần truy xuất từ khóa đầu tiên.
+        """
+        extra = self.matrix.nbytes if self.matrix is not self.index.embeddings else 0
+        if self._lexical is not None:
+            # Mảng BM25 đọc từ chỉ mục đã nằm trong index.extras
+            extra += self._lexical.terms_nbytes() if self._lexical_in_index else self._lexical.nbytes()
+        return self._index_nbytes + extra
+
+    @property
+    def lexical(self) -> BM25Index:
+        # Chỉ mục cũ chưa có BM25: dựng trong bộ nhớ ở lần dùng đầu tiên
+        if self._lexical is None:
+            self._lexical = BM25Index.build(self.index.texts)
+        return self._lexical
+
+    def is_keyword_query(self, query: str) -> bool:
+        """
+        Heuristic cho câu hỏi tra cứu từ khóa: ngắn, có ít nhất một từ dạng mã
+        (chứa chữ số hoặc - . / _, hoặc viết hoa toàn bộ) hoặc nằm trong dấu ngoặc kép,
+        và mọi từ đều có trong từ vựng của tài liệu.
+        """
+        stripped = query.strip()
+        quoted = len(stripped) > 2 and stripped[0] == stripped[-1] == '"'
+        tokens = tokenize(stripped)
+        if not tokens or len(tokens) > LEXICAL_FAST_PATH_MAX_TOKENS:
+            return False
+        identifier = any(_IDENTIFIER.search(t) for t in tokens) or any(
+            w.isupper() and len(w) > 1 for w in stripped.split()
+        )
+        return (quoted or identifier) and self.lexical.contains_all(tokens)
+
+    def resolve_mode(self, query: str, mode: Optional[str] = None) -> str:
+        """Chế độ truy xuất cho câu hỏi: `mode` nếu có, ngược lại RETRIEVAL_MODE (có fast path từ khóa)."""
+        if mode:
+            return mode
+        if LEXICAL_FAST_PATH and RETRIEVAL_MODE != "lexical" and self.is_keyword_query(query):
+            return "lexical"
+        return RETRIEVAL_MODE
+
+    def keyword_search(
+        self, query: str, mode: Optional[str] = None, k: int = 4, filter: Optional[MetadataFilter] = None
+    ) -> Tuple[str, Optional[List[Tuple[Document, float]]]]:
+        """
+        Chọn chế độ truy xuất và tìm luôn bằng BM25 nếu chế độ là "lexical". Trả về (chế độ, kết quả);
+        kết quả là None khi cần embed câu hỏi. Câu hỏi do fast path từ khóa chọn nhưng có điểm BM25
+        cao nhất dưới LEXICAL_FAST_PATH_MIN_SCORE được chuyển về RETRIEVAL_MODE.
+        """
+        resolved = self.resolve_mode(query, mode)
+        if resolved != "lexical":
+            return resolved, None
+        hits = self.similarity_search(query, mode="lexical", k=k, filter=filter)
+        fast_path = not mode and RETRIEVAL_MODE != "lexical"
+        if fast_path and (not hits or hits[0][1] < LEXICAL_FAST_PATH_MIN_SCORE):
+            EVENTS.inc("lexical_fast_path_fallback")
+            return RETRIEVAL_MODE, None
+        return resolved, hits
+
+    def _filter_mask(self, filter: MetadataFilter) -> np.ndarray:
+        if callable(filter):
+            return np.fromiter(
+                (bool(filter(self.index.document(i))) for i in range(len(self))),
+                dtype=bool, count=len(self),
+            )
+
+        def matches(metadata: Dict[str, Any]) -> bool:
+            for key, expected in filter.items():
+                value = metadata.get(key)
+                if isinstance(expected, (list, tuple, set)):
+                    if value not in expected:
+                        return False
+                elif value != expected:
+                    return False
+            return True
+
+        return np.fromiter((matches(m) for m in self.index.metadatas), dtype=bool, count=len(self))
+
+    def search_by_vector(
+        self,
+        query_vector,
+        k: int = 4,
+        score_threshold: Optional[float] = None,
+        filter: Optional[MetadataFilter] = None,
+        exact: bool = False,
+    ) -> List[Tuple[int, float]]:
+        """
+        Trả về danh sách (chỉ số chunk, điểm cosine) của top-k chunk.
+        `exact=True` bỏ qua đường ANN.
+        """
+        if len(self) == 0:
+            return []
+        query = np.asarray(query_vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm > 0:
+            query = query / norm
+
+        # Tập ứng viên: None nghĩa là toàn bộ chunk
+        candidates = None
+        mask = self._filter_mask(filter) if filter else None
+        if self.ivf is not None and not exact:
+            candidates = self.ivf.candidates(query, self.nprobe)
+            if mask is not None:
+                candidates = candidates[mask[candidates]]
+            if len(candidates) < k:
+                # Các cụm được quét không đủ k chunk: quay về tìm kiếm chính xác
+                candidates = None
+        if candidates is None and mask is not None:
+            candidates = np.flatnonzero(mask)
+
+        scores = self.scorer.scores(query, candidates)
+        picked = top_k(scores, k)
+        ids = picked if candidates is None else candidates[picked]
+        results = [(int(i), float(score)) for i, score in zip(ids, scores[picked])]
+
+        if score_threshold is not None:
+            results = [(i, s) for i, s in results if s >= score_threshold]
+        return results
+
+    def search_lexical(
+        self, query: str, k: int = 4, filter: Optional[MetadataFilter] = None
+    ) -> List[Tuple[int, float]]:
+        """Top-k theo điểm BM25 (chỉ các chunk có ít nhất một từ của câu hỏi)."""
+        scores = self.lexical.scores(query)
+        if filter:
+            scores = np.where(self._filter_mask(filter), scores, 0.0)
+        return [(int(i), float(scores[i])) for i in top_k(scores, k) if scores[i] > 0]
+
+    def search_hybrid(
+        self,
+        query: str,
+        query_vector,
+        k: int = 4,
+        filter: Optional[MetadataFilter] = None,
+        rrf_k: int = RRF_K,
+        depth: Optional[int] = None,
+    ) -> List[Tuple[int, float]]:
+        """Kết hợp dense và BM25 bằng reciprocal-rank fusion: điểm = tổng 1 / (rrf_k + hạng)."""
+        depth = depth or max(4 * k, 20)
+        fused: Dict[int, float] = {}
+        for ranking in (
+            self.search_by_vector(query_vector, k=depth, filter=filter),
+            self.search_lexical(query, k=depth, filter=filter),
+        ):
+            for rank, (i, _) in enumerate(ranking):
+                fused[i] = fused.get(i, 0.0) + 1.0 / (rrf_k + rank + 1)
+        return sorted(fused.items(), key=lambda item: -item[1])[:k]
+
+    def search(
+        self,
+        query: str,
+        query_vector=None,
+        mode: str = "dense",
+        k: int = 4,
+        filter: Optional[MetadataFilter] = None,
+    ) -> List[Tuple[int, float]]:
+        if mode == "lexical":
+            return self.search_lexical(query, k=k, filter=filter)
+        if mode == "hybrid":
+            return self.search_hybrid(query, query_vector, k=k, filter=filter)
+        return self.search_by_vector(query_vector, k=k, filter=filter)
+
+    def similarity_search(self, query: str, query_vector=None, mode: str = "dense", **kwargs) -> List[Tuple[Document, float]]:
+        with STAGE_SECONDS.time("search"):
+            return [(self.index.document(i), score) for i, score in self.search(query, query_vector, mode, **kwargs)]
+
+    def search_by_vectors(
+        self,
+        query_vectors,
+        k: int = 4,
+        score_threshold: Optional[float] = None,
+        filter: Optional[MetadataFilter] = None,
+    ) -> List[List[Tuple[int, float]]]:
+        """
+        Tìm kiếm chính xác cho nhiều câu hỏi cùng lúc: điểm của mọi câu hỏi với mọi chunk
+        được tính bằng một phép nhân ma trận duy nhất.
+        """
+        queries = normalize_rows(np.atleast_2d(np.asarray(query_vectors, dtype=np.float32)))
+        if len(self) == 0 or queries.size == 0:
+            return [[] for _ in range(len(queries))]
+        candidates = np.flatnonzero(self._filter_mask(filter)) if filter else None
+        if candidates is None:
+            scores = self.scorer.scores_many(queries)
+        else:
+            scores = queries @ self.scorer.rows(candidates).T
+
+        results = []
+        for row in scores:
+            picked = top_k(row, k)
+            ids = picked if candidates is None else candidates[picked]
+            hits = [(int(i), float(row[j])) for i, j in zip(ids, picked)]
+            if score_threshold is not None:
+                hits = [(i, s) for i, s in hits if s >= score_threshold]
+            results.append(hits)
+        return results
+
+    def similarity_search_with_score_by_vector(self, query_vector, **kwargs) -> List[Tuple[Document, float]]:
+        return [(self.index.document(i), score) for i, score in self.search_by_vector(query_vector, **kwargs)]
+
+    def similarity_search_with_score_by_vectors(self, query_vectors, **kwargs) -> List[List[Tuple[Document, float]]]:
+        with STAGE_SECONDS.time("search_batch"):
+            return [
+                [(self.index.document(i), score) for i, score in hits]
+                for hits in self.search_by_vectors(query_vectors, **kwargs)
+            ]
+
+
+class NumpyRetriever(BaseRetriever):
+    """Retriever langchain dùng VectorSearchEngine, có thể ghép trực tiếp vào chuỗi RAG."""
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    engine: VectorSearchEngine
+    embeddings: Any
+    k: int = 4
+    score_threshold: Optional[float] = None
+    filter: Optional[Any] = None
+    # None: chế độ mặc định (RETRIEVAL_MODE, có fast path từ khóa)
+    mode: Optional[str] = None
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        mode, hits = self.engine.keyword_search(query, self.mode, k=self.k, filter=self.filter)
+        if hits is not None:
+            return [doc for doc, _ in hits]
+        return self._search(query, self.embeddings.embed_query(query), mode)
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        mode, hits = self.engine.keyword_search(query, self.mode, k=self.k, filter=self.filter)
+        if hits is not None:
+            return [doc for doc, _ in hits]
+        # Dùng aembed_query nếu có (không chặn event loop), ngược lại chạy embed_query trong thread
+        if hasattr(self.embeddings, "aembed_query"):
+            query_vector = await self.embeddings.aembed_query(query)
+        else:
+            query_vector = await asyncio.to_thread(self.embeddings.embed_query, query)
+        return self._search(query, query_vector, mode)
+
+    def _search(self, query: str, query_vector, mode: str) -> List[Document]:
+        results = self.engine.similarity_search(query, query_vector, mode, k=self.k, filter=self.filter)
+        if self.score_threshold is not None and mode == "dense":
+            results = [(doc, score) for doc, score in results if score >= self.score_threshold]
+        return [doc for doc, _ in results]
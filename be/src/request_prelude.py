@@ -0,0 +1,137 @@
+"""
+Phần mở đầu của mỗi request (rate-limit, kiểm tra trạng thái, làm mới TTL, tải chỉ mục)
+gói trong một script Lua, nên chỉ tốn một round trip tới Redis và được thực hiện
+nguyên tử (không còn race giữa các request đồng thời như kiểu get-rồi-set).
+
+Rate-limit dùng token bucket lưu trong hash `{tokens, ts}`: mỗi RATE_LIMIT_INTERVAL giây
+hồi một token, tối đa RATE_LIMIT_BURST token. Mặc định (3 giây, 1 token) tương đương
+quy tắc cũ "không quá một request mỗi 3 giây".
+"""
+import os
+import time
+import weakref
+from dataclasses import dataclass
+from typing import Optional
+
+# Số giây để hồi một lượt request và số lượt dồn tối đa của mỗi người dùng.
+RATE_LIMIT_INTERVAL = float(os.environ.get("RATE_LIMIT_INTERVAL", 3))
+RATE_LIMIT_BURST = int(os.environ.get("RATE_LIMIT_BURST", 1))
+
+# KEYS: 1 = bucket rate-limit, 2 = status, 3 = generation, 4 = vectorstore
+# ARGV: 1 = now, 2 = interval, 3 = burst, 4 = ttl, 5 = kiểm tra status ("1"/"0"),
+#       6 = tải payload ("1"/"0"), 7 = generation đang có trong cache cục bộ ("" nếu không có)
+_PRELUDE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local interval = tonumber(ARGV[2])
+local burst = tonumber(ARGV[3])
+local ttl = tonumber(ARGV[4])
+
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or burst
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) / interval)
+if tokens < 1 then
+    return {'limited', tostring((1 - tokens) * interval)}
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens - 1), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], ttl)
+
+if ARGV[5] ~= '1' then
+    return {'ok'}
+end
+
+local status = redis.call('GET', KEYS[2])
+if not status then
+    return {'missing'}
+end
+if status ~= 'ready' then
+    return {'not_ready', status}
+end
+
+-- Người dùng còn hoạt động: gia hạn TTL (hết hạn theo thời gian không hoạt động)
+redis.call('EXPIRE', KEYS[2], ttl)
+redis.call('EXPIRE', KEYS[3], ttl)
+redis.call('EXPIRE', KEYS[4], ttl)
+
+local generation = redis.call('GET', KEYS[3]) or ''
+if ARGV[6] == '1' and (generation == '' or generation ~= ARGV[7]) then
+    local payload = redis.call('GET', KEYS[4])
+    if payload then
+        return {'ok', status, generation, payload}
+    end
+end
+return {'ok', status, generation}
+"""
+
+
+@dataclass
+class PreludeResult:
+    outcome: str
+    status: Optional[str] = None
+    generation: Optional[str] = None
+    payload: Optional[bytes] = None
+    retry_after: float = 0.0
+
+
+# Script đã đăng ký theo từng client Redis: tạo một lần rồi dùng lại (EVALSHA) cho mọi request
+_scripts: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+
+def _prelude_script(redis_client):
+    script = _scripts.get(redis_client)
+    if script is None:
+        script = _scripts[redis_client] = redis_client.register_script(_PRELUDE_SCRIPT)
+    return script
+
+
+def _decode(value) -> Optional[str]:
+    if value is None:
+        return None
+    return value.decode("utf-8") if isinstance(value, bytes) else str(value)
+
+
+async def run_prelude(
+    redis_client,
+    uid: str,
+    scope: str,
+    ttl: int,
+    check_status: bool = True,
+    fetch_payload: bool = False,
+    cached_generation: Optional[str] = None,
+    interval: float = RATE_LIMIT_INTERVAL,
+    burst: int = RATE_LIMIT_BURST,
+    now: Optional[float] = None,
+) -> PreludeResult:
+    """
+    Chạy script prelude cho `uid` với bucket rate-limit `user:{uid}:{scope}_rate`.
+    `redis_client` phải trả về bytes (decode_responses=False) vì payload là nhị phân.
+    Payload chỉ được trả về khi `fetch_payload` và generation trong Redis khác `cached_generation`.
+    """
+    script = _prelude_script(redis_client)
+    keys = [
+        f"user:{uid}:{scope}_rate",
+        f"user:{uid}:status",
+        f"user:{uid}:generation",
+        f"user:{uid}:vectorstore",
+    ]
+    args = [
+        time.time() if now is None else now,
+        interval,
+        burst,
+        ttl,
+        "1" if check_status else "0",
+        "1" if fetch_payload else "0",
+        cached_generation or "",
+    ]
+    reply = await script(keys=keys, args=args)
+    outcome = _decode(reply[0])
+    if outcome == "limited":
+        return PreludeResult(outcome, retry_after=float(_decode(reply[1])))
+    result = PreludeResult(outcome)
+    if len(reply) > 1:
+        result.status = _decode(reply[1])
+    if len(reply) > 2:
+        result.generation = _decode(reply[2]) or None
+    if len(reply) > 3:
+        result.payload = reply[3]
+    return result
@@ -0,0 +1,284 @@
+"""
+Đẩy trạng thái và tiến độ xử lý tài liệu tới client qua Redis pub/sub (thay cho polling task_status).
+
+- Worker (`TaskEventPublisher`) phát mỗi lần chuyển trạng thái của task (STARTED, PROGRESS,
+  SUCCESS, FAILURE) dưới dạng JSON lên TASK_EVENTS_CHANNEL, đồng thời ghi sự kiện mới nhất vào
+  `task:{task_id}:event` và `user:{uid}:task_event` để client kết nối muộn vẫn nhận được trạng thái hiện tại.
+- Mỗi API instance chạy một `TaskEventHub` trong lifespan: một subscriber duy nhất cho cả tiến trình,
+  phân phát sự kiện tới các hàng đợi của client đang theo dõi task_id hoặc uid tương ứng.
+- `task_event_stream` ghép trạng thái hiện tại với các sự kiện mới (bỏ trùng theo `seq`), dùng chung
+  cho endpoint SSE và WebSocket. Sau khi kết nối lại, hub đọc lại trạng thái hiện tại của các task
+  đang được theo dõi, nên client không bị kẹt nếu sự kiện cuối cùng rơi vào lúc mất kết nối.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Any, AsyncIterator, Dict, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+TASK_EVENTS_ENABLED = os.environ.get("TASK_EVENTS_ENABLED", "True").lower() in ("true", "1", "t")
+TASK_EVENTS_CHANNEL = os.environ.get("TASK_EVENTS_CHANNEL", "tasks:events")
+# Thời gian (giây) giữ sự kiện mới nhất của task/uid trong Redis
+TASK_EVENTS_TTL = int(os.environ.get("TASK_EVENTS_TTL", 1800))
+# Số sự kiện tối đa chờ gửi cho mỗi client; client chậm chỉ mất các sự kiện tiến độ cũ nhất
+TASK_EVENTS_QUEUE_SIZE = int(os.environ.get("TASK_EVENTS_QUEUE_SIZE", 32))
+# Khoảng thời gian (giây) gửi keepalive khi không có sự kiện (giữ kết nối qua proxy)
+TASK_EVENTS_KEEPALIVE = float(os.environ.get("TASK_EVENTS_KEEPALIVE", 15))
+TASK_EVENTS_MAX_BACKOFF = float(os.environ.get("TASK_EVENTS_MAX_BACKOFF", 30))
+
+TERMINAL_STATES = ("SUCCESS", "FAILURE")
+
+
+def task_event_key(task_id: str) -> str:
+    return f"task:{task_id}:event"
+
+
+def user_event_key(uid: str) -> str:
+    return f"user:{uid}:task_event"
+
+
+def pending_event(task_id: str, uid: Optional[str] = None) -> Dict[str, Any]:
+    """Trạng thái của task chưa được worker nhận (chưa có sự kiện nào)."""
+    return {"task_id": task_id, "uid": uid, "seq": 0, "state": "PENDING", "status": "Processing", "result": None}
+
+
+def is_terminal(event: Dict[str, Any]) -> bool:
+    return event.get("state") in TERMINAL_STATES
+
+
+class TaskEventPublisher:
+    """
+    Phát sự kiện của một task (đồng bộ, dùng trong worker). `seq` tăng dần theo từng task để
+    phía API bỏ các sự kiện trùng hoặc cũ hơn trạng thái đã gửi.
+    Lỗi Redis chỉ được ghi log: việc xử lý tài liệu không phụ thuộc vào việc phát sự kiện.
+    """
+
+    def __init__(self, redis_client, task_id: str, uid: str, doc_id: Optional[str] = None,
+                 ttl: int = TASK_EVENTS_TTL, channel: str = TASK_EVENTS_CHANNEL):
+        self.redis_client = redis_client
+        self.task_id = task_id
+        self.uid = uid
+        self.doc_id = doc_id
+        self.ttl = ttl
+        self.channel = channel
+        # Bắt đầu từ thời điểm hiện tại (ms) để sự kiện của lần chạy lại task (acks_late) không bị coi là cũ
+        self.seq = int(time.time() * 1000)
+
+    def publish(self, state: str, result: Any = None) -> Dict[str, Any]:
+        self.seq += 1
+        event = {
+            "task_id": self.task_id,
+            "uid": self.uid,
+            "doc_id": self.doc_id,
+            "seq": self.seq,
+            "state": state,
+            # Cùng giá trị với /api/v1/task_status để client chuyển từ polling sang dễ dàng
+            "status": "Completed" if state in TERMINAL_STATES else "Processing",
+            "result": result,
+        }
+        payload = json.dumps(event, ensure_ascii=False)
+        try:
+            # Trạng thái mới nhất và sự kiện pub/sub trong một round trip
+            pipe = self.redis_client.pipeline(transaction=False)
+            pipe.set(task_event_key(self.task_id), payload, ex=self.ttl)
+            pipe.set(user_event_key(self.uid), payload, ex=self.ttl)
+            pipe.publish(self.channel, payload)
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"Không phát được sự kiện {state} của task {self.task_id}: {e}")
+        return event
+
+
+def parse_task_event(data) -> Optional[Dict[str, Any]]:
+    if isinstance(data, bytes):
+        data = data.decode("utf-8")
+    try:
+        event = json.loads(data)
+    except (ValueError, TypeError):
+        logger.warning(f"Bỏ qua sự kiện task không hợp lệ: {data!r}")
+        return None
+    if not isinstance(event, dict) or "task_id" not in event:
+        logger.warning(f"Bỏ qua sự kiện task không hợp lệ: {data!r}")
+        return None
+    return event
+
+
+class TaskEventHub:
+    """
+    Một subscriber dùng chung cho cả tiến trình API: đăng ký TASK_EVENTS_CHANNEL và chuyển
+    mỗi sự kiện tới các hàng đợi đang theo dõi "task:<task_id>" hoặc "uid:<uid>".
+    """
+
+    def __init__(self, redis_client, channel: str = TASK_EVENTS_CHANNEL,
+                 queue_size: int = TASK_EVENTS_QUEUE_SIZE, max_backoff: float = TASK_EVENTS_MAX_BACKOFF):
+        self.redis_client = redis_client
+        self.channel = channel
+        self.queue_size = queue_size
+        self.max_backoff = max_backoff
+        self.subscribed = asyncio.Event()
+        self.events = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.resyncs = 0
+        self._watchers: Dict[str, Set[asyncio.Queue]] = {}
+        self._backoff = 0.5
+        self._task: Optional[asyncio.Task] = None
+
+    def watch(self, task_id: Optional[str] = None, uid: Optional[str] = None) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, self.queue_size))
+        self._watchers.setdefault(f"task:{task_id}" if task_id else f"uid:{uid}", set()).add(queue)
+        return queue
+
+    def unwatch(self, queue: asyncio.Queue, task_id: Optional[str] = None, uid: Optional[str] = None) -> None:
+        key = f"task:{task_id}" if task_id else f"uid:{uid}"
+        watchers = self._watchers.get(key)
+        if watchers is None:
+            return
+        watchers.discard(queue)
+        if not watchers:
+            del self._watchers[key]
+
+    def _offer(self, queue: asyncio.Queue, event: Dict[str, Any]) -> None:
+        if queue.full():
+            # Giữ sự kiện mới nhất (trạng thái cuối luôn là sự kiện sau cùng)
+            queue.get_nowait()
+            self.dropped += 1
+        queue.put_nowait(event)
+        self.delivered += 1
+
+    def dispatch(self, event: Dict[str, Any]) -> int:
+        """Chuyển sự kiện tới mọi client đang theo dõi task hoặc uid của nó. Trả về số client nhận."""
+        targets = list(self._watchers.get(f"task:{event.get('task_id')}", ()))
+        targets += self._watchers.get(f"uid:{event.get('uid')}", ())
+        for queue in targets:
+            self._offer(queue, event)
+        return len(targets)
+
+    def handle(self, data) -> bool:
+        event = parse_task_event(data)
+        if event is None:
+            return False
+        self.events += 1
+        self.dispatch(event)
+        return True
+
+    async def _resync(self) -> None:
+        """Gửi lại trạng thái hiện tại của các task/uid đang được theo dõi (sau khi mất kết nối)."""
+        keys = list(self._watchers)
+        if not keys:
+            return
+        redis_keys = [task_event_key(k[5:]) if k.startswith("task:") else user_event_key(k[4:]) for k in keys]
+        for data in await self.redis_client.mget(redis_keys):
+            if data:
+                event = parse_task_event(data)
+                if event is not None:
+                    self.dispatch(event)
+
+    async def _listen_once(self, connected_before: bool) -> None:
+        pubsub = self.redis_client.pubsub(ignore_subscribe_messages=True)
+        try:
+            await pubsub.subscribe(self.channel)
+            if connected_before:
+                self.resyncs += 1
+                await self._resync()
+            self.subscribed.set()
+            self._backoff = 0.5
+            while True:
+                message = await pubsub.get_message(timeout=None)
+                if message is not None and message.get("type") == "message":
+                    self.handle(message["data"])
+        finally:
+            self.subscribed.clear()
+            await pubsub.aclose()
+
+    async def run(self) -> None:
+        connected_before = False
+        while True:
+            try:
+                await self._listen_once(connected_before)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Mất kết nối tới kênh sự kiện task ({e}), thử lại sau {self._backoff:.1f}s.")
+                connected_before = True
+                await asyncio.sleep(self._backoff)
+                self._backoff = min(self._backoff * 2, self.max_backoff)
+
+    def start(self) -> asyncio.Task:
+        self._task = asyncio.create_task(self.run())
+        return self._task
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    @property
+    def watchers(self) -> int:
+        return sum(len(queues) for queues in self._watchers.values())
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "subscribed": self.subscribed.is_set(),
+            "watchers": self.watchers,
+            "events": self.events,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+            "resyncs": self.resyncs,
+        }
+
+
+async def task_event_stream(
+    hub: TaskEventHub,
+    redis_client,
+    task_id: Optional[str] = None,
+    uid: Optional[str] = None,
+    keepalive: float = TASK_EVENTS_KEEPALIVE,
+) -> AsyncIterator[Optional[Dict[str, Any]]]:
+    """
+    Sinh các sự kiện của một task (hoặc mọi task của uid): trước tiên là trạng thái hiện tại,
+    sau đó là các sự kiện mới; sinh None mỗi `keepalive` giây khi không có gì để gửi.
+    Luồng theo task_id kết thúc sau trạng thái cuối (SUCCESS/FAILURE).
+    """
+    # Đăng ký trước khi đọc trạng thái hiện tại để không lỡ sự kiện ở giữa; phần trùng bị bỏ theo seq
+    queue = hub.watch(task_id=task_id, uid=uid)
+    last_seq: Dict[str, int] = {}
+
+    def fresh(event: Dict[str, Any]) -> bool:
+        key = str(event.get("task_id"))
+        seq = int(event.get("seq") or 0)
+        if seq <= last_seq.get(key, -1):
+            return False
+        last_seq[key] = seq
+        return True
+
+    try:
+        data = await redis_client.get(task_event_key(task_id) if task_id else user_event_key(uid))
+        current = parse_task_event(data) if data else None
+        if current is None and task_id:
+            current = pending_event(task_id, uid)
+        if current is not None and fresh(current):
+            yield current
+            if task_id and is_terminal(current):
+                return
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout=keepalive)
+            except asyncio.TimeoutError:
+                yield None
+                continue
+            if not fresh(event):
+                continue
+            yield event
+            if task_id and is_terminal(event):
+                return
+    finally:
+        hub.unwatch(queue, task_id=task_id, uid=uid)
@@ -0,0 +1,50 @@
+import os
+
+# Các bài kiểm thử đơn vị không gọi API Google: dùng MockEmbeddings khi import src.rag.preprocess
+os.environ.setdefault("USE_MOCK_EMBEDDINGS", "1")
+
+import fakeredis
+import numpy as np
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+
+@pytest.fixture
+def api(monkeypatch):
+    """
+    Ứng dụng FastAPI với Redis giả lập (fakeredis), embedding giả lập xác định và LLM giả lập.
+    Trả về (TestClient, client Redis đồng bộ, hàm `upload_index(uid, texts)` ghi sẵn chỉ mục).
+    """
+    from fastapi.testclient import TestClient
+
+    from src import main
+    from src.rag import preprocess
+    from src.rag.embedding_cache import QueryEmbeddingCache
+    from src.rag.index_format import VectorIndex, serialize_index
+
+    server = fakeredis.FakeServer()
+    fake_embeddings = DeterministicFakeEmbedding(size=32)
+    monkeypatch.setattr(main, "async_redis_client", fakeredis.aioredis.FakeRedis(server=server, decode_responses=True))
+    monkeypatch.setattr(main, "async_redis_binary_client", fakeredis.aioredis.FakeRedis(server=server))
+    monkeypatch.setattr(main, "embeddings", fake_embeddings)
+    monkeypatch.setattr(
+        main, "query_embeddings", QueryEmbeddingCache(fake_embeddings, model_name="fake", async_redis_client=main.async_redis_binary_client)
+    )
+    monkeypatch.setattr(preprocess, "USE_MOCK_LLM", True)
+    preprocess.GetLLM.cache_clear()
+    preprocess.GetAnswerChain.cache_clear()
+    main.users_vectorstores_cache.clear()
+    main.answer_cache.clear()
+    sync_redis = fakeredis.FakeRedis(server=server, decode_responses=True)
+    binary_redis = fakeredis.FakeRedis(server=server)
+
+    def upload_index(uid, texts, generation="1"):
+        index = VectorIndex(np.asarray(fake_embeddings.embed_documents(texts)), texts)
+        binary_redis.set(f"user:{uid}:vectorstore", serialize_index(index))
+        sync_redis.set(f"user:{uid}:generation", generation)
+        sync_redis.set(f"user:{uid}:status", "ready")
+
+    with TestClient(main.app) as client:
+        yield client, sync_redis, upload_index
+    main.users_vectorstores_cache.clear()
+    main.answer_cache.clear()
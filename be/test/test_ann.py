@@ -0,0 +1,67 @@
+import numpy as np
+
+from src.rag.ann import IVFFlatIndex, build_ann_index
+from src.rag.index_format import VectorIndex, deserialize_index, serialize_index
+from src.rag.search import VectorSearchEngine, normalize_rows
+
+
+def clustered_index(n=2000, dim=32, topics=20, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((topics, dim))
+    matrix = normalize_rows(centers[rng.integers(0, topics, n)] + 0.3 * rng.standard_normal((n, dim)))
+    return VectorIndex(matrix, [f"chunk {i}" for i in range(n)], metadatas=[{"page": i % 3} for i in range(n)])
+
+
+def test_ivf_lists_partition_all_chunks():
+    index = clustered_index()
+    ivf = IVFFlatIndex.build(index.embeddings, n_lists=16)
+
+    assert ivf.offsets[-1] == len(index)
+    assert sorted(ivf.ids.tolist()) == list(range(len(index)))
+    assert len(ivf.candidates(index.embeddings[0], nprobe=16)) == len(index)
+
+
+def test_ann_survives_serialization_and_matches_exact():
+    index = clustered_index()
+    assert build_ann_index(index, min_chunks=100)
+    loaded = deserialize_index(serialize_index(index, codec="none"))
+
+    engine = VectorSearchEngine(loaded, nprobe=4, ann_min_chunks=100)
+    assert engine.ivf is not None
+
+    queries = clustered_index(n=50, seed=0).embeddings
+    hits = 0
+    for q in queries:
+        exact = {i for i, _ in engine.search_by_vector(q, k=4, exact=True)}
+        approx = {i for i, _ in engine.search_by_vector(q, k=4)}
+        hits += len(exact & approx)
+    assert hits / (4 * len(queries)) > 0.9
+
+
+def test_small_documents_use_exact_path():
+    index = clustered_index(n=50)
+    assert not build_ann_index(index, min_chunks=100)
+    assert VectorSearchEngine(index, ann_min_chunks=100).ivf is None
+
+
+def test_ann_with_filter():
+    index = clustered_index()
+    build_ann_index(index, min_chunks=100)
+    engine = VectorSearchEngine(index, nprobe=2, ann_min_chunks=100)
+
+    results = engine.search_by_vector(index.embeddings[0], k=5, filter={"page": 0})
+
+    assert len(results) == 5
+    assert all(index.metadatas[i]["page"] == 0 for i, _ in results)
+
+
+def test_ann_is_opt_in_by_default():
+    from src.rag import ann
+
+    index = clustered_index()
+    build_ann_index(index, min_chunks=100)
+
+    # Mặc định (ANN_ENABLED tắt) chỉ mục đã có IVF vẫn được tìm kiếm chính xác
+    assert not ann.ANN_ENABLED
+    assert VectorSearchEngine(index).ivf is None
+    assert not build_ann_index(clustered_index())
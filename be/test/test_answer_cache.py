@@ -0,0 +1,101 @@
+import numpy as np
+
+from src.answer_cache import SemanticAnswerCache
+
+
+def test_similar_question_hits_and_different_question_misses():
+    cache = SemanticAnswerCache(threshold=0.9)
+    cache.store("u1", "1", [1.0, 0.0, 0.0], "q", "answer")
+
+    assert cache.lookup("u1", "1", [0.99, 0.05, 0.0]) == "answer"
+    assert cache.lookup("u1", "1", [0.0, 1.0, 0.0]) is None
+    assert cache.lookup("u2", "1", [1.0, 0.0, 0.0]) is None
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 2
+
+
+def test_new_generation_drops_answers():
+    cache = SemanticAnswerCache(threshold=0.9)
+    cache.store("u1", "1", [1.0, 0.0], "q", "old")
+
+    assert cache.lookup("u1", "2", [1.0, 0.0]) is None
+    assert cache.stats()["evictions"]["stale"] == 1
+    assert len(cache) == 0
+
+
+def test_limits_evict_least_recently_used():
+    cache = SemanticAnswerCache(threshold=0.99, max_entries_per_user=2, max_users=2)
+    eye = np.eye(3)
+    cache.store("u1", "1", eye[0], "a", "A")
+    cache.store("u1", "1", eye[1], "b", "B")
+    assert cache.lookup("u1", "1", eye[0]) == "A"  # "a" được dùng lại, "b" trở thành cũ nhất
+    cache.store("u1", "1", eye[2], "c", "C")
+
+    assert cache.lookup("u1", "1", eye[1]) is None
+    assert cache.lookup("u1", "1", eye[0]) == "A"
+
+    cache.store("u2", "1", eye[0], "a", "A2")
+    cache.store("u3", "1", eye[0], "a", "A3")
+    assert cache.lookup("u1", "1", eye[0]) is None
+    assert cache.stats()["users"] == 2
+
+
+def test_repeated_question_skips_llm(api, monkeypatch):
+    from src import main
+
+    client, sync_redis, upload_index = api
+    calls = []
+
+    async def fake_generate(query, docs):
+        calls.append(query)
+        return "generated"
+
+    monkeypatch.setattr(main, "GenerateAnswer", fake_generate)
+    upload_index("u-sem", ["Phở là món ăn truyền thống.", "Hà Nội là thủ đô."])
+
+    for _ in range(2):
+        sync_redis.delete("user:u-sem:retrieve_rate")
+        response = client.post("/api/v1/retrieve", data={"query_text": "Phở là gì?", "uid": "u-sem"})
+        assert response.status_code == 200, response.text
+        assert response.json()["message"] == "generated"
+    assert calls == ["Phở là gì?"]
+
+    # Tải lại tài liệu (generation mới) làm câu trả lời cũ mất hiệu lực
+    upload_index("u-sem", ["Bún chả."], generation="2")
+    sync_redis.delete("user:u-sem:retrieve_rate")
+    client.post("/api/v1/retrieve", data={"query_text": "Phở là gì?", "uid": "u-sem"})
+    assert len(calls) == 2
+    assert client.get("/api/v1/answer_cache/stats").json()["hits"] == 1
+
+
+def test_constant_mock_embeddings_do_not_share_answers(api, monkeypatch):
+    from src import main
+    from src.rag.embedding_cache import QueryEmbeddingCache
+
+    class ConstantEmbeddings:
+        # Giống MockEmbeddings: cùng một vector cho mọi câu hỏi
+        def embed_query(self, text):
+            return [float(i) for i in range(32)]
+
+    client, sync_redis, upload_index = api
+    monkeypatch.setattr(main, "query_embeddings", QueryEmbeddingCache(ConstantEmbeddings(), model_name="const"))
+    monkeypatch.setattr(main, "ANSWER_CACHE_EXACT", True)
+
+    async def fake_generate(query, docs):
+        return f"generated: {query}"
+
+    monkeypatch.setattr(main, "GenerateAnswer", fake_generate)
+    upload_index("u-mock", ["Phở là món ăn truyền thống."])
+
+    answers = []
+    for question, path in [
+        ("Tên của tôi là gì?", "/api/v1/retrieve/mock"),
+        ("Tôi đang ở đâu?", "/api/v1/retrieve/mock"),
+        ("Tên của tôi là gì?", "/api/v1/retrieve"),
+    ]:
+        sync_redis.delete("user:u-mock:retrieve_rate")
+        response = client.post(path, data={"query_text": question, "uid": "u-mock"})
+        assert response.status_code == 200, response.text
+        answers.append(response.json()["message"])
+
+    assert answers == ["Tên của bạn là Nguyễn Văn A.", "Bạn đang ở Thành phố Hồ Chí Minh.", "generated: Tên của tôi là gì?"]
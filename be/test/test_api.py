@@ -3,17 +3,19 @@ import requests
 import uuid
 import time
 import json
+import tempfile
+from pathlib import Path
 from fpdf import FPDF
 
 # Cấu hình API endpoint
 API_URL = "http://localhost:8000"
 
-def create_test_pdf_file():
+def create_test_pdf_file(directory):
     """
-    Tạo một file PDF đơn giản và lưu vào tệp tạm thời để kiểm thử.
+    Tạo một file PDF đơn giản trong thư mục tạm `directory` (tmp_path của pytest) để kiểm thử.
     Trả về đường dẫn của file tạm thời.
     """
-    file_path = f"test_document_{int(time.time())}.pdf"
+    file_path = str(directory / f"test_document_{uuid.uuid4().hex}.pdf")
     pdf = FPDF('P', 'mm', 'A4')
     pdf.add_page()
     pdf.set_font('Arial', 'B', 16)
@@ -24,7 +26,7 @@ def create_test_pdf_file():
     pdf.output(file_path)
     return file_path
 
-def test_upload_and_retrieve():
+def test_upload_and_retrieve(tmp_path):
     """
     Kiểm thử luồng tải lên và lấy thông tin tài liệu.
     """
@@ -35,7 +37,7 @@ def test_upload_and_retrieve():
     print(f"Sử dụng UID: {user_id}")
 
     # Tạo một file PDF giả
-    pdf_file_path = create_test_pdf_file()
+    pdf_file_path = create_test_pdf_file(tmp_path)
 
     # Tải tài liệu lên
     print("Đang tải tài liệu lên...")
@@ -43,12 +45,6 @@ def test_upload_and_retrieve():
         files = {'file': (os.path.basename(pdf_file_path), f, 'application/pdf')}
         data = {'uid': user_id}
         upload_response = requests.post(f"{API_URL}/api/v1/document", files=files, data=data)
-    
-    # Xóa file tạm thời
-    try:
-        os.remove(pdf_file_path)
-    except FileNotFoundError:
-        pass
 
     # Kiểm tra phản hồi tải lên
     if upload_response.status_code == 200:
@@ -73,7 +69,7 @@ def test_upload_and_retrieve():
     else:
         print(f"Lỗi lấy thông tin: {retrieve_response.status_code} - {retrieve_response.text}")
 
-def test_single_document_limit():
+def test_single_document_limit(tmp_path):
     """
     Kiểm thử giới hạn một tài liệu cho mỗi người dùng.
     """
@@ -81,8 +77,8 @@ def test_single_document_limit():
     user_id = str(uuid.uuid4())
     print(f"Sử dụng UID: {user_id}")
     
-    pdf_file_path1 = create_test_pdf_file()
-    pdf_file_path2 = create_test_pdf_file()
+    pdf_file_path1 = create_test_pdf_file(tmp_path)
+    pdf_file_path2 = create_test_pdf_file(tmp_path)
 
     # Tải tài liệu đầu tiên
     print("Tải tài liệu đầu tiên...")
@@ -125,13 +121,7 @@ def test_single_document_limit():
     else:
         print("Kiểm thử thất bại: Không thể truy vấn tài liệu thứ hai.")
 
-    # Xóa các file tạm thời
-    try:
-        os.remove(pdf_file_path1)
-        os.remove(pdf_file_path2)
-    except FileNotFoundError:
-        pass
-
 if __name__ == "__main__":
-    test_upload_and_retrieve()
-    test_single_document_limit()
+    with tempfile.TemporaryDirectory() as directory:
+        test_upload_and_retrieve(Path(directory))
+        test_single_document_limit(Path(directory))
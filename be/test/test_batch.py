@@ -0,0 +1,70 @@
+def test_batch_answers_every_question_with_one_embedding_call(api, monkeypatch):
+    from src import main
+
+    client, _, upload_index = api
+    upload_index("u-batch", ["Phở là món ăn.", "Hà Nội là thủ đô.", "Sông Hồng."])
+    embed_calls = []
+    embeddings_class = type(main.query_embeddings.embeddings)
+    original = embeddings_class.embed_documents
+
+    def counting_embed_documents(self, texts):
+        embed_calls.append(list(texts))
+        return original(self, texts)
+
+    monkeypatch.setattr(embeddings_class, "embed_documents", counting_embed_documents)
+
+    async def fake_generate(question, docs):
+        if question == "boom":
+            raise RuntimeError("LLM failed")
+        return f"answer: {question} ({len(docs)} docs)"
+
+    monkeypatch.setattr(main, "GenerateAnswer", fake_generate)
+
+    response = client.post(
+        "/api/v1/retrieve/batch", data={"uid": "u-batch", "questions": ["Phở?", "boom", "Thủ đô?"]}
+    )
+
+    assert response.status_code == 200, response.text
+    results = response.json()["results"]
+    assert [r["status"] for r in results] == [200, 500, 200]
+    assert results[0]["message"] == "answer: Phở? (3 docs)"
+    assert "LLM failed" in results[1]["error"]
+    assert embed_calls == [["Phở?", "boom", "Thủ đô?"]]
+
+    # Cả batch chỉ tính là một lượt rate-limit
+    again = client.post("/api/v1/retrieve/batch", data={"uid": "u-batch", "questions": ["Phở?"]})
+    assert again.status_code == 429
+
+
+def test_batch_rejects_too_many_questions(api, monkeypatch):
+    from src import main
+
+    client, _, upload_index = api
+    upload_index("u-batch2", ["x"])
+    monkeypatch.setattr(main, "BATCH_MAX_QUESTIONS", 2)
+
+    response = client.post("/api/v1/retrieve/batch", data={"uid": "u-batch2", "questions": ["a", "b", "c"]})
+    assert response.status_code == 400
+
+
+def test_batch_and_single_retrieve_share_answers(api, monkeypatch):
+    from src import main
+
+    client, sync_redis, upload_index = api
+    upload_index("u-share", ["Phở là món ăn.", "Hà Nội là thủ đô."])
+    calls = []
+
+    async def fake_generate(question, docs):
+        calls.append(question)
+        return f"answer: {question}"
+
+    monkeypatch.setattr(main, "GenerateAnswer", fake_generate)
+
+    single = client.post("/api/v1/retrieve", data={"query_text": "Phở là gì?", "uid": "u-share", "mode": "dense"})
+    assert single.status_code == 200, single.text
+    sync_redis.delete("user:u-share:retrieve_rate")
+    batch = client.post("/api/v1/retrieve/batch", data={"uid": "u-share", "questions": ["Phở là gì?", "Thủ đô?"]})
+
+    assert batch.status_code == 200, batch.text
+    assert [r["message"] for r in batch.json()["results"]] == ["answer: Phở là gì?", "answer: Thủ đô?"]
+    assert calls == ["Phở là gì?", "Thủ đô?"]
@@ -0,0 +1,71 @@
+import asyncio
+import io
+
+import fakeredis
+import pytest
+from starlette.datastructures import UploadFile
+
+from src import blob_store
+from src.blob_store import BlobTooLarge, delete_blob, read_blob, save_upload
+
+
+def make_upload(data: bytes, with_size=True):
+    return UploadFile(io.BytesIO(data), size=len(data) if with_size else None, filename="a.pdf")
+
+
+@pytest.fixture
+def redis_pair():
+    server = fakeredis.FakeServer()
+    return fakeredis.aioredis.FakeRedis(server=server), fakeredis.FakeRedis(server=server)
+
+
+def test_redis_blob_roundtrip_in_chunks(redis_pair, monkeypatch):
+    async_client, sync_client = redis_pair
+    monkeypatch.setattr(blob_store, "UPLOAD_CHUNK_SIZE", 4)
+    data = "%PDF-1.4 nội dung".encode("utf-8").ljust(30, b".")
+
+    ref = asyncio.run(save_upload(make_upload(data), async_client, backend="redis"))
+
+    assert ref.startswith("redis:")
+    assert read_blob(ref, sync_client) == data
+    assert sync_client.ttl(ref[len("redis:"):]) > 0
+    delete_blob(ref, sync_client)
+    with pytest.raises(FileNotFoundError):
+        read_blob(ref, sync_client)
+
+
+def test_filesystem_blob_roundtrip(tmp_path, monkeypatch):
+    monkeypatch.setattr(blob_store, "BLOB_STORE_DIR", str(tmp_path))
+
+    ref = asyncio.run(save_upload(make_upload(b"abc"), None, backend="filesystem"))
+
+    assert ref.startswith("file:")
+    assert read_blob(ref, None) == b"abc"
+    delete_blob(ref, None)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_oversized_upload_is_rejected_and_cleaned_up(redis_pair, monkeypatch):
+    async_client, sync_client = redis_pair
+    monkeypatch.setattr(blob_store, "UPLOAD_CHUNK_SIZE", 4)
+
+    with pytest.raises(BlobTooLarge):
+        asyncio.run(save_upload(make_upload(b"x" * 10), async_client, max_bytes=5, backend="redis"))
+    # Không biết trước kích thước: dừng khi đang stream và xóa phần đã ghi
+    with pytest.raises(BlobTooLarge):
+        asyncio.run(save_upload(make_upload(b"x" * 10, with_size=False), async_client, max_bytes=5, backend="redis"))
+    assert sync_client.keys("blob:*") == []
+
+
+def test_upload_endpoint_rejects_large_content_length():
+    from fastapi.testclient import TestClient
+
+    from src.main import app
+
+    with TestClient(app) as client:
+        response = client.post(
+            "/api/v1/document",
+            content=b"x",
+            headers={"content-length": str(blob_store.MAX_UPLOAD_BYTES * 2), "content-type": "multipart/form-data; boundary=b"},
+        )
+    assert response.status_code == 413
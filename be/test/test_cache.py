@@ -0,0 +1,68 @@
+from src.cache import VectorStoreCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_lru_eviction_respects_byte_budget():
+    cache = VectorStoreCache(max_bytes=100, ttl=60)
+    cache.put("a", "A", size=40)
+    cache.put("b", "B", size=40)
+    assert cache.get("a") == "A"  # "a" trở thành mới dùng nhất
+
+    cache.put("c", "C", size=40)
+
+    assert "b" not in cache
+    assert cache.get("a") == "A" and cache.get("c") == "C"
+    assert cache.current_bytes == 80
+    assert cache.stats()["evictions"]["lru"] == 1
+
+
+def test_idle_ttl_expiry():
+    clock = FakeClock()
+    cache = VectorStoreCache(max_bytes=100, ttl=10, clock=clock)
+    cache.put("a", "A", size=10)
+    cache.put("b", "B", size=10)
+
+    clock.now = 8
+    assert cache.get("a") == "A"  # làm mới thời gian truy cập của "a"
+    clock.now = 15
+    assert cache.evict_expired() == 1
+    assert "a" in cache and "b" not in cache
+    clock.now = 30
+    assert cache.get("a") is None
+    assert cache.current_bytes == 0
+
+
+def test_generation_mismatch_is_a_miss():
+    cache = VectorStoreCache(max_bytes=100, ttl=60)
+    cache.put("u", "old", size=10, generation="1")
+
+    assert cache.get("u", "1") == "old"
+    assert cache.get("u", "2") is None
+    assert "u" not in cache
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 1
+    assert stats["evictions"]["stale"] == 1
+
+
+def test_oversized_entry_is_rejected():
+    cache = VectorStoreCache(max_bytes=10, ttl=60)
+    assert not cache.put("big", "x", size=11)
+    assert len(cache) == 0 and cache.stats()["rejected"] == 1
+
+
+def test_resize_accounts_for_growth_and_evicts_lru():
+    cache = VectorStoreCache(max_bytes=100, ttl=60)
+    cache.put("a", "A", size=40)
+    cache.put("b", "B", size=40)
+
+    assert cache.resize("b", 70)  # "b" dựng thêm cấu trúc trong bộ nhớ
+    assert "a" not in cache and cache.current_bytes == 70
+    assert not cache.resize("b", 101)
+    assert len(cache) == 0 and cache.current_bytes == 0
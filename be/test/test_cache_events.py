@@ -0,0 +1,75 @@
+import asyncio
+import time
+
+import fakeredis
+
+from src.cache import VectorStoreCache
+from src.cache_events import CACHE_EVENTS_CHANNEL, CacheInvalidationListener, parse_event, publish_invalidation
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_parse_worker_events_and_expiry_notifications():
+    assert parse_event(CACHE_EVENTS_CHANNEL, '{"uid": "u1", "generation": "7", "reason": "uploaded"}') == ("u1", "7", "uploaded")
+    assert parse_event(b"__keyevent@1__:expired", b"user:u:2:vectorstore") == ("u:2", None, "expired")
+    assert parse_event("__keyevent@1__:expired", "user:u1:retrieve_rate") is None
+    assert parse_event(CACHE_EVENTS_CHANNEL, "not json") is None
+
+
+def test_invalidate_keeps_entry_already_at_generation():
+    cache = VectorStoreCache(max_bytes=100, ttl=60)
+    cache.put("u1", "A", size=10, generation="5")
+    assert not cache.invalidate("u1", "5")
+    assert cache.invalidate("u1", "6")
+    assert "u1" not in cache
+
+
+def test_listener_receives_worker_events_and_expiry():
+    server = fakeredis.FakeServer()
+    publisher = fakeredis.FakeRedis(server=server)
+    received = []
+
+    async def main():
+        listener = CacheInvalidationListener(
+            fakeredis.aioredis.FakeRedis(server=server, decode_responses=True),
+            lambda *event: received.append(event),
+            configure_keyspace=False,
+        )
+        listener.start()
+        await asyncio.wait_for(listener.subscribed.wait(), 2)
+        publish_invalidation(publisher, "u1", 3, "deleted")
+        publisher.publish("__keyevent@1__:expired", "user:u2:status")
+        for _ in range(200):
+            if len(received) == 2:
+                break
+            await asyncio.sleep(0.01)
+        await listener.stop()
+        return listener.stats()
+
+    stats = asyncio.run(main())
+    assert received == [("u1", "3", "deleted"), ("u2", None, "expired")]
+    assert stats["events"] == 1 and stats["expired"] == 1
+
+
+def test_worker_event_evicts_stale_vectorstore_in_api(api):
+    from src import main
+
+    client, redis_client, upload_index = api
+    upload_index("u-ev", ["tài liệu cũ"], generation="1")
+    assert client.post("/api/v1/retrieve", data={"query_text": "cũ", "uid": "u-ev"}).status_code == 200
+    assert "u-ev" in main.users_vectorstores_cache
+    assert wait_for(lambda: main.cache_events_listener.subscribed.is_set())
+
+    # Sự kiện với generation đang có trong cache không làm mất entry
+    publish_invalidation(redis_client, "u-ev", "1")
+    upload_index("u-ev", ["tài liệu mới"], generation="2")
+    publish_invalidation(redis_client, "u-ev", "2", "uploaded")
+    assert wait_for(lambda: "u-ev" not in main.users_vectorstores_cache)
+    assert main.cache_events_listener.stats()["events"] == 2
@@ -0,0 +1,115 @@
+import fakeredis
+import numpy as np
+
+from src.rag.ann import IVFFlatIndex
+from src.rag.collection import append_document, list_documents, remove_document, tag_document
+from src.rag.index_format import VectorIndex, deserialize_index, serialize_index
+from src.rag.search import VectorSearchEngine, normalize_rows
+
+
+def make_document(doc_id, n, dim=8, seed=0):
+    rng = np.random.default_rng(seed)
+    index = VectorIndex(
+        normalize_rows(rng.standard_normal((n, dim))),
+        [f"{doc_id} chunk {i}" for i in range(n)],
+        metadatas=[{"page": i // 2} for i in range(n)],
+    )
+    return tag_document(index, doc_id, filename=f"{doc_id}.pdf")
+
+
+def test_append_filter_and_delete_without_reembedding():
+    first, second = make_document("a", 5, seed=1), make_document("b", 3, seed=2)
+    collection = append_document(append_document(None, first), second)
+
+    assert len(collection) == 8
+    assert collection.ids[5] == "b:0"
+    assert np.array_equal(collection.embeddings[5:], second.embeddings)
+    assert list_documents(collection) == {
+        "a": {"chunks": 5, "pages": 3, "source": "a.pdf"},
+        "b": {"chunks": 3, "pages": 2, "source": "b.pdf"},
+    }
+
+    engine = VectorSearchEngine(deserialize_index(serialize_index(collection)))
+    hits = engine.similarity_search_with_score_by_vector(second.embeddings[0], k=8, filter={"doc_id": ["b"]})
+    assert {doc.metadata["doc_id"] for doc, _ in hits} == {"b"}
+
+    remaining = remove_document(collection, "a")
+    assert [remaining.texts[i] for i in range(len(remaining))] == ["b chunk 0", "b chunk 1", "b chunk 2"]
+    assert np.array_equal(remaining.embeddings, second.embeddings)
+    assert remove_document(remaining, "missing") is None
+
+
+def test_ann_index_is_extended_and_compacted():
+    base = make_document("a", 300, dim=16, seed=3)
+    collection = append_document(None, base, min_chunks=100)
+    assert IVFFlatIndex.from_index(collection) is not None
+
+    grown = append_document(collection, make_document("b", 100, dim=16, seed=4), min_chunks=100)
+    ivf = IVFFlatIndex.from_index(grown)
+    assert np.array_equal(ivf.centroids, IVFFlatIndex.from_index(collection).centroids)
+    assert sorted(ivf.ids.tolist()) == list(range(400))
+
+    shrunk = remove_document(grown, "b", min_chunks=100)
+    assert sorted(IVFFlatIndex.from_index(shrunk).ids.tolist()) == list(range(300))
+    # Chỉ còn 1/4 số chunk lúc dựng: IVF được dựng lại; dưới ngưỡng thì bỏ IVF
+    rebuilt = IVFFlatIndex.from_index(remove_document(grown, "a", min_chunks=100))
+    assert rebuilt.n_lists == 10
+    assert IVFFlatIndex.from_index(remove_document(grown, "a", min_chunks=101)) is None
+
+
+def test_delete_document_task_publishes_compacted_index(monkeypatch):
+    from src import celery_worker
+
+    redis_client = fakeredis.FakeRedis()
+    monkeypatch.setattr(celery_worker, "redis_client", redis_client)
+    collection = append_document(make_document("a", 4), make_document("b", 2, seed=5))
+    redis_client.set("user:u1:vectorstore", serialize_index(collection))
+
+    result = celery_worker.delete_document.run("u1", "a")
+
+    assert result == {"status": "success", "doc_id": "a", "chunks": 2}
+    stored = deserialize_index(redis_client.get("user:u1:vectorstore"))
+    assert list(list_documents(stored)) == ["b"]
+    assert redis_client.get("user:u1:generation") == b"1"
+    assert celery_worker.delete_document.run("u1", "a")["status"] == "not_found"
+
+
+def test_worker_locks_replacements_and_keeps_serving_during_append(monkeypatch):
+    from contextlib import contextmanager
+
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+
+    from src import celery_worker
+    from test.test_pdf_loader import make_pdf
+
+    redis_client = fakeredis.FakeRedis()
+    embeddings = DeterministicFakeEmbedding(size=8)
+    statuses = []
+    locked = []
+
+    class ObservingEmbeddings:
+        def embed_documents(self, texts):
+            statuses.append((redis_client.get("user:u1:status"), redis_client.get("user:u1:doc_status:d2")))
+            return embeddings.embed_documents(texts)
+
+    @contextmanager
+    def recording_lock(uid):
+        locked.append(uid)
+        yield
+
+    monkeypatch.setattr(celery_worker, "redis_client", redis_client)
+    monkeypatch.setattr(celery_worker, "embedding_scheduler", ObservingEmbeddings())
+    monkeypatch.setattr(celery_worker, "_index_lock", recording_lock)
+    monkeypatch.setattr(celery_worker.process_document, "update_state", lambda **kwargs: None)
+
+    celery_worker.process_document.run(make_pdf(2), "u1", "d1")
+    assert locked == ["u1"]
+
+    redis_client.set("user:u1:doc_status:d2", "processing")
+    result = celery_worker.process_document.run(make_pdf(3), "u1", "d2", append=True)
+    assert locked == ["u1", "u1"]
+    # Trong lúc thêm tài liệu, người dùng vẫn truy vấn được các tài liệu đã có
+    assert statuses[-1] == (b"ready", b"processing")
+    assert redis_client.get("user:u1:doc_status:d2") == b"ready"
+    stored = deserialize_index(redis_client.get("user:u1:vectorstore"))
+    assert list(list_documents(stored)) == ["d1", "d2"] and result["chunks"] == len(stored)
@@ -0,0 +1,192 @@
+import threading
+import time
+
+import fakeredis
+import numpy as np
+from langchain_core.documents import Document
+
+from src.rag.embedding_cache import CachedEmbeddings, QueryEmbeddingCache, embedding_cache_key
+from src.rag.preprocess import StoringDocuments
+
+
+class CountingEmbeddings:
+    def __init__(self, dim=8):
+        self.dim = dim
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        return [[float(len(t) + i) for i in range(self.dim)] for t in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def test_duplicate_chunks_are_embedded_once():
+    inner = CountingEmbeddings()
+    embedder = CachedEmbeddings(inner)
+
+    matrix = embedder.embed_array(["a b", "c", "a  b ", "c"])
+
+    assert inner.calls == [["a b", "c"]]
+    assert matrix.shape == (4, 8)
+    assert np.array_equal(matrix[0], matrix[2])
+    assert embedder.stats()["deduplicated"] == 2
+
+
+def test_duplicate_chunks_across_concurrent_batches_are_embedded_once():
+    entered, release = threading.Event(), threading.Event()
+
+    class BlockingEmbeddings(CountingEmbeddings):
+        def embed_documents(self, texts):
+            first = not self.calls
+            vectors = super().embed_documents(texts)
+            if first:
+                entered.set()
+                release.wait(5)
+            return vectors
+
+    inner = BlockingEmbeddings()
+    embedder = CachedEmbeddings(inner)
+    results = {}
+    first = threading.Thread(target=lambda: results.setdefault("first", embedder.embed_array(["a", "b"])))
+    first.start()
+    entered.wait(5)
+    # Lô thứ hai chứa "b" trong lúc lô đầu còn đang embed: chỉ "c" được gửi đi
+    second = threading.Thread(target=lambda: results.setdefault("second", embedder.embed_array(["b", "c"])))
+    second.start()
+    while len(inner.calls) < 2:
+        time.sleep(0.01)
+    release.set()
+    first.join(5)
+    second.join(5)
+
+    assert inner.calls == [["a", "b"], ["c"]]
+    assert np.array_equal(results["first"][1], results["second"][0])
+    assert embedder.embed_array(["c", "a"]).shape == (2, 8) and len(inner.calls) == 2
+    assert embedder.stats()["deduplicated"] == 3
+
+
+def test_redis_cache_is_shared_between_uploads():
+    redis_client = fakeredis.FakeRedis()
+    inner = CountingEmbeddings()
+
+    first = CachedEmbeddings(inner, redis_client, model_name="m").embed_array(["x", "y"])
+    second_embedder = CachedEmbeddings(inner, redis_client, model_name="m")
+    second = second_embedder.embed_array(["y", "x", "z"])
+
+    assert inner.calls == [["x", "y"], ["z"]]
+    assert np.array_equal(first[0], second[1])
+    stats = second_embedder.stats()
+    assert stats["hits"] == 2 and stats["misses"] == 1
+    assert redis_client.ttl(embedding_cache_key("x", "m")) > 0
+
+
+def test_model_name_is_part_of_the_key():
+    assert embedding_cache_key("x", "a") != embedding_cache_key("x", "b")
+
+
+def test_max_entries_evicts_least_recently_used():
+    redis_client = fakeredis.FakeRedis()
+    embedder = CachedEmbeddings(CountingEmbeddings(), redis_client, model_name="m", max_entries=2)
+
+    embedder.embed_array(["1"])
+    embedder.embed_array(["2"])
+    embedder.embed_array(["3"])
+
+    assert redis_client.get(embedding_cache_key("1", "m")) is None
+    assert redis_client.get(embedding_cache_key("3", "m")) is not None
+
+
+def test_storing_documents_builds_index():
+    docs = [Document(page_content="một", metadata={"page": 0}), Document(page_content="hai", metadata={"page": 1})]
+    index = StoringDocuments(docs, embedder=CachedEmbeddings(CountingEmbeddings()))
+
+    assert len(index) == 2
+    assert index.texts[1] == "hai"
+    assert index.metadatas[1] == {"page": 1}
+
+
+class CountingQueryEmbeddings:
+    def __init__(self):
+        self.calls = 0
+        self.now = 0.0
+
+    def embed_query(self, text):
+        self.calls += 1
+        self.now += 0.5  # độ trễ mạng giả lập
+        return [float(len(text)), 1.0]
+
+
+def test_query_embedding_cache_tiers():
+    inner = CountingQueryEmbeddings()
+    redis_client = fakeredis.FakeRedis()
+    cache = QueryEmbeddingCache(inner, model_name="m", max_entries=1, redis_client=redis_client, clock=lambda: inner.now)
+
+    assert cache.embed_query("Xin  chào") == [9.0, 1.0]
+    assert cache.embed_query("Xin chào ") == [9.0, 1.0]  # cùng văn bản sau khi chuẩn hóa
+    cache.embed_query("khác")  # đẩy câu hỏi đầu khỏi LRU cục bộ (max_entries=1)
+
+    other_instance = QueryEmbeddingCache(inner, model_name="m", redis_client=redis_client)
+    assert other_instance.embed_query("Xin chào") == [9.0, 1.0]
+    assert inner.calls == 2
+    stats = cache.stats()
+    assert stats["local_hits"] == 1 and stats["misses"] == 2
+    assert stats["avg_miss_seconds"] == 0.5
+    assert stats["saved_seconds"] == 0.5
+    assert other_instance.stats()["redis_hits"] == 1
+
+
+def test_query_embedding_cache_async():
+    import asyncio
+
+    inner = CountingQueryEmbeddings()
+    cache = QueryEmbeddingCache(inner, model_name="m", async_redis_client=fakeredis.aioredis.FakeRedis())
+
+    async def main():
+        return [await cache.aembed_query("abc") for _ in range(3)]
+
+    assert asyncio.run(main()) == [[3.0, 1.0]] * 3
+    assert inner.calls == 1
+
+
+class TaskTypeEmbeddings:
+    """Giống GoogleGenerativeAIEmbeddings: embed_documents nhận task_type."""
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.task_types = []
+
+    def embed_documents(self, texts, *, task_type=None):
+        if self.fail:
+            error = RuntimeError("RESOURCE_EXHAUSTED")
+            error.code = 429
+            raise error
+        self.task_types.append(task_type)
+        return [[float(len(t)), 1.0 if task_type == "RETRIEVAL_QUERY" else 0.0] for t in texts]
+
+    def embed_query(self, text, *, task_type="RETRIEVAL_QUERY"):
+        return [float(len(text)), 1.0]
+
+
+def test_batch_query_embeddings_use_query_task_and_map_quota_errors():
+    import asyncio
+
+    import pytest
+
+    from src.rag.embedding_scheduler import EmbeddingScheduler, QuotaRateLimit, TokenBucket
+
+    inner = TaskTypeEmbeddings()
+    cache = QueryEmbeddingCache(inner, model_name="m")
+    assert asyncio.run(cache.aembed_queries(["ab", "abc"])) == [[2.0, 1.0], [3.0, 1.0]]
+    # Cùng khóa với embed_query: vector lô phải giống hệt vector câu hỏi đơn lẻ
+    assert cache.embed_query("ab") == inner.embed_query("ab")
+
+    scheduled = TaskTypeEmbeddings()
+    scheduler = EmbeddingScheduler(scheduled, limiter=TokenBucket(rate=1e9, capacity=1000))
+    cache = QueryEmbeddingCache(scheduled, model_name="m", batch_embedder=scheduler)
+    asyncio.run(cache.aembed_queries(["x"]))
+    assert scheduled.task_types == ["RETRIEVAL_QUERY"]
+
+    with pytest.raises(QuotaRateLimit):
+        asyncio.run(QueryEmbeddingCache(TaskTypeEmbeddings(fail=True)).aembed_queries(["y"]))
@@ -0,0 +1,109 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from src.rag.embedding_scheduler import (
+    EmbeddingScheduler,
+    QuotaRateLimit,
+    TokenBucket,
+    is_rate_limit_error,
+)
+
+
+class RateLimited(RuntimeError):
+    """Giống google.genai.errors.ClientError: mang mã HTTP trong thuộc tính `code`."""
+
+    code = 429
+
+
+class SlowEmbeddings:
+    def __init__(self, delay=0.05, failures=0):
+        self.delay = delay
+        self.failures = failures
+        self.batches = []
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def embed_documents(self, texts):
+        with self._lock:
+            if self.failures:
+                self.failures -= 1
+                raise RateLimited("RESOURCE_EXHAUSTED")
+            self.batches.append(list(texts))
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(self.delay)
+        with self._lock:
+            self.active -= 1
+        return [[float(t), 1.0] for t in texts]
+
+
+def unlimited():
+    return TokenBucket(rate=1e9, capacity=1000)
+
+
+def test_batches_run_concurrently_and_keep_order():
+    inner = SlowEmbeddings()
+    scheduler = EmbeddingScheduler(inner, batch_size=10, max_concurrency=4, limiter=unlimited())
+
+    texts = [str(i) for i in range(95)]
+    start = time.perf_counter()
+    matrix = scheduler.embed_array(texts)
+    elapsed = time.perf_counter() - start
+
+    assert np.array_equal(matrix[:, 0], np.arange(95))
+    assert len(inner.batches) == 10 and max(len(b) for b in inner.batches) == 10
+    assert inner.max_active == 4
+    assert elapsed < 10 * inner.delay
+
+
+def test_retries_on_429_with_backoff():
+    inner = SlowEmbeddings(delay=0, failures=2)
+    sleeps = []
+    scheduler = EmbeddingScheduler(inner, limiter=unlimited(), sleep=sleeps.append, base_delay=1.0)
+
+    assert scheduler.embed_array(["1"]).shape == (1, 2)
+    assert len(sleeps) == 2 and sleeps[1] > sleeps[0] / 2
+
+
+def test_raises_quota_rate_limit_when_retries_exhausted():
+    inner = SlowEmbeddings(delay=0, failures=10)
+    scheduler = EmbeddingScheduler(inner, limiter=unlimited(), max_retries=2, sleep=lambda _: None)
+
+    with pytest.raises(QuotaRateLimit):
+        scheduler.embed_array(["1"])
+
+
+def test_raises_quota_rate_limit_when_bucket_is_empty():
+    bucket = TokenBucket(rate=0.001, capacity=1)
+    scheduler = EmbeddingScheduler(SlowEmbeddings(delay=0), batch_size=1, limiter=bucket, max_quota_wait=0.1)
+
+    with pytest.raises(QuotaRateLimit):
+        scheduler.embed_array(["1", "2"])
+
+
+def test_non_quota_errors_are_not_retried():
+    class Broken:
+        def embed_documents(self, texts):
+            raise ValueError("bad input")
+
+    with pytest.raises(ValueError):
+        EmbeddingScheduler(Broken(), limiter=unlimited()).embed_array(["x"])
+
+
+def test_rate_limit_detection_ignores_message_text():
+    assert not is_rate_limit_error(RuntimeError("doc 429: quota exceeded for project permissions"))
+    assert not is_rate_limit_error(ValueError("RESOURCE_EXHAUSTED"))
+    assert is_rate_limit_error(RateLimited("too many requests"))
+
+    # langchain_google_genai bọc lỗi gốc: vẫn phải nhận ra qua __cause__
+    try:
+        try:
+            raise RateLimited("too many requests")
+        except RateLimited as exc:
+            raise RuntimeError("Error embedding content") from exc
+    except RuntimeError as wrapped:
+        assert is_rate_limit_error(wrapped)
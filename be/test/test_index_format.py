@@ -0,0 +1,103 @@
+import pickle
+
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import FakeEmbeddings
+from langchain_core.vectorstores import InMemoryVectorStore
+
+from src.rag.index_format import (
+    ChunkSpans,
+    IndexFormatError,
+    VectorIndex,
+    concat_indexes,
+    deserialize_index,
+    load_index,
+    select_rows,
+    serialize_index,
+    zstandard,
+)
+from src.rag.preprocess import SplittingDocuments
+
+
+def make_index(n=5, dim=8):
+    rng = np.random.default_rng(0)
+    texts = [f"Đoạn văn số {i} có dấu tiếng Việt" for i in range(n)]
+    return VectorIndex(
+        embeddings=rng.standard_normal((n, dim)).astype(np.float32),
+        texts=texts,
+        metadatas=[{"page": i} for i in range(n)],
+        ids=[f"id-{i}" for i in range(n)],
+    )
+
+
+def test_roundtrip_is_zero_copy():
+    index = make_index()
+    payload = serialize_index(index, codec="none")
+    loaded = deserialize_index(payload)
+
+    assert np.array_equal(loaded.embeddings, index.embeddings)
+    assert list(loaded.texts) == list(index.texts)
+    assert loaded.metadatas == index.metadatas
+    assert loaded.ids == index.ids
+    # Ma trận là view trên payload chứ không phải bản sao
+    assert not loaded.embeddings.flags.owndata
+    assert not loaded.embeddings.flags.writeable
+
+
+@pytest.mark.skipif(zstandard is None, reason="zstandard chưa được cài đặt")
+def test_roundtrip_zstd():
+    index = make_index(50)
+    loaded = deserialize_index(serialize_index(index, codec="zstd"))
+    assert list(loaded.texts) == list(index.texts)
+
+
+def test_chunk_spans_store_each_page_once():
+    pages = [" ".join(f"từ{i}_{j}" for j in range(400)) for i in range(3)]
+    chunks = SplittingDocuments([Document(page_content=p, metadata={"page": i}) for i, p in enumerate(pages)])
+    # Chunk không nằm nguyên văn trong trang nào được lưu như một trang phụ
+    chunks.append(Document(page_content="chú thích riêng", metadata={"page": 0}))
+    spans = ChunkSpans.from_chunks(pages, chunks)
+    texts = [c.page_content for c in chunks]
+
+    assert list(spans) == texts
+    assert len(spans.pages) == 4
+    assert spans.pages.blob.nbytes < sum(len(t.encode("utf-8")) for t in texts)
+    assert all("start_index" in c.metadata for c in chunks[:-1])
+
+    index = VectorIndex(np.ones((len(texts), 2), dtype=np.float32), spans, [dict(c.metadata) for c in chunks])
+    loaded = deserialize_index(serialize_index(index, codec="none"))
+    assert isinstance(loaded.texts, ChunkSpans) and list(loaded.texts) == texts
+    assert loaded.document(1).metadata == chunks[1].metadata
+
+    # Nối với chỉ mục cũ (PackedTexts) và xóa bớt chunk: trang không còn được tham chiếu bị loại bỏ
+    merged = concat_indexes(loaded, make_index(2, dim=2))
+    assert list(merged.texts) == texts + list(make_index(2).texts)
+    keep = np.array([c.metadata.get("page") == 1 for c in chunks] + [True, False])
+    compacted = select_rows(merged, keep)
+    assert list(compacted.texts) == [t for t, k in zip(list(merged.texts), keep) if k]
+    assert len(compacted.texts.pages) == 2
+
+
+def test_empty_index():
+    loaded = deserialize_index(serialize_index(VectorIndex(np.zeros((0, 0)), []), codec="none"))
+    assert len(loaded) == 0
+
+
+def test_load_legacy_pickle():
+    store = InMemoryVectorStore(embedding=FakeEmbeddings(size=4))
+    store.store["a"] = {"id": "a", "vector": [0.1, 0.2, 0.3, 0.4], "text": "xin chào", "metadata": {"p": 1}}
+
+    index, legacy = load_index(pickle.dumps(store))
+
+    assert legacy
+    assert index.ids == ["a"]
+    assert index.texts[0] == "xin chào"
+    assert index.embeddings.shape == (1, 4)
+
+
+def test_rejects_unknown_codec_and_garbage():
+    with pytest.raises(IndexFormatError):
+        serialize_index(make_index(), codec="brotli")
+    with pytest.raises(IndexFormatError):
+        load_index(b"not an index")
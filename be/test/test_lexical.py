@@ -0,0 +1,125 @@
+import numpy as np
+import pytest
+
+from src.rag.index_format import VectorIndex, deserialize_index, serialize_index
+from src.rag.lexical import BM25Index, build_lexical_index, tokenize
+from src.rag.search import NumpyRetriever, VectorSearchEngine
+
+TEXTS = [
+    "Bơm thủy lực mã AB-1234 dùng cho máy ép.",
+    "Điều 3.2.1 quy định thời hạn bảo hành là 12 tháng.",
+    "Máy ép thủy lực cần bảo dưỡng định kỳ.",
+    "Hướng dẫn lắp đặt van an toàn.",
+]
+
+
+def make_engine():
+    rng = np.random.default_rng(0)
+    index = VectorIndex(rng.standard_normal((len(TEXTS), 8)).astype(np.float32), TEXTS)
+    build_lexical_index(index)
+    return VectorSearchEngine(deserialize_index(serialize_index(index)))
+
+
+class NoEmbeddings:
+    def embed_query(self, text):
+        raise AssertionError("embed_query không được gọi cho câu hỏi từ khóa")
+
+
+def test_tokenizer_keeps_codes_together():
+    assert tokenize("Mã AB-1234, điều 3.2.1 và v2_final.") == ["mã", "ab-1234", "điều", "3.2.1", "và", "v2_final"]
+
+
+def test_bm25_ranks_matching_chunks_and_survives_serialization():
+    engine = make_engine()
+    assert engine._lexical is not None  # đọc từ section phụ, không dựng lại
+
+    hits = engine.search_lexical("thủy lực máy ép", k=4)
+    assert {i for i, _ in hits} == {0, 2}
+    assert engine.search_lexical("không có từ nào", k=4) == []
+    assert engine.search_lexical("AB-1234")[0][0] == 0
+
+
+def test_keyword_queries_skip_embedding():
+    engine = make_engine()
+    assert engine.is_keyword_query("AB-1234")
+    assert engine.is_keyword_query('"3.2.1"')
+    assert not engine.is_keyword_query("máy ép thủy lực cần bảo dưỡng khi nào")
+    assert not engine.is_keyword_query("XY-999")  # không có trong từ vựng
+
+    retriever = NumpyRetriever(engine=engine, embeddings=NoEmbeddings())
+    docs = retriever.invoke("AB-1234")
+    assert docs[0].page_content == TEXTS[0]
+
+
+def test_engine_size_includes_lazily_built_lexical_structures():
+    rng = np.random.default_rng(0)
+    metadatas = [{"page": i, "doc_id": "d1"} for i in range(len(TEXTS))]
+    index = VectorIndex(rng.standard_normal((len(TEXTS), 8)).astype(np.float32), TEXTS, metadatas)
+    assert index.nbytes() > index.embeddings.nbytes + index.texts.nbytes()
+
+    engine = VectorSearchEngine(index)  # chỉ mục cũ, chưa có BM25
+    before = engine.nbytes()
+    engine.search_lexical("AB-1234")
+    assert engine.nbytes() == before + engine.lexical.nbytes() > before
+    assert engine.lexical.terms_nbytes() > 0
+
+
+def test_weak_keyword_matches_fall_back_to_embedding():
+    texts = ["Mã AB-1234 ở trang bìa.", "AB-1234 ở chân trang.", "AB-1234 ở đầu trang.", "Bảo hành 12 tháng."]
+    rng = np.random.default_rng(0)
+    index = VectorIndex(rng.standard_normal((len(texts), 8)).astype(np.float32), texts)
+    engine = VectorSearchEngine(index)
+    queries = []
+
+    class RecordingEmbeddings:
+        def embed_query(self, text):
+            queries.append(text)
+            return engine.matrix[3]
+
+    # "AB-1234" có mặt ở hầu hết các chunk: điểm BM25 thấp, không tin fast path từ khóa
+    assert engine.is_keyword_query("AB-1234")
+    mode, hits = engine.keyword_search("AB-1234")
+    assert hits is None and mode != "lexical"
+    docs = NumpyRetriever(engine=engine, embeddings=RecordingEmbeddings()).invoke("AB-1234")
+    assert queries == ["AB-1234"] and docs[0].page_content == texts[3]
+    # Chế độ "lexical" được yêu cầu rõ ràng thì không chuyển
+    assert engine.keyword_search("AB-1234", mode="lexical")[0] == "lexical"
+
+
+def test_hybrid_fuses_dense_and_lexical_rankings():
+    engine = make_engine()
+    dense_query = engine.matrix[3]
+    fused = [i for i, _ in engine.search_hybrid("điều 3.2.1", dense_query, k=2)]
+    assert set(fused) == {1, 3}
+
+
+def test_lexical_index_matches_reference_bm25():
+    bm25 = BM25Index.build(TEXTS, k1=1.2, b=0.75)
+    docs = [tokenize(t) for t in TEXTS]
+    avgdl = sum(map(len, docs)) / len(docs)
+    term = "thủy"
+    df = sum(term in d for d in docs)
+    idf = np.log(1 + (len(docs) - df + 0.5) / (df + 0.5))
+    expected = [
+        idf * d.count(term) * 2.2 / (d.count(term) + 1.2 * (1 - 0.75 + 0.75 * len(d) / avgdl)) for d in docs
+    ]
+    assert bm25.scores(term) == pytest.approx(expected, rel=1e-5)
+
+
+def test_retrieve_endpoint_keyword_fast_path(api, monkeypatch):
+    from src import main
+
+    client, _, upload_index = api
+    upload_index("u-lex", TEXTS)
+    seen = []
+
+    async def fake_generate(question, docs):
+        seen.append([d.page_content for d in docs])
+        return "ok"
+
+    monkeypatch.setattr(main, "GenerateAnswer", fake_generate)
+    response = client.post("/api/v1/retrieve", data={"query_text": "AB-1234", "uid": "u-lex"})
+
+    assert response.status_code == 200, response.text
+    assert seen == [[TEXTS[0]]]
+    assert main.query_embeddings.stats()["misses"] == 0
@@ -0,0 +1,61 @@
+import json
+
+from fastapi.testclient import TestClient
+
+from loadtest.fake_gemini import FakeGeminiConfig, create_app
+from loadtest.report import LatencyRecorder
+
+
+def fake_gemini(**overrides):
+    config = FakeGeminiConfig(dim=16, embed_latency=0, embed_latency_per_item=0, chat_latency=0,
+                              chat_latency_per_token=0, answer_tokens=12, seed=0, **overrides)
+    return TestClient(create_app(config))
+
+
+def test_fake_gemini_embeds_and_answers():
+    client = fake_gemini()
+    body = {"requests": [{"content": {"parts": [{"text": t}]}} for t in ("xin chào", "xin chào", "tạm biệt")]}
+    response = client.post("/v1beta/models/gemini-embedding-001:batchEmbedContents", json=body)
+    vectors = [e["values"] for e in response.json()["embeddings"]]
+    assert len(vectors) == 3 and len(vectors[0]) == 16
+    assert vectors[0] == vectors[1] != vectors[2]
+
+    chat = {"contents": [{"role": "user", "parts": [{"text": "Câu hỏi: hợp đồng hết hạn khi nào"}]}]}
+    answer = client.post("/v1beta/models/gemini-2.5-flash:generateContent", json=chat).json()
+    assert len(answer["candidates"][0]["content"]["parts"][0]["text"].split()) == 12
+
+    stream = client.post("/v1beta/models/gemini-2.5-flash:streamGenerateContent?alt=sse", json=chat)
+    chunks = [json.loads(line[len("data: "):]) for line in stream.text.splitlines() if line.startswith("data: ")]
+    assert len(chunks) == 3 and chunks[-1]["candidates"][0]["finishReason"] == "STOP"
+
+
+def test_fake_gemini_injects_quota_errors():
+    client = fake_gemini(rate_429=1.0)
+    response = client.post("/v1beta/models/gemini-embedding-001:embedContent", json={"content": {"parts": [{"text": "x"}]}})
+    assert response.status_code == 429
+    assert response.json()["error"]["status"] == "RESOURCE_EXHAUSTED"
+
+    limited = fake_gemini(rpm_limit=1)
+    chat = {"contents": [{"parts": [{"text": "hỏi"}]}]}
+    assert limited.post("/v1beta/models/m:generateContent", json=chat).status_code == 200
+    assert limited.post("/v1beta/models/m:generateContent", json=chat).status_code == 429
+    assert limited.get("/stats").json()["errors_429"] == 1
+
+
+def test_recorder_percentiles_and_throughput():
+    now = [0.0]
+    recorder = LatencyRecorder(clock=lambda: now[0])
+    recorder.start()
+    for i in range(1, 101):
+        recorder.record("answer", i / 100)
+    recorder.rate_limited("answer")
+    recorder.error("upload_to_ready")
+    now[0] = 10.0
+    recorder.stop()
+
+    summary = recorder.summary()
+    assert summary["answer"]["count"] == 100 and summary["answer"]["rate_limited"] == 1
+    assert abs(summary["answer"]["p50_s"] - 0.505) < 1e-9
+    assert abs(summary["answer"]["p99_s"] - 0.9901) < 1e-9
+    assert summary["answer"]["throughput_per_s"] == 10.0
+    assert summary["upload_to_ready"] == {"count": 0, "errors": 1, "rate_limited": 0, "throughput_per_s": 0.0}
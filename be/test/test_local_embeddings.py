@@ -0,0 +1,60 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+
+from src.rag.index_format import VectorIndex
+from src.rag.local_embeddings import HashingEmbeddings
+from src.rag.search import VectorSearchEngine
+
+
+def test_vectors_are_deterministic_normalized_and_batch_consistent():
+    embeddings = HashingEmbeddings(dim=64)
+    texts = ["Hợp đồng có hiệu lực từ ngày 01/01", "", "hợp đồng hợp đồng hợp đồng"]
+    matrix = embeddings.embed_array(texts)
+
+    assert matrix.shape == (3, 64) and matrix.dtype == np.float32
+    assert np.allclose(np.linalg.norm(matrix[[0, 2]], axis=1), 1.0)
+    assert not matrix[1].any()
+    assert np.allclose(HashingEmbeddings(dim=64).embed_query(texts[0]), matrix[0])
+    assert np.allclose(embeddings.embed_documents(texts[2:]), matrix[2:])
+
+
+def test_retrieval_ranks_chunks_sharing_words_first():
+    embeddings = HashingEmbeddings()
+    texts = [
+        "Điều khoản thanh toán: bên mua trả tiền trong 30 ngày.",
+        "Bảo hành thiết bị kéo dài 24 tháng kể từ ngày giao hàng.",
+        "Tranh chấp được giải quyết tại tòa án có thẩm quyền.",
+    ]
+    engine = VectorSearchEngine(VectorIndex(embeddings.embed_array(texts), texts))
+    hits = engine.similarity_search("thời gian bảo hành thiết bị", embeddings.embed_query("thời gian bảo hành thiết bị"))
+    assert hits[0][0].page_content == texts[1]
+
+
+def test_backend_is_selected_by_configuration():
+    env = {**os.environ, "EMBEDDING_BACKEND": "hashing", "LOCAL_EMBEDDING_DIM": "128"}
+    env.pop("USE_MOCK_EMBEDDINGS", None)
+    code = (
+        "from src.rag import preprocess as p;"
+        "print(p.EMBEDDING_MODEL_NAME, p.LOCAL_EMBEDDINGS, p.embedding_scheduler is p.embeddings)"
+    )
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    out = subprocess.run([sys.executable, "-c", code], env=env, cwd=root, capture_output=True, text=True, check=True)
+    assert out.stdout.split() == ["local-hashing-128-2", "True", "True"]
+
+
+def test_shared_memo_is_safe_across_threads(monkeypatch):
+    from concurrent.futures import ThreadPoolExecutor
+
+    from src.rag import local_embeddings
+
+    # Bảng nhớ rất nhỏ: bị xóa liên tục trong lúc các luồng khác đang tra cứu
+    monkeypatch.setattr(local_embeddings, "_MAX_MEMO", 8)
+    embeddings = HashingEmbeddings(dim=64)
+    texts = [" ".join(f"từ{i}_{j}" for j in range(50)) for i in range(40)]
+    expected = HashingEmbeddings(dim=64).embed_array(texts)
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(lambda t: embeddings.embed_array([t])[0], texts * 5))
+    assert np.allclose(results, np.concatenate([expected] * 5))
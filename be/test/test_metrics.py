@@ -0,0 +1,88 @@
+import asyncio
+import contextlib
+import time
+import timeit
+
+import fakeredis
+
+from src.metrics import MetricsPusher, Registry, load_worker_snapshots
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = Registry()
+    stages = registry.histogram("stage_seconds", "Thời gian", ("stage",), buckets=(0.1, 1.0))
+    payload = registry.gauge("payload_bytes", "Kích thước", ("kind",))
+    stages.observe(0.05, "split")
+    stages.observe(0.5, "split")
+    stages.observe(5.0, "split")
+    payload.set(1024, 'say "pdf"')
+
+    text = registry.render()
+    assert "# TYPE stage_seconds histogram" in text
+    assert 'stage_seconds_bucket{stage="split",le="0.1"} 1' in text
+    assert 'stage_seconds_bucket{stage="split",le="1.0"} 2' in text
+    assert 'stage_seconds_bucket{stage="split",le="+Inf"} 3' in text
+    assert 'stage_seconds_sum{stage="split"} 5.55' in text
+    assert 'stage_seconds_count{stage="split"} 3' in text
+    assert 'payload_bytes{kind="say \\"pdf\\""} 1024' in text
+
+
+def test_worker_snapshots_are_pushed_through_redis():
+    server = fakeredis.FakeServer()
+    worker_registry = Registry()
+    stages = worker_registry.histogram("stage_seconds", "Thời gian", ("stage",))
+    stages.observe(0.2, "serialize")
+    pusher = MetricsPusher(worker_registry, fakeredis.FakeRedis(server=server), worker_id="w1", interval=60)
+    assert pusher.push()
+    assert not pusher.push()  # chưa hết chu kỳ
+    fakeredis.FakeRedis(server=server).sadd("metrics:workers", "w-gone")
+
+    api_registry = Registry()
+    api_registry.histogram("stage_seconds", "Thời gian", ("stage",)).observe(0.01, "search")
+    redis_client = fakeredis.aioredis.FakeRedis(server=server)
+    snapshots = asyncio.run(load_worker_snapshots(redis_client))
+    text = api_registry.render(snapshots)
+
+    assert list(snapshots) == ["w1"]
+    assert text.count("# TYPE stage_seconds histogram") == 1
+    assert 'stage_seconds_count{stage="search"} 1' in text
+    assert 'stage_seconds_count{stage="serialize",worker="w1"} 1' in text
+    assert asyncio.run(redis_client.smembers("metrics:workers")) == {b"w1"}
+
+
+def test_observe_overhead_is_small():
+    stages = Registry().histogram("stage_seconds", "Thời gian", ("stage",))
+    samples = []
+
+    @contextlib.contextmanager
+    def bare_timer():
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            samples.append(time.perf_counter() - start)
+
+    def best_of(timer):
+        def loop():
+            for _ in range(2000):
+                with timer():
+                    pass
+        return min(timeit.repeat(loop, number=1, repeat=5))
+
+    # So với bộ đo tối thiểu (hai lần perf_counter) trên cùng máy, lấy min nhiều lần đo để bỏ
+    # nhiễu do máy bận. Thường khoảng 2 lần; chỉ bắt hồi quy nghiêm trọng (khóa, I/O trong đường đo)
+    assert best_of(lambda: stages.time("search")) < 10 * best_of(bare_timer)
+
+
+def test_metrics_endpoint_reports_retrieval_stages(api):
+    client, _, upload_index = api
+    upload_index("u-metrics", ["tài liệu về đo đạc"])
+    assert client.post("/api/v1/retrieve", data={"query_text": "đo đạc", "uid": "u-metrics"}).status_code == 200
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    for stage in ("prelude", "deserialize", "embed_query", "search", "llm"):
+        assert f'simplrag_stage_seconds_count{{stage="{stage}"}}' in response.text
+    assert 'route="/api/v1/retrieve",status="200"' in response.text
+    assert "simplrag_vectorstore_cache_entries 1" in response.text
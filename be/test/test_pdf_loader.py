@@ -0,0 +1,82 @@
+import time
+
+from fpdf import FPDF
+
+from src.rag import pdf_extract
+from src.rag.preprocess import PDFLoader
+
+
+def make_pdf(n_pages):
+    pdf = FPDF('P', 'mm', 'A4')
+    pdf.set_font('Arial', '', 12)
+    for i in range(n_pages):
+        pdf.add_page()
+        pdf.multi_cell(0, 5, f"Trang so {i}. Noi dung kiem thu cho trang {i}.")
+    return pdf.output(dest='S').encode('latin-1')
+
+
+def _hang_on_page_one(page_number):
+    if page_number == 1:
+        time.sleep(60)
+    return pdf_extract._reader.pages[page_number].extract_text()
+
+
+def test_parallel_extraction_matches_serial():
+    content = make_pdf(6)
+
+    serial = PDFLoader(content, parallel=False)
+    parallel = PDFLoader(content, parallel=True)
+
+    assert [d.page_content for d in parallel] == [d.page_content for d in serial]
+    assert [d.metadata["page"] for d in parallel] == list(range(6))
+    assert "Trang so 4" in parallel[4].page_content
+
+
+def test_small_pdfs_stay_serial(monkeypatch):
+    class PoolUsed(Exception):
+        pass
+
+    def fail(*args, **kwargs):
+        raise PoolUsed("không được tạo pool cho PDF nhỏ")
+
+    monkeypatch.setattr(pdf_extract, "_iter_pool_pages", fail)
+    assert len(pdf_extract.extract_pages(make_pdf(2), min_pages=10, workers=4)) == 2
+
+
+def test_page_timeout_skips_only_the_stuck_page(monkeypatch):
+    monkeypatch.setattr(pdf_extract, "_extract_page", _hang_on_page_one)
+
+    start = time.perf_counter()
+    texts = pdf_extract.extract_pages(make_pdf(4), parallel=True, workers=2, page_timeout=1)
+
+    assert time.perf_counter() - start < 10
+    assert texts[1] == ""
+    assert "Trang so 3" in texts[3]
+
+
+def _extract_in_daemon(content, results):
+    used_pool = []
+    iter_pool_pages = pdf_extract._iter_pool_pages
+
+    def recording(*args, **kwargs):
+        used_pool.append(True)
+        return iter_pool_pages(*args, **kwargs)
+
+    pdf_extract._iter_pool_pages = recording
+    texts = pdf_extract.extract_pages(content, parallel=True, workers=2)
+    results.put((bool(used_pool), texts))
+
+
+def test_parallel_extraction_runs_inside_daemonic_worker():
+    import billiard
+
+    # Giống tiến trình con của worker Celery prefork
+    content = make_pdf(4)
+    results = billiard.Queue()
+    process = billiard.Process(target=_extract_in_daemon, args=(content, results), daemon=True)
+    process.start()
+    used_pool, texts = results.get(timeout=30)
+    process.join(timeout=10)
+
+    assert used_pool
+    assert texts == pdf_extract.extract_pages(content, parallel=False)
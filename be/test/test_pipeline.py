@@ -0,0 +1,82 @@
+import threading
+import time
+
+import fakeredis
+import numpy as np
+import pytest
+
+from src.rag.pipeline import IngestProgress, ProgressReporter, ingest_pages
+from src.rag.preprocess import SplittingDocuments
+
+
+class RecordingEmbeddings:
+    def __init__(self, delay=0.0, fail_on=None):
+        self.delay = delay
+        self.fail_on = fail_on
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def embed_documents(self, texts):
+        with self._lock:
+            self.calls += 1
+        if self.fail_on and any(self.fail_on in t for t in texts):
+            raise RuntimeError("embedding failed")
+        time.sleep(self.delay)
+        return [[float(len(t)), 1.0] for t in texts]
+
+
+def test_pipeline_keeps_page_order_and_metadata():
+    pages = [f"trang {i} " * 300 for i in range(5)]
+    reports = []
+
+    index = ingest_pages(
+        iter(pages), SplittingDocuments, RecordingEmbeddings(delay=0.01),
+        pages_total=5, on_progress=lambda p: reports.append((p.pages_extracted, p.chunks_embedded)),
+        batch_size=3, max_in_flight=2,
+    )
+
+    assert len(index) > 5
+    page_numbers = [m["page"] for m in index.metadatas]
+    assert page_numbers == sorted(page_numbers) and set(page_numbers) == set(range(5))
+    assert np.array_equal(index.embeddings[:, 0], [len(t) for t in index.texts])
+    assert reports[-1] == (5, len(index))
+
+
+def test_producer_is_throttled_by_bounded_queue():
+    extracted = []
+
+    def pages():
+        for i in range(50):
+            extracted.append(i)
+            yield f"trang {i}"
+
+    progress_seen = []
+
+    def on_progress(p: IngestProgress):
+        progress_seen.append(p.pages_extracted - p.chunks_embedded)
+
+    ingest_pages(
+        pages(), SplittingDocuments, RecordingEmbeddings(delay=0.02),
+        on_progress=on_progress, batch_size=1, max_in_flight=1, queue_size=2,
+    )
+
+    assert len(extracted) == 50
+    # Producer không bao giờ chạy trước quá (hàng đợi + lô đang embed + lô đang chờ đẩy vào)
+    assert max(progress_seen) <= 2 + 1 + 2
+
+
+def test_embedding_errors_propagate():
+    pages = ["ok", "boom", "ok"]
+    with pytest.raises(RuntimeError):
+        ingest_pages(iter(pages), SplittingDocuments, RecordingEmbeddings(fail_on="boom"), batch_size=1)
+
+
+def test_progress_reporter_writes_status():
+    redis_client = fakeredis.FakeRedis(decode_responses=True)
+    reporter = ProgressReporter(redis_client, "u1", ttl=60, interval=0)
+
+    reporter(IngestProgress(pages_total=10, pages_extracted=4, chunks_split=8, chunks_embedded=3))
+
+    status = redis_client.get("user:u1:status")
+    assert status.startswith("processing") and "4/10 pages" in status
+    assert redis_client.ttl("user:u1:status") > 0
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from src.rag.index_format import VectorIndex, deserialize_index, serialize_index
+from src.rag.quantize import dequantize_index, quantize_index, quantize_rows
+from src.rag.search import VectorSearchEngine, normalize_rows
+
+
+def make_index(n=500, dim=64, seed=0):
+    rng = np.random.default_rng(seed)
+    return VectorIndex(normalize_rows(rng.standard_normal((n, dim))), [f"chunk {i}" for i in range(n)])
+
+
+@pytest.mark.parametrize("method, dtype, ratio", [("float16", np.float16, 2), ("int8", np.int8, 3.5)])
+def test_quantized_index_is_smaller_and_roundtrips(method, dtype, ratio):
+    index = make_index()
+    full_bytes = index.embeddings.nbytes
+    original = index.embeddings.copy()
+
+    quantize_index(index, method)
+    loaded = deserialize_index(serialize_index(index))
+
+    assert loaded.embeddings.dtype == dtype
+    assert full_bytes / (loaded.embeddings.nbytes + sum(a.nbytes for a in loaded.extras.values())) >= ratio
+    restored = dequantize_index(loaded).embeddings
+    assert restored.dtype == np.float32
+    assert np.abs(restored - original).max() < 0.01
+
+
+def test_int8_quantization_is_stable_when_requantized():
+    matrix = make_index().embeddings
+    first, scales = quantize_rows(matrix, "int8")
+    again, _ = quantize_rows(first.astype(np.float32) * scales[:, None], "int8")
+    assert np.array_equal(first, again)
+
+
+@pytest.mark.parametrize("method", ["float16", "int8"])
+def test_quantized_search_keeps_recall(method):
+    queries = normalize_rows(np.random.default_rng(1).standard_normal((50, 64)))
+    exact = VectorSearchEngine(make_index())
+    engine = VectorSearchEngine(deserialize_index(serialize_index(quantize_index(make_index(), method))))
+    assert engine.nbytes() < exact.nbytes()
+
+    hits = 0
+    for q in queries:
+        truth = {i for i, _ in exact.search_by_vector(q, k=10)}
+        found = engine.search_by_vector(q, k=10)
+        hits += len(truth & {i for i, _ in found})
+        assert found == sorted(found, key=lambda hit: -hit[1])
+    assert hits / (10 * len(queries)) >= 0.95
+
+    batched = engine.search_by_vectors(queries[:3], k=5)
+    assert [i for i, _ in batched[0]][:3] == [i for i, _ in engine.search_by_vector(queries[0], k=3)]
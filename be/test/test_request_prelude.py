@@ -0,0 +1,79 @@
+import asyncio
+
+import fakeredis
+
+from src.request_prelude import _prelude_script, run_prelude
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_token_bucket_limits_and_refills():
+    redis_client = fakeredis.aioredis.FakeRedis()
+
+    async def main():
+        first = await run_prelude(redis_client, "u1", "doc", ttl=60, check_status=False, now=100.0)
+        second = await run_prelude(redis_client, "u1", "doc", ttl=60, check_status=False, now=101.0)
+        third = await run_prelude(redis_client, "u1", "doc", ttl=60, check_status=False, now=103.5)
+        return first, second, third
+
+    first, second, third = run(main())
+    assert first.outcome == "ok"
+    assert second.outcome == "limited" and abs(second.retry_after - 2.0) < 1e-6
+    assert third.outcome == "ok"
+
+
+def test_status_checks_and_ttl_refresh():
+    server = fakeredis.FakeServer()
+    redis_client = fakeredis.aioredis.FakeRedis(server=server)
+    sync_redis = fakeredis.FakeRedis(server=server)
+
+    async def prelude(now, **kwargs):
+        return await run_prelude(redis_client, "u1", "retrieve", ttl=1800, now=now, **kwargs)
+
+    assert run(prelude(0.0)).outcome == "missing"
+
+    sync_redis.set("user:u1:status", "processing: 1/2 pages extracted", ex=10)
+    result = run(prelude(10.0))
+    assert result.outcome == "not_ready" and result.status.startswith("processing")
+
+    sync_redis.set("user:u1:status", "ready", ex=10)
+    sync_redis.set("user:u1:generation", "7", ex=10)
+    sync_redis.set("user:u1:vectorstore", b"\x00payload\xff", ex=10)
+    result = run(prelude(20.0, fetch_payload=True))
+    assert (result.outcome, result.generation, result.payload) == ("ok", "7", b"\x00payload\xff")
+    assert sync_redis.ttl("user:u1:vectorstore") > 1000
+
+    # Cache cục bộ đã có đúng generation: không tải lại payload
+    result = run(prelude(30.0, fetch_payload=True, cached_generation="7"))
+    assert result.outcome == "ok" and result.payload is None
+
+
+def test_concurrent_requests_get_a_single_token():
+    redis_client = fakeredis.aioredis.FakeRedis()
+
+    async def main():
+        return await asyncio.gather(
+            *(run_prelude(redis_client, "u1", "doc", ttl=60, check_status=False, now=5.0) for _ in range(5))
+        )
+
+    outcomes = [r.outcome for r in run(main())]
+    assert outcomes.count("ok") == 1 and outcomes.count("limited") == 4
+
+
+def test_retrieve_endpoint_uses_prelude(api):
+    client, _, upload_index = api
+    upload_index("u-pre", ["Alpha beta.", "Gamma delta."])
+
+    first = client.post("/api/v1/retrieve/mock", data={"query_text": "alpha", "uid": "u-pre"})
+    second = client.post("/api/v1/retrieve/mock", data={"query_text": "alpha", "uid": "u-pre"})
+
+    assert first.status_code == 200, first.text
+    assert second.status_code == 429
+    assert second.headers["Retry-After"] == "3"
+
+
+def test_script_is_registered_once_per_client():
+    client = fakeredis.aioredis.FakeRedis()
+    assert _prelude_script(client) is _prelude_script(client)
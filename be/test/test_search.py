@@ -0,0 +1,84 @@
+import numpy as np
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from src.rag.index_format import VectorIndex
+from src.rag.search import NumpyRetriever, VectorSearchEngine, normalize_rows, top_k
+
+
+def make_engine(n=200, dim=16, seed=0):
+    rng = np.random.default_rng(seed)
+    matrix = rng.standard_normal((n, dim)).astype(np.float32)
+    index = VectorIndex(
+        embeddings=matrix,
+        texts=[f"chunk {i}" for i in range(n)],
+        metadatas=[{"page": i % 5} for i in range(n)],
+    )
+    return VectorSearchEngine(index), matrix
+
+
+def brute_force(matrix, query, k):
+    normed = matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+    scores = normed @ (query / np.linalg.norm(query))
+    return list(np.argsort(-scores)[:k])
+
+
+def test_top_k_matches_full_sort():
+    scores = np.random.default_rng(1).random(1000)
+    assert list(top_k(scores, 10)) == list(np.argsort(-scores)[:10])
+    assert len(top_k(scores, 5000)) == 1000
+
+
+def test_search_matches_brute_force():
+    engine, matrix = make_engine()
+    query = np.random.default_rng(2).standard_normal(matrix.shape[1])
+
+    results = engine.search_by_vector(query, k=7)
+
+    assert [i for i, _ in results] == brute_force(matrix, query, 7)
+    scores = [s for _, s in results]
+    assert scores == sorted(scores, reverse=True)
+
+
+def test_normalized_matrix_is_not_copied():
+    matrix = normalize_rows(np.random.default_rng(3).standard_normal((10, 4)))
+    engine = VectorSearchEngine(VectorIndex(matrix, [str(i) for i in range(10)]))
+    assert engine.matrix is engine.index.embeddings
+
+
+def test_score_threshold_and_metadata_filter():
+    engine, matrix = make_engine()
+    query = matrix[3]
+
+    results = engine.search_by_vector(query, k=10, score_threshold=0.99)
+    assert [i for i, _ in results] == [3]
+
+    filtered = engine.search_by_vector(query, k=10, filter={"page": [1, 2]})
+    assert len(filtered) == 10
+    assert all(engine.index.metadatas[i]["page"] in (1, 2) for i, _ in filtered)
+
+    by_callable = engine.search_by_vector(query, k=3, filter=lambda doc: doc.metadata["page"] == 3)
+    assert [i for i, _ in by_callable][0] == 3
+
+
+def test_retriever_in_chain():
+    embeddings = DeterministicFakeEmbedding(size=16)
+    texts = ["mèo", "chó", "cá"]
+    index = VectorIndex(np.asarray(embeddings.embed_documents(texts)), texts)
+    retriever = NumpyRetriever(engine=VectorSearchEngine(index), embeddings=embeddings, k=2)
+
+    docs = retriever.invoke("chó")
+
+    assert docs[0].page_content == "chó"
+    assert len(docs) == 2
+
+
+def test_batch_search_matches_single_queries():
+    engine, matrix = make_engine()
+    queries = np.random.default_rng(3).standard_normal((6, 16)).astype(np.float32)
+
+    batched = engine.search_by_vectors(queries, k=5, filter={"page": [1, 2]})
+
+    for query, hits in zip(queries, batched):
+        single = engine.search_by_vector(query, k=5, filter={"page": [1, 2]})
+        assert [i for i, _ in hits] == [i for i, _ in single]
+        assert np.allclose([s for _, s in hits], [s for _, s in single], atol=1e-5)
@@ -0,0 +1,66 @@
+import json
+
+from src.rag.preprocess import MOCK_LLM_ANSWER
+
+
+def parse_sse(body: str):
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def test_stream_sends_sources_first_then_tokens(api):
+    client, _, upload_index = api
+    upload_index("u1", ["Hà Nội là thủ đô", "Phở là món ăn", "Sông Hồng"])
+
+    response = client.post("/api/v1/retrieve/stream", data={"query_text": "Phở là món ăn", "uid": "u1"})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = parse_sse(response.text)
+    assert events[0][0] == "sources"
+    assert events[0][1][0]["page_content"] == "Phở là món ăn"
+    assert "".join(data for kind, data in events if kind == "token") == MOCK_LLM_ANSWER
+    assert events[-1][0] == "done"
+
+
+def test_stream_checks_session_before_streaming(api):
+    client, _, _ = api
+    response = client.post("/api/v1/retrieve/stream", data={"query_text": "x", "uid": "missing"})
+    assert response.status_code == 404
+
+
+def test_llm_limiter_bounds_concurrency():
+    import asyncio
+
+    from src.rag.concurrency import ConcurrencyLimiter
+
+    limiter = ConcurrencyLimiter(2)
+    peak = 0
+
+    async def call():
+        nonlocal peak
+        async with limiter:
+            peak = max(peak, limiter.in_flight)
+            await asyncio.sleep(0.01)
+
+    async def main():
+        await asyncio.gather(*(call() for _ in range(6)))
+
+    asyncio.run(main())
+    asyncio.run(main())  # dùng lại limiter trên một event loop khác
+    assert peak == 2
+    assert limiter.in_flight == 0 and limiter.waiting == 0
+
+
+def test_retrieve_uses_shared_chain(api):
+    from src.rag import preprocess
+
+    client, _, upload_index = api
+    upload_index("u-chain", ["Alpha beta gamma.", "Delta epsilon."])
+    response = client.post("/api/v1/retrieve", data={"query_text": "alpha", "uid": "u-chain"})
+    assert response.status_code == 200, response.text
+    assert response.json()["message"] == preprocess.MOCK_LLM_ANSWER
+    assert preprocess.GetAnswerChain.cache_info().currsize == 1
@@ -0,0 +1,70 @@
+import asyncio
+import threading
+
+import fakeredis
+
+from src.task_events import TaskEventHub, TaskEventPublisher, task_event_stream
+from test.test_cache_events import wait_for
+from test.test_stream import parse_sse
+
+
+def test_stream_sends_current_state_then_live_events_until_terminal():
+    server = fakeredis.FakeServer()
+    worker_redis = fakeredis.FakeRedis(server=server)
+    publisher = TaskEventPublisher(worker_redis, "t1", "u1", "d1")
+    publisher.publish("STARTED")
+
+    async def main():
+        redis_client = fakeredis.aioredis.FakeRedis(server=server, decode_responses=True)
+        hub = TaskEventHub(redis_client)
+        hub.start()
+        await asyncio.wait_for(hub.subscribed.wait(), 2)
+        by_task = task_event_stream(hub, redis_client, task_id="t1", keepalive=0.05)
+        by_user = task_event_stream(hub, redis_client, uid="u1", keepalive=0.05)
+        received = [await anext(by_task), await anext(by_user)]
+        assert hub.watchers == 2
+
+        publisher.publish("PROGRESS", {"pages_extracted": 1})
+        # Sự kiện cũ hơn trạng thái đã gửi bị bỏ qua
+        hub.dispatch({"task_id": "t1", "uid": "u1", "seq": 1, "state": "PROGRESS"})
+        publisher.publish("SUCCESS", {"status": "success"})
+        received += [event async for event in by_task]
+        assert await anext(by_user) is not None and (await anext(by_user))["state"] == "SUCCESS"
+        assert await anext(by_user) is None  # keepalive
+        await by_user.aclose()
+        await hub.stop()
+        return received, hub.stats()
+
+    received, stats = asyncio.run(main())
+    assert [e["state"] for e in received] == ["STARTED", "STARTED", "PROGRESS", "SUCCESS"]
+    assert received[-1]["status"] == "Completed" and received[-1]["doc_id"] == "d1"
+    assert stats["watchers"] == 0 and stats["events"] == 2
+
+
+def test_task_status_and_streams_use_pushed_events(api):
+    from src import main
+
+    client, redis_client, _ = api
+    publisher = TaskEventPublisher(redis_client, "t-sse", "u-sse")
+    publisher.publish("STARTED")
+    assert client.get("/api/v1/task_status", params={"task_id": "t-sse"}).json() == {
+        "task_id": "t-sse", "status": "Processing", "result": None,
+    }
+
+    def worker():
+        assert wait_for(lambda: main.task_event_hub.watchers == 1)
+        publisher.publish("PROGRESS", {"pages_extracted": 3, "pages_total": 4})
+        publisher.publish("SUCCESS", {"status": "success", "chunks": 7})
+
+    assert wait_for(lambda: main.task_event_hub.subscribed.is_set())
+    thread = threading.Thread(target=worker)
+    thread.start()
+    response = client.get("/api/v1/task_events", params={"task_id": "t-sse"})
+    thread.join()
+    events = [data for kind, data in parse_sse(response.text) if kind == "task"]
+    assert [e["state"] for e in events] == ["STARTED", "PROGRESS", "SUCCESS"]
+    assert events[-1]["result"]["chunks"] == 7
+
+    with client.websocket_connect("/api/v1/ws/task_events?task_id=t-sse") as ws:
+        assert ws.receive_json()["state"] == "SUCCESS"
+    assert client.get("/api/v1/task_events").status_code == 400